@@ -0,0 +1,279 @@
+# encoding=utf8
+
+""" The analyzer benchmark
+    Author: lipixun
+    Created Time : 日  2/13 02:36:18 2017
+
+    File Name: analyzers.py
+    Description:
+
+        Generate the synthetic workbooks (see corpus.py) of several scales, then time and memory-profile each analyzer
+        entry point on them: getKeywords, cooccurrence, cooccurrenceEntity, prepare-idf (IDFBuilder), the entity trie
+        tree build and the entity trie tree search. The report is written as json (with the git commit), so the reports
+        of different commits could be compared.
+
+        Each benchmark runs in a forked process of the loaded workbook and the prepared analyzer, the peak rss is got by
+        wait4 of the process, and the rss growth is the peak minus the rss at the fork. The corpus idf is used, so no
+        idf file is required. The default encoding is set to utf8 the same as the cli (__main__.py).
+
+        Run by:
+
+            python benchmarks/analyzers.py -s 100 -s 1000 -o report.json
+
+"""
+
+import os
+import sys
+reload(sys)
+sys.setdefaultencoding("utf8")
+
+import json
+import time
+import shutil
+import resource
+import platform
+import tempfile
+import subprocess
+
+from os.path import abspath, dirname, join
+from argparse import ArgumentParser
+
+RootPath = abspath(join(dirname(__file__), ".."))
+
+sys.path.insert(0, RootPath)
+
+from corpus import SyntheticCorpus
+
+from newsanalyzer.spec import IDFModeCorpus
+from newsanalyzer.model import NamedKeyword
+from newsanalyzer.tokenizer import Tokenizers, NLTKTokenizer, getTokenizer
+
+# The benchmark names and methods of AnalyzerBenchmark (in the running order)
+Benchmarks = [
+    ("load", "runLoad"),
+    ("keyword", "runKeyword"),
+    ("cooccurrence", "runCooccurrence"),
+    ("cooccurrence-entity", "runCooccurrenceEntity"),
+    ("prepare-idf", "runPrepareIDF"),
+    ("trie-build", "runTrieBuild"),
+    ("trie-search", "runTrieSearch"),
+    ]
+
+def getArguments():
+    """Get arguments
+    """
+    parser = ArgumentParser(description = "The analyzer benchmark")
+    parser.add_argument("-s", "--scale", dest = "scales", type = int, action = "append", help = "The number of articles, could be specified multiple times")
+    parser.add_argument("-l", "--length", dest = "length", type = int, default = 200, help = "The mean number of words of the article content")
+    parser.add_argument("-g", "--gazetteer", dest = "gazetteer", type = int, default = 100, help = "The number of the countries (and the provinces, cities)")
+    parser.add_argument("-k", "--keywords", dest = "keywords", type = int, default = 10, help = "The number of the co-occurrence keywords")
+    parser.add_argument("-n", "--ngram", dest = "nGram", type = int, default = 3, help = "The nGram")
+    parser.add_argument("-w", "--workers", dest = "workers", type = int, default = 1, help = "The number of the worker processes")
+    parser.add_argument("-t", "--tokenizer", dest = "tokenizer", choices = sorted(Tokenizers), default = NLTKTokenizer.name, help = "The tokenizer")
+    parser.add_argument("-b", "--benchmark", dest = "benchmarks", choices = [ x[0] for x in Benchmarks ], action = "append", help = "The benchmark to run (all if not specified), could be specified multiple times")
+    parser.add_argument("-r", "--repeat", dest = "repeat", type = int, default = 1, help = "The number of runs of each benchmark (the min time is reported)")
+    parser.add_argument("-o", "--output", dest = "output", help = "The output json filename (stdout if not specified)")
+    parser.add_argument("--seed", dest = "seed", type = int, default = 1, help = "The random seed")
+    return parser.parse_args()
+
+def getCommit():
+    """Get the git commit of the tree (None if not a git repository)
+    """
+    try:
+        with open(os.devnull, "wb") as null:
+            commit = subprocess.check_output([ "git", "-C", RootPath, "rev-parse", "HEAD" ], stderr = null).strip()
+            dirty = bool(subprocess.check_output([ "git", "-C", RootPath, "status", "--porcelain", "--untracked-files=no" ], stderr = null).strip())
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def getRSS():
+    """Get the current rss in kilobytes (None if /proc is not available)
+    """
+    try:
+        with open("/proc/self/statm", "rb") as fd:
+            return int(fd.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (IOError, OSError, ValueError):
+        return None
+
+def measure(function):
+    """Run the function in a forked process and measure it
+    Returns:
+        dict: The seconds, cpu seconds (of the process), peak rss and rss growth of the process and the peak rss of the
+            worker processes (in kilobytes), and the result of the function (json)
+    """
+    readFd, writeFd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # The child
+        os.close(readFd)
+        code = 0
+        try:
+            rss = getRSS()
+            start, cpuStart = time.time(), time.clock()
+            result = function()
+            report = { "seconds": time.time() - start, "cpuSeconds": time.clock() - cpuStart, "startRSS": rss }
+            if result is not None:
+                report["result"] = result
+            # The worker processes (if any) are reaped by the process
+            workersRSS = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            if workersRSS:
+                report["workersPeakRSS"] = workersRSS
+        except Exception as error:
+            report, code = { "error": repr(error) }, 1
+        with os.fdopen(writeFd, "wb") as fd:
+            json.dump(report, fd)
+        os._exit(code)
+    # The parent
+    os.close(writeFd)
+    with os.fdopen(readFd, "rb") as fd:
+        data = fd.read()
+    _, _, usage = os.wait4(pid, 0)
+    report = json.loads(data) if data else { "error": "No report" }
+    # ru_maxrss is in kilobytes on linux
+    report["peakRSS"] = usage.ru_maxrss
+    if report.get("startRSS") is not None:
+        report["rssGrowth"] = max(usage.ru_maxrss - report["startRSS"], 0)
+    return report
+
+class AnalyzerBenchmark(object):
+    """The analyzer benchmark of a workbook
+    """
+    def __init__(self, filename, keywords, args):
+        """Create a new AnalyzerBenchmark
+        """
+        self.filename = filename
+        self.args = args
+        self.keywords = [ NamedKeyword(x, [ x ]) for x in keywords ]
+        self.path = tempfile.mkdtemp(prefix = "newsanalyzer-benchmark-")
+        self.excelInput, self.newsList = self.load()
+        self.analyzer = self.createAnalyzer()
+        self.stopwords = self.analyzer.loadStopwordSet()
+
+    def close(self):
+        """Close the benchmark
+        """
+        shutil.rmtree(self.path, ignore_errors = True)
+
+    def getOutput(self, name):
+        """Get an output filename
+        """
+        return join(self.path, name)
+
+    def load(self):
+        """Load the workbook and the news
+        """
+        from newsanalyzer.excelio import ExcelInput
+        excelInput = ExcelInput(self.filename)
+        return excelInput, list(excelInput.iterNews())
+
+    def createAnalyzer(self):
+        """Create the prepared analyzer
+        """
+        from newsanalyzer.analyzer import NewsAnalyzer
+        analyzer = NewsAnalyzer(self.excelInput.countries, self.excelInput.regions, self.excelInput.provinces, self.excelInput.cities, tokenizer = getTokenizer(self.args.tokenizer))
+        analyzer.prepare()
+        analyzer.idfMode = IDFModeCorpus
+        return analyzer
+
+    def runLoad(self):
+        """Load the workbook
+        """
+        _, newsList = self.load()
+        return { "news": len(newsList) }
+
+    def runKeyword(self):
+        """Run getKeywords
+        """
+        self.analyzer.getKeywords(self.args.nGram, self.newsList, self.getOutput("title.csv"), self.getOutput("content.csv"), self.args.workers)
+
+    def runCooccurrence(self):
+        """Run cooccurrence
+        """
+        self.analyzer.cooccurrence(self.args.nGram, self.newsList, self.keywords, self.getOutput("cooccurrence.csv"), self.args.workers)
+
+    def runCooccurrenceEntity(self):
+        """Run cooccurrenceEntity
+        """
+        self.analyzer.cooccurrenceEntity(self.newsList, self.keywords, self.getOutput("cooccurrence-entity.csv"), self.args.workers)
+
+    def runPrepareIDF(self):
+        """Build the idf of the news (a document per paragraph) the same as the prepare-idf command
+        """
+        from newsanalyzer.idfbuild import IDFBuilder
+        builder = IDFBuilder(self.getOutput("idfstate"), self.args.nGram)
+        documents = ( [ list(self.analyzer.tokenize(x, self.stopwords)) ] for news in self.newsList for x in news.content.split("\n") if x.strip() )
+        builder.addDocuments(documents, "benchmark", self.args.workers)
+        return { "documents": builder.documents, "terms": sum(1 for _ in builder.iterIDF()) }
+
+    def runTrieBuild(self):
+        """Build the entity trie tree
+        """
+        return { "nodes": len(self.analyzer.buildEntityTrieTree().freeze()) }
+
+    def runTrieSearch(self):
+        """Search the entity trie tree in the (tokenized) paragraphs, the tokenization is not measured
+        """
+        paragraphs = list(self.analyzer.iterTerms(self.newsList, self.stopwords, True))
+        start = time.time()
+        matches = 0
+        for terms in paragraphs:
+            for _ in self.analyzer.entityTree.search(terms):
+                matches += 1
+        return { "paragraphs": len(paragraphs), "matches": matches, "searchSeconds": time.time() - start }
+
+    def run(self, method, repeat = 1):
+        """Run the benchmark
+        Returns:
+            dict: The report of the fastest run
+        """
+        function = getattr(self, method)
+        reports = [ measure(function) for _ in xrange(repeat) ]
+        return min(reports, key = lambda x: x.get("seconds", float("inf")))
+
+def benchmark(args):
+    """Run the benchmark
+    """
+    report = {
+        "commit": getCommit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": { "length": args.length, "gazetteer": args.gazetteer, "keywords": args.keywords, "nGram": args.nGram, "workers": args.workers, "tokenizer": args.tokenizer, "seed": args.seed },
+        "scales": [],
+        }
+    path = tempfile.mkdtemp(prefix = "newsanalyzer-corpus-")
+    try:
+        for articles in args.scales or [ 100, 1000 ]:
+            corpus = SyntheticCorpus(articles, args.length, args.gazetteer, seed = args.seed)
+            filename = join(path, "news-%d.xlsx" % articles)
+            start = time.time()
+            corpus.write(filename)
+            sys.stderr.write("Generated [%d] articles in %.2fs\n" % (articles, time.time() - start))
+            bench = AnalyzerBenchmark(filename, corpus.getKeywords(args.keywords), args)
+            try:
+                results = {}
+                for name, method in Benchmarks:
+                    if args.benchmarks and not name in args.benchmarks:
+                        continue
+                    results[name] = bench.run(method, args.repeat)
+                    sys.stderr.write("[%d] %s: %s\n" % (articles, name, json.dumps(results[name], sort_keys = True)))
+            finally:
+                bench.close()
+            report["scales"].append({ "articles": articles, "names": len(corpus.names), "results": results })
+    finally:
+        shutil.rmtree(path, ignore_errors = True)
+    return report
+
+def main():
+    """The main entry
+    """
+    args = getArguments()
+    report = json.dumps(benchmark(args), indent = 4, sort_keys = True)
+    if args.output:
+        with open(args.output, "wb") as fd:
+            fd.write(report)
+    else:
+        print report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# encoding=utf8
+
+""" The exact versus approximate counting benchmark
+    Author: lipixun
+    Created Time : 日  2/12 22:48:27 2017
+
+    File Name: approximate.py
+    Description:
+
+        Count the n-grams of a synthetic zipfian corpus exactly (NGramCounter) and approximately (ApproximateCounter)
+        of several capacities, and report the time, the number of the counted entries, the recall of the top terms and
+        the errors of the counts as json.
+
+        Run by:
+
+            python benchmarks/approximate.py -d 20000 -c 1000 -c 10000
+
+"""
+
+import sys
+import json
+import time
+import random
+import bisect
+
+from os.path import abspath, dirname, join
+from argparse import ArgumentParser
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..")))
+
+from newsanalyzer.vocab import Vocabulary, NGramCodec
+from newsanalyzer.sketch import ApproximateCounter
+from newsanalyzer.counting import NGramCounter
+
+def getArguments():
+    """Get arguments
+    """
+    parser = ArgumentParser(description = "The exact versus approximate counting benchmark")
+    parser.add_argument("-d", "--documents", dest = "documents", type = int, default = 20000, help = "The number of documents")
+    parser.add_argument("-l", "--length", dest = "length", type = int, default = 200, help = "The mean number of terms of a document")
+    parser.add_argument("-v", "--vocabulary", dest = "vocabulary", type = int, default = 50000, help = "The vocabulary size")
+    parser.add_argument("-s", "--skew", dest = "skew", type = float, default = 1.1, help = "The zipfian skew")
+    parser.add_argument("-n", "--ngram", dest = "nGram", type = int, default = 3, help = "The nGram")
+    parser.add_argument("-c", "--capacity", dest = "capacities", type = int, action = "append", help = "The capacity, could be specified multiple times")
+    parser.add_argument("--count-min", dest = "countMin", type = int, nargs = 2, metavar = ("WIDTH", "DEPTH"), help = "Also count by the count-min sketches")
+    parser.add_argument("--top", dest = "top", type = int, default = 200, help = "The number of top terms of each n")
+    parser.add_argument("--seed", dest = "seed", type = int, default = 1, help = "The random seed")
+    return parser.parse_args()
+
+def generateDocuments(args):
+    """Generate the documents of zipfian term ids
+    """
+    rand = random.Random(args.seed)
+    weights, total = [], 0.0
+    for i in xrange(args.vocabulary):
+        total += 1.0 / (i + 1) ** args.skew
+        weights.append(total)
+    documents = []
+    for _ in xrange(args.documents):
+        length = rand.randint(args.length // 2, args.length * 3 // 2)
+        documents.append([ bisect.bisect(weights, rand.random() * total) for _ in xrange(length) ])
+    return documents
+
+def getTop(counts, top):
+    """Get the top keys of the key to count
+    """
+    return set(x[0] for x in sorted(counts.iteritems(), key = lambda (k, v): (-v, k))[: top])
+
+def benchmark(args):
+    """Run the benchmark
+    """
+    documents = generateDocuments(args)
+    vocabulary = Vocabulary()
+    for i in xrange(args.vocabulary):
+        vocabulary.add(str(i))
+    codec = NGramCodec(vocabulary)
+    # Exact
+    start = time.time()
+    counter = NGramCounter(args.nGram)
+    for ids in documents:
+        counter.add(ids)
+    exact = counter.getCounter()
+    report = { "documents": args.documents, "terms": sum(len(x) for x in documents), "exact": { "seconds": time.time() - start, "entries": len(exact) }, "approximate": [] }
+    exactByN = {}
+    for key, count in exact.iteritems():
+        exactByN.setdefault(codec.getLength(key), {})[key] = count
+    # Approximate
+    for capacity in args.capacities or [ 1000, 10000 ]:
+        start = time.time()
+        counter = ApproximateCounter(args.nGram, capacity, tuple(args.countMin) if args.countMin else None)
+        for ids in documents:
+            counter.add(ids)
+        seconds = time.time() - start
+        result = { "capacity": capacity, "seconds": seconds, "entries": sum(len(x) for x in counter.sketches.itervalues()), "ngrams": {} }
+        for n in counter.getNs():
+            items = counter.getItems(n)
+            counts = { key: count for key, count, _ in items }
+            exactTop, approximateTop = getTop(exactByN[n], args.top), getTop(counts, args.top)
+            errors = [ float(count - exactByN[n][key]) / exactByN[n][key] for key, count, _ in items if key in approximateTop ]
+            result["ngrams"][n] = {
+                "recall": float(len(exactTop & approximateTop)) / len(exactTop),
+                "maxRelativeError": max(errors),
+                "meanRelativeError": sum(errors) / len(errors),
+                "maxErrorBound": max(error for key, _, error in items if key in approximateTop),
+                }
+        report["approximate"].append(result)
+    return report
+
+def main():
+    """The main entry
+    """
+    print json.dumps(benchmark(getArguments()), indent = 4, sort_keys = True)
+
+if __name__ == "__main__":
+    main()
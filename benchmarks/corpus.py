@@ -0,0 +1,185 @@
+# encoding=utf8
+
+""" The synthetic news corpus generator
+    Author: lipixun
+    Created Time : 日  2/13 02:10:36 2017
+
+    File Name: corpus.py
+    Description:
+
+        Generate a synthetic workbook in the layout ExcelInput expects: the country, region, province and city sheets of
+        the gazetteer and the news sheet (two header rows, the title and content in column F and G). The terms of the
+        news are drawn from a zipfian vocabulary mixed with the gazetteer names, so the analyzers find the entities.
+
+        The words are built from syllables by a bijective index encoding, so the names never share a word with each
+        other or with the vocabulary (the same word in two names confuses the entity trie tree).
+
+        Run by:
+
+            python benchmarks/corpus.py -a 1000 -g 200 news.xlsx
+
+"""
+
+import sys
+import random
+import bisect
+
+from os.path import abspath, dirname, join
+from argparse import ArgumentParser
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..")))
+
+from newsanalyzer.spec import SheetCountry, SheetRegion, SheetProvince, SheetCity, SheetNews, NewsColumnTitle, NewsColumnContent
+
+Consonants  = "bdfgklmnprstvz"
+Vowels      = "aeiou"
+Syllables   = [ a + b + c for a in Consonants for b in Vowels for c in Consonants ]
+
+# The word index offset of the vocabulary (the names use the indexes below it)
+VocabularyOffset = 10 ** 6
+
+def makeWord(index):
+    """Make the word of the index (at least 2 syllables to keep off the stop words)
+    """
+    syllables = []
+    while True:
+        index, remainder = divmod(index, len(Syllables))
+        syllables.append(Syllables[remainder])
+        if index == 0 and len(syllables) >= 2:
+            break
+    return "".join(syllables)
+
+class SyntheticCorpus(object):
+    """The synthetic corpus
+    """
+    def __init__(self, articles = 1000, length = 200, gazetteer = 100, vocabulary = 20000, skew = 1.1, entityRate = 0.05, seed = 1):
+        """Create a new SyntheticCorpus
+        Args:
+            articles(int): The number of articles
+            length(int): The mean number of words of the article content
+            gazetteer(int): The number of the countries (and the provinces, cities)
+            vocabulary(int): The vocabulary size
+            skew(float): The zipfian skew of the vocabulary
+            entityRate(float): The probability of a word to be a gazetteer name
+            seed(int): The random seed
+        """
+        self.articles = articles
+        self.length = length
+        self.vocabulary = vocabulary
+        self.entityRate = entityRate
+        self.rand = random.Random(seed)
+        # The names
+        self.nextWord = 0
+        self.countries = [ self.makeNames() for _ in xrange(gazetteer) ]
+        self.regions = [ self.makeNames(1) for _ in xrange(max(gazetteer // 10, 1)) ]
+        self.provinces = [ self.makeNames() for _ in xrange(gazetteer) ]
+        self.cities = [ self.makeNames() for _ in xrange(gazetteer) ]
+        self.names = [ name for names in self.countries + self.regions + self.provinces + self.cities for name in names ]
+        # The zipfian cumulative weights
+        self.weights, self.total = [], 0.0
+        for i in xrange(vocabulary):
+            self.total += 1.0 / (i + 1) ** skew
+            self.weights.append(self.total)
+
+    def makeName(self):
+        """Make a name of 1 or 2 words
+        """
+        words = 2 if self.rand.random() < 0.25 else 1
+        self.nextWord += words
+        return " ".join(makeWord(self.nextWord - i) for i in xrange(words))
+
+    def makeNames(self, alias = None):
+        """Make the name and the alias names
+        """
+        if alias is None:
+            alias = self.rand.randint(0, 2)
+        return [ self.makeName() for _ in xrange(alias + 1) ]
+
+    def getWord(self):
+        """Get a random word (a gazetteer name or a vocabulary word)
+        """
+        if self.rand.random() < self.entityRate:
+            return self.rand.choice(self.names)
+        return makeWord(VocabularyOffset + bisect.bisect(self.weights, self.rand.random() * self.total))
+
+    def getText(self, length):
+        """Get a random text of about length words
+        """
+        return " ".join(self.getWord() for _ in xrange(self.rand.randint(length // 2, length * 3 // 2)))
+
+    def getKeywords(self, count):
+        """Get the keywords (the most frequent vocabulary words and a few names)
+        Returns:
+            [ str ]: The keywords
+        """
+        words = [ makeWord(VocabularyOffset + i) for i in xrange(count - count // 2) ]
+        return words + self.names[: count // 2]
+
+    def iterNews(self):
+        """Iterate the news
+        Yield:
+            (unicode, unicode): The title and content
+        """
+        for _ in xrange(self.articles):
+            title = self.getText(10)
+            paragraphs = self.rand.randint(1, 5)
+            content = "\n".join(self.getText(max(self.length // paragraphs, 2)) for _ in xrange(paragraphs))
+            yield title.title(), content.capitalize()
+
+    def write(self, filename):
+        """Write the workbook
+        """
+        from openpyxl import Workbook
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        sheet = workbook.create_sheet(SheetCountry)
+        for names in self.countries:
+            sheet.append([ x.title() for x in names ])
+        # The region names and alias in the first two rows, then the countries of the region in each column
+        sheet = workbook.create_sheet(SheetRegion)
+        sheet.append([ names[0].title() for names in self.regions ])
+        sheet.append([ names[1] for names in self.regions ])
+        columns = [ [] for _ in self.regions ]
+        for names in self.countries:
+            self.rand.choice(columns).append(names[0].title())
+        for i in xrange(max(len(x) for x in columns)):
+            sheet.append([ x[i] if i < len(x) else None for x in columns ])
+        sheet = workbook.create_sheet(SheetProvince)
+        for names in self.provinces:
+            sheet.append([ x.title() for x in names ])
+        sheet = workbook.create_sheet(SheetCity)
+        for names in self.cities:
+            sheet.append([ x.title() for x in names ])
+        # The news with two header rows
+        sheet = workbook.create_sheet(SheetNews)
+        header = [ None ] * NewsColumnContent
+        header[NewsColumnTitle - 1], header[NewsColumnContent - 1] = u"标题", u"正文"
+        sheet.append(header)
+        sheet.append([ None ] * NewsColumnContent)
+        for index, (title, content) in enumerate(self.iterNews()):
+            row = [ None ] * NewsColumnContent
+            row[0], row[1] = index + 1, "2017-%02d-%02d" % (index // 28 % 12 + 1, index % 28 + 1)
+            row[NewsColumnTitle - 1], row[NewsColumnContent - 1] = title, content
+            sheet.append(row)
+        workbook.save(filename)
+
+def getArguments():
+    """Get arguments
+    """
+    parser = ArgumentParser(description = "The synthetic news corpus generator")
+    parser.add_argument("-a", "--articles", dest = "articles", type = int, default = 1000, help = "The number of articles")
+    parser.add_argument("-l", "--length", dest = "length", type = int, default = 200, help = "The mean number of words of the article content")
+    parser.add_argument("-g", "--gazetteer", dest = "gazetteer", type = int, default = 100, help = "The number of the countries (and the provinces, cities)")
+    parser.add_argument("-v", "--vocabulary", dest = "vocabulary", type = int, default = 20000, help = "The vocabulary size")
+    parser.add_argument("--seed", dest = "seed", type = int, default = 1, help = "The random seed")
+    parser.add_argument("output", help = "The output workbook filename")
+    return parser.parse_args()
+
+def main():
+    """The main entry
+    """
+    args = getArguments()
+    SyntheticCorpus(args.articles, args.length, args.gazetteer, args.vocabulary, seed = args.seed).write(args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# encoding=utf8
+
+""" The startup time benchmark
+    Author: lipixun
+    Created Time : 日  2/13 00:48:52 2017
+
+    File Name: startup.py
+    Description:
+
+        Measure the startup time of `python -m newsanalyzer <subcommand> --help` of each subcommand, and check it's
+        within the budget and none of the heavy modules (nltk, openpyxl, numpy) is imported. The exit code is the
+        number of the violations, so it could be run as a regression check (see `make check-startup`).
+
+        The import time of each module is got by `python -X importtime` if the interpreter supports it (3.7+),
+        otherwise only the wall time and the imported heavy modules are reported.
+
+"""
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+from os.path import abspath, dirname, join
+from argparse import ArgumentParser
+
+RootPath = abspath(join(dirname(__file__), ".."))
+
+Subcommands = [
+    [],
+    [ "prepare-nltk" ],
+    [ "prepare-idf" ],
+    [ "convert-idf" ],
+    [ "check-tokenizer" ],
+    [ "keyword" ],
+    [ "cooccurrence" ],
+    [ "cooccurrence-entity" ],
+    [ "analyze-all" ],
+    [ "index" ],
+    [ "trend" ],
+    [ "serve" ],
+    ]
+
+HeavyModules = [ "nltk", "openpyxl", "numpy" ]
+
+# Run the cli with --help, then print the imported heavy modules (after the marker)
+ProbeMarker = "heavy-modules:"
+ProbeScript = """
+import sys, runpy
+sys.argv = [ "newsanalyzer" ] + %r + [ "--help" ]
+try:
+    runpy.run_module("newsanalyzer", run_name = "__main__", alter_sys = True)
+except SystemExit:
+    pass
+print("%s" + ",".join(x for x in %r if x in sys.modules))
+"""
+
+def getArguments():
+    """Get arguments
+    """
+    parser = ArgumentParser(description = "The startup time benchmark")
+    parser.add_argument("-p", "--python", dest = "python", default = sys.executable, help = "The python interpreter")
+    parser.add_argument("-r", "--repeat", dest = "repeat", type = int, default = 5, help = "The number of runs of each subcommand (the min time is reported)")
+    parser.add_argument("-b", "--budget", dest = "budget", type = float, default = 0.5, help = "The max startup seconds of each subcommand")
+    parser.add_argument("--top", dest = "top", type = int, default = 5, help = "The number of the slowest imports to report (by -X importtime)")
+    return parser.parse_args()
+
+def supportsImportTime(python):
+    """Check if the interpreter supports -X importtime
+    """
+    process = subprocess.Popen([ python, "-X", "importtime", "-c", "pass" ], stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    _, stderr = process.communicate()
+    return "import time:" in stderr.decode("utf8")
+
+def getSlowestImports(stderr, top):
+    """Get the slowest imports (by the cumulative time) of the -X importtime output
+    Returns:
+        [ (str, int) ]: The module and the cumulative microseconds
+    """
+    imports = []
+    for line in stderr.decode("utf8").splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"): ].split("|")
+        imports.append((module.strip(), int(cumulative)))
+    imports.sort(key = lambda x: -x[1])
+    return imports[: top]
+
+def measure(args, subcommand, importTime):
+    """Measure the startup of the subcommand
+    Returns:
+        dict: The result
+    """
+    env = dict(os.environ, PYTHONPATH = RootPath)
+    seconds, heavyModules, slowest = [], None, None
+    for _ in range(args.repeat):
+        command = [ args.python ] + ([ "-X", "importtime" ] if importTime else []) + [ "-c", ProbeScript % (subcommand, ProbeMarker, HeavyModules) ]
+        start = time.time()
+        process = subprocess.Popen(command, stdout = subprocess.PIPE, stderr = subprocess.PIPE, env = env, cwd = RootPath)
+        stdout, stderr = process.communicate()
+        seconds.append(time.time() - start)
+        if process.returncode:
+            raise RuntimeError("Failed to run [%s]: %s" % (" ".join(subcommand), stderr.decode("utf8")))
+        marker = stdout.decode("utf8").rsplit(ProbeMarker, 1)[-1]
+        heavyModules = [ x for x in marker.strip().split(",") if x ]
+        if importTime:
+            slowest = getSlowestImports(stderr, args.top)
+    result = { "subcommand": " ".join(subcommand) or "(none)", "seconds": min(seconds), "heavyModules": heavyModules }
+    if slowest is not None:
+        result["slowestImports"] = slowest
+    return result
+
+def main():
+    """The main entry
+    """
+    args = getArguments()
+    importTime = supportsImportTime(args.python)
+    results, violations = [], 0
+    for subcommand in Subcommands:
+        result = measure(args, subcommand, importTime)
+        result["violations"] = []
+        if result["seconds"] > args.budget:
+            result["violations"].append("startup %.3fs exceeds the budget %.3fs" % (result["seconds"], args.budget))
+        if result["heavyModules"]:
+            result["violations"].append("heavy modules imported: %s" % ", ".join(result["heavyModules"]))
+        violations += len(result["violations"])
+        results.append(result)
+    print(json.dumps({ "importTime": importTime, "budget": args.budget, "results": results, "violations": violations }, indent = 4, sort_keys = True))
+    return violations
+
+if __name__ == "__main__":
+    sys.exit(main())
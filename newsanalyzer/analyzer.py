@@ -9,36 +9,57 @@
 
 """
 
-import re
+import heapq
 import logging
 
+from os.path import isfile, getmtime
 from sets import Set
 from collections import Counter
 
-from .trie import TrieTree
-from .spec import IDFDictFilename, MissingValueIDF, DropWords, KeyCountry, KeyRegion, KeyProvince, KeyCity
-from .utils import nltk, json
-from .excelio import KeywordResultWriter, CooccurrenceResultWriter, CooccurrenceEntityResultWriter
-
-PunctuationRegex = re.compile(r"""^[\!\"\#\$\%\&\'\(\)\*\+\,\-\.\/\:\;\<\=\>\?\@\[\\\]\^\_\`\{\|\}\~]+$""")
+from .trie import TrieTree, searchAll
+from .vocab import Vocabulary, NGramCodec, IDBits
+from .counting import NGramCounter
+from .sketch import ApproximateCounter
+from .parallel import mapReduce
+from .idf import IDFTable, CorpusIDF, BlendedIDF, getKeyIDF, loadIDFDict
+from .spec import IDFDictFilename, IDFTableFilename, MissingValueIDF, KeyCountry, KeyRegion, KeyProvince, KeyCity, \
+    IDFModeStatic, IDFModeCorpus, IDFBlendWeight, OutputFormatCSV, ResultTopTerms, TrendSortTFIDF, TrendSortVelocity
+from .utils import nltk
+from .profiling import profiler
+from .tokenizer import NLTKTokenizer
+from .excelio import KeywordResultWriter, CooccurrenceResultWriter, CooccurrenceEntityResultWriter, TrendResultWriter
 
 class NewsAnalyzer(object):
     """The new analyzer
     """
     logger = logging.getLogger("newsanalyzer.NewsAnalyzer")
 
-    def __init__(self, countries = None, regions = None, provinces = None, cities = None, peoples = None):
+    def __init__(self, countries = None, regions = None, provinces = None, cities = None, peoples = None, entityTree = None, tokenizer = None):
         """Create a new NewsAnalyzer
         """
+        self.tokenizer = tokenizer or NLTKTokenizer()
+        self.vocabulary = Vocabulary()
+        self.codec = NGramCodec(self.vocabulary)
+        self.useNumPy = None    # Use numpy to count n-grams if installed
+        self.capacity = 0       # Count n-grams approximately by the top-k sketches of the capacity if greater than 0
+        self.countMin = None    # The (width, depth) of the count-min sketches to tighten the approximate counts
+        self.idfMode = IDFModeStatic        # The idf mode, see spec.IDFMode*
+        self.idfWeight = IDFBlendWeight     # The weight of the corpus idf when blending
+        self.outputFormat = OutputFormatCSV # The output format, see spec.OutputFormat*
+        self.top = ResultTopTerms           # The number of the top terms (entities) of each group to write, 0 to write all
         self.countries = countries or []
         self.regions = regions or []
         self.provinces = provinces or []
         self.cities = cities or []
         self.peoples = peoples or []
+        self.entityTree = entityTree
 
     def prepare(self):
-        """Prepare the data (by build the data relationship)
+        """Prepare the data (by build the data relationship and the entity trie tree)
         """
+        if self.entityTree:
+            # Already prepared (loaded from cache)
+            return
         # Build country names dict
         countries = {}
         for country in self.countries:
@@ -57,6 +78,24 @@ class NewsAnalyzer(object):
                     regionCountries.append(countries[country])
             # Use the standard country names
             region.countries = regionCountries
+        # Build the entity trie tree
+        with profiler.stage("trie-build") as stage:
+            self.entityTree = self.buildEntityTrieTree().freeze()
+            stage.sizes["nodes"] = len(self.entityTree)
+
+    def getGazetteer(self):
+        """Get the (prepared) gazetteer
+        Returns:
+            dict: The gazetteer which could be used as the keyword arguments to create a new NewsAnalyzer
+        """
+        return {
+            "countries": self.countries,
+            "regions": self.regions,
+            "provinces": self.provinces,
+            "cities": self.cities,
+            "peoples": self.peoples,
+            "entityTree": self.entityTree,
+            }
 
     def normalize(self, words):
         """Normalize the words
@@ -90,298 +129,709 @@ class NewsAnalyzer(object):
         # Done
         return tree
 
+    def loadIDF(self):
+        """Load the static idf if it's used by the idf mode
+        Returns:
+            dict: The idf dict, None if not used
+        """
+        if self.idfMode != IDFModeCorpus:
+            return self.loadIDFDict()
+
+    def getKeyIDF(self, static):
+        """Get the static idf of the n-gram keys (see idf.getKeyIDF)
+        Args:
+            static(dict): The static idf of the terms, None if not used
+        Returns:
+            dict: The idf of the keys, None if the static idf is not used
+        """
+        if static is not None:
+            return getKeyIDF(static, self.codec)
+
+    def getIDF(self, static, counter):
+        """Get the idf (of the n-gram keys) of the idf mode
+        Args:
+            static(dict): The static idf of the keys (see getKeyIDF)
+            counter(Counter): The document frequency of the analyzed news (see counting.NGramCounter)
+        Returns:
+            dict: The idf
+        """
+        if self.idfMode == IDFModeStatic:
+            return static
+        corpus = CorpusIDF(counter)
+        self.logger.info("Got corpus idf of [%d] terms in [%d] documents", len(corpus), corpus.documents)
+        if self.idfMode == IDFModeCorpus:
+            return corpus
+        return BlendedIDF(static, corpus, self.idfWeight)
+
     def loadIDFDict(self):
-        """Load idf dict
-        """
-        self.logger.info("Load IDF Dictionary")
-        idf = {}
-        with open(IDFDictFilename, "rb") as fd:
-            for item in json.load(fd):
-                w, v = item["w"], item["v"]
-                if isinstance(w, list):
-                    w = tuple(w)
-                idf[w] = v
-        return idf
+        """Load idf dict (the memory-mapped table or the legacy json dictionary, the newer one if both exist)
+        """
+        with profiler.stage("idf-load") as stage:
+            if isfile(IDFTableFilename) and (not isfile(IDFDictFilename) or getmtime(IDFTableFilename) >= getmtime(IDFDictFilename)):
+                self.logger.info("Load IDF Table [%s]", IDFTableFilename)
+                idf = IDFTable(IDFTableFilename)
+            else:
+                if isfile(IDFTableFilename):
+                    self.logger.warn("Ignore IDF Table [%s] which is older than the dictionary", IDFTableFilename)
+                self.logger.info("Load IDF Dictionary [%s]", IDFDictFilename)
+                idf = loadIDFDict(IDFDictFilename)
+            stage.sizes["terms"] = len(idf)
+            return idf
 
     def loadStopwordSet(self):
         """Load stop word set
         """
         self.logger.info("Load English Stopword Dictionary")
-        return set(nltk.corpus.stopwords.words("english"))
+        with profiler.stage("stopwords-load"):
+            return set(nltk.corpus.stopwords.words("english"))
 
     def tokenize(self, text, stopwords):
-        """Standard tokenize
+        """Standard tokenize (by the tokenizer)
         """
-        # Run tokenize
-        for word in nltk.tokenize.word_tokenize(text):
-            word = word.lower()
-            if word in stopwords or word in DropWords or PunctuationRegex.match(word):
-                continue
-            # Good
-            yield word
+        return self.tokenizer.tokenize(text, stopwords)
+
+    def getTermIDs(self, terms):
+        """Get the vocabulary ids of the terms
+        Returns:
+            [ int ]: The ids
+        """
+        add = self.vocabulary.add
+        return [ add(x) for x in terms ]
 
     def groupByTermsCount(self, counter):
-        """Group by terms count
+        """Group by terms count (of the n-gram keys)
         """
         counters = {}
-        for term, count in counter.iteritems():
-            if isinstance(term, tuple):
-                termCount = len(term)
-            else:
-                termCount = 1
+        for key, count in counter.iteritems():
+            termCount = self.codec.getLength(key)
             if termCount not in counters:
                 counters[termCount] = Counter()
-            counters[termCount][term] = count
+            counters[termCount][key] = count
+        return counters
+
+    def getTFIDF(self, counter, idf):
+        """Get the tf-idf of the n-gram keys
+        Args:
+            idf(dict): The idf of the keys (see getIDF)
+        Returns:
+            dict: The key to tf-idf
+        """
+        getIDF = idf.get
+        return { key: tf * getIDF(key, MissingValueIDF) for key, tf in counter.iteritems() }
+
+    def mostCommon(self, counter, n, getOrder = None):
+        """Get the n most common items (the ties are ordered by the key or its order, so the order is deterministic)
+        Args:
+            counter(dict): The counter
+            n(int): The number of items, 0 for all
+            getOrder(callable): Get the order of the key for ordering the ties, use the key itself if not specified
+        Returns:
+            [ (key, count) ]: The items
+        """
+        if n and len(counter) > n:
+            # Only the n items are sorted, and the ties of the n-th largest count are only ordered to pick the rest
+            threshold = heapq.nlargest(n, counter.itervalues())[-1]
+            items = [ (k, v) for k, v in counter.iteritems() if v > threshold ]
+            ties = [ k for k, v in counter.iteritems() if v == threshold ]
+            items.extend((k, threshold) for k in heapq.nsmallest(n - len(items), ties, key = getOrder))
+        else:
+            items = counter.items()
+        if getOrder:
+            items.sort(key = lambda (k, v): (-v, getOrder(k)))
+        else:
+            items.sort(key = lambda (k, v): (-v, k))
+        return items
+
+    def createNGramCounter(self, nGram):
+        """Create the n-gram counter (the approximate one if the capacity is set)
+        """
+        if self.capacity > 0:
+            return ApproximateCounter(nGram, self.capacity, self.countMin)
+        return NGramCounter(nGram, self.useNumPy)
+
+    def checkOptions(self, workers):
+        """Check if the counting options are compatible
+        """
+        if workers > 1 and self.capacity > 0 and self.countMin:
+            raise ValueError("The count-min sketches cannot be counted by multiple workers")
+        if self.capacity > 0 and self.idfMode != IDFModeStatic:
+            raise ValueError("The corpus idf cannot be counted approximately")
+
+    def getTopTerms(self, counter, idf, n):
+        """Get the top n terms (by tf-idf) of each terms count
+        Args:
+            counter(object): The n-gram key to tf, Counter or ApproximateCounter
+            idf(dict): The idf of the keys (see getIDF)
+            n(int): The number of terms of each terms count, 0 for all
+        Yield:
+            (int, str / tuple, float, int, float, int): The terms count, term, tf-idf, frequency, and the max errors
+            of the tf-idf and frequency (None if counted exactly)
+        """
+        # The ties are ordered by the terms without decoding the keys, and only the top keys are decoded
+        decode, getOrder = self.codec.decode, self.codec.getOrder
+        if isinstance(counter, ApproximateCounter):
+            for termCount in counter.getNs():
+                items = counter.getItems(termCount)
+                termsIDF = { key: idf.get(key, MissingValueIDF) for key, _, _ in items }
+                tfidf = { key: count * termsIDF[key] for key, count, _ in items }
+                counts = { key: (count, error) for key, count, error in items }
+                for key, value in self.mostCommon(tfidf, n, getOrder):
+                    count, error = counts[key]
+                    yield termCount, decode(key), value, count, error * termsIDF[key], error
+        else:
+            tfidf = self.getTFIDF(counter, idf)
+            for termCount, termCounter in sorted(self.groupByTermsCount(tfidf).iteritems(), key = lambda (k, v): k):
+                for key, value in self.mostCommon(termCounter, n, getOrder):
+                    yield termCount, decode(key), value, counter[key], None, None
+
+    def createKeywordCounters(self, nGram):
+        """Create the counters of the keywords
+        Returns:
+            list: The title tf and content tf counters, and the title df and content df counters if the corpus idf is used
+        """
+        counters = [ self.createNGramCounter(nGram), self.createNGramCounter(nGram) ]
+        if self.idfMode != IDFModeStatic:
+            counters.extend([ NGramCounter(nGram, self.useNumPy, distinct = True), NGramCounter(nGram, self.useNumPy, distinct = True) ])
         return counters
 
-    def getKeywords(self, nGram, newsList, titleFile, contentFile):
+    def addKeywords(self, counters, titleIDs, contentIDs):
+        """Add the term ids of the title and content of a news to the keyword counters
+        Args:
+            counters(list): The counters (see createKeywordCounters)
+            titleIDs([ int ]): The term ids of the title, None if no title
+            contentIDs([ int ]): The term ids of the content, None if no content
+        """
+        if titleIDs is not None:
+            for counter in counters[0::2]:
+                counter.add(titleIDs)
+        if contentIDs is not None:
+            for counter in counters[1::2]:
+                counter.add(contentIDs)
+
+    def countKeywords(self, newsList, nGram, stopwords):
+        """Count the terms (n-gram) of the news titles and contents
+        Returns:
+            tuple: The title tf and content tf (keyed by n-gram keys), Counter or ApproximateCounter. And the title df
+            and content df Counters (a title or content is a document) if the corpus idf is used
+        """
+        counters = self.createKeywordCounters(nGram)
+        for news in newsList:
+            self.addKeywords(
+                counters,
+                self.getTermIDs(self.tokenize(news.title, stopwords)) if news.title else None,
+                self.getTermIDs(self.tokenize(news.content, stopwords)) if news.content else None,
+                )
+        return tuple(x.getCounter() for x in counters)
+
+    def getKeywords(self, nGram, newsList, titleFile, contentFile, workers = 1):
         """Get the keywords list
         """
+        self.checkOptions(workers)
         # Load idf
-        idf = self.loadIDFDict()
-        titleTF, contentTF = Counter(), Counter()
+        idf = self.loadIDF()
         # Get the stop words
         stopwords = self.loadStopwordSet()
         # Get common keywords
         self.logger.info("Start analyze")
-        for news in newsList:
-            if news.title:
-                # Title
-                words = list(self.tokenize(news.title, stopwords))
-                for i in range(len(words)):
-                    for j in range(1, nGram + 1):
-                        terms = words[i:i+j]
-                        if len(terms) != j:
-                            break
-                        if j == 1:
-                            titleTF[terms[0]] += 1
-                        else:
-                            titleTF[tuple(terms)] += 1
-            if news.content:
-                # Content
-                words = list(self.tokenize(news.content, stopwords))
-                for i in range(len(words)):
-                    for j in range(1, nGram + 1):
-                        terms = words[i:i+j]
-                        if len(terms) != j:
-                            break
-                        if j == 1:
-                            contentTF[terms[0]] += 1
-                        else:
-                            contentTF[tuple(terms)] += 1
-        # Get tf-idf
-        titleKeywords, contentKeywords = {}, {}
-        for word, tf in titleTF.iteritems():
-            titleKeywords[word] = tf * idf.get(word, MissingValueIDF)
-        for word, tf in contentTF.iteritems():
-            contentKeywords[word] = tf * idf.get(word, MissingValueIDF)
+        with profiler.stage("count") as stage:
+            counters = mapReduce(self.countKeywords, stage.iterate(newsList), (nGram, stopwords), workers, self.codec)
+            stage.sizes.update(titleTF = len(counters[0]), contentTF = len(counters[1]))
         # Write out
         self.logger.info("Write output")
-        with open(titleFile + ".csv", "wb") as fd:
-            titleWriter = KeywordResultWriter(fd)
-            for termCount, termCounter in sorted(self.groupByTermsCount(titleKeywords).iteritems(), key = lambda (k,v): k):
-                for term, count in termCounter.most_common(200):
-                    titleWriter.write({
-                        titleWriter.FieldKeyword: " ".join(term) if isinstance(term, tuple) else term ,
-                        titleWriter.FieldTermsCount: termCount,
-                        titleWriter.FieldTFIDF: count,
-                        titleWriter.FieldFrequency: titleTF[term],
-                        })
-        with open(contentFile + ".csv", "wb") as fd:
-            contentWriter = KeywordResultWriter(fd)
-            for termCount, termCounter in sorted(self.groupByTermsCount(contentKeywords).iteritems(), key = lambda (k,v): k):
-                for term, count in termCounter.most_common(200):
-                    contentWriter.write({
-                        contentWriter.FieldKeyword: " ".join(term) if isinstance(term, tuple) else term ,
-                        contentWriter.FieldTermsCount: termCount,
-                        contentWriter.FieldTFIDF: count,
-                        contentWriter.FieldFrequency: contentTF[term],
-                        })
-
-    def cooccurrence(self, nGram, newsList, keywords, outputFile):
+        with profiler.stage("write"):
+            self.writeKeywords(counters, idf, titleFile, contentFile)
+
+    def writeKeywords(self, counters, idf, titleFile, contentFile):
+        """Write the top tf-idf keywords
+        Args:
+            counters(tuple): The counting result (see countKeywords)
+            idf(dict): The static idf
+        """
+        titleTF, contentTF = counters[: 2]
+        idf = self.getKeyIDF(idf)
+        if self.idfMode != IDFModeStatic:
+            titleIDF, contentIDF = self.getIDF(idf, counters[2]), self.getIDF(idf, counters[3])
+        else:
+            titleIDF, contentIDF = idf, idf
+        approximate = self.capacity > 0
+        for filename, tf, idf in ((titleFile, titleTF, titleIDF), (contentFile, contentTF, contentIDF)):
+            with KeywordResultWriter(filename, self.outputFormat, approximate) as writer:
+                writer.writeRows(self.iterTermRows(self.getTopTerms(tf, idf, self.top), approximate))
+
+    def iterTermRows(self, topTerms, approximate, *prefix):
+        """Iterate the result rows of the top terms
+        Args:
+            topTerms(iter): The top terms (see getTopTerms)
+            approximate(bool): Add the max errors of the approximate counting or not
+            prefix(tuple): The leading values of each row
+        Yield:
+            tuple: The prefix, term, terms count, tf-idf, frequency (and the max errors of tf-idf and frequency)
+        """
+        for termCount, term, tfidf, frequency, tfidfError, frequencyError in topTerms:
+            term = " ".join(term) if isinstance(term, tuple) else term
+            if approximate:
+                yield prefix + (term, termCount, tfidf, frequency, tfidfError, frequencyError)
+            else:
+                yield prefix + (term, termCount, tfidf, frequency)
+
+    def buildKeywordTrieTree(self, keywords, stopwords, withTerms = True):
+        """Build the (frozen) keyword trie tree
+        Args:
+            keywords([ NamedKeyword ]): The keywords
+            stopwords(set): The stop words
+            withTerms(bool): Add the word and terms to the attributes or not (the keyword is always added)
+        """
+        with profiler.stage("keyword-trie-build", len(keywords)) as stage:
+            tree = TrieTree()
+            for namedKeyword in keywords:
+                for word in namedKeyword.words:
+                    terms = list(self.tokenize(word, stopwords))
+                    if terms:
+                        if withTerms:
+                            tree.add(terms, keyword = namedKeyword, word = word, _terms = terms)
+                        else:
+                            tree.add(terms, keyword = namedKeyword)
+            tree = tree.freeze()
+            stage.sizes["nodes"] = len(tree)
+            return tree
+
+    def getNGramKeys(self, ids, nGram):
+        """Get the n-gram keys ending at each position
+        Returns:
+            [ [ int ] ]: The keys of the 1, 2, ... (at most nGram) -gram ending at each position
+        """
+        keys, previous = [], []
+        for termID in ids:
+            digit = termID + 1
+            current = [ digit ]
+            current.extend((key << IDBits) | digit for key in previous[: nGram - 1])
+            keys.append(current)
+            previous = current
+        return keys
+
+    def getWindowKeys(self, ngramKeys, mask):
+        """Get the keys of the n-grams in the windows between the masked positions
+        Args:
+            ngramKeys([ [ int ] ]): The n-gram keys ending at each position (see getNGramKeys)
+            mask(bytearray): The mask, non-zero if the position is covered (by a keyword)
+        Returns:
+            [ int ]: The n-gram keys
+        """
+        keys, start = [], 0
+        for i, covered in enumerate(mask):
+            if covered:
+                start = i + 1
+            else:
+                # The n-grams ending here and starting in the window
+                keys.extend(ngramKeys[i][: i - start + 1])
+        return keys
+
+    def createCooccurrenceCounters(self, nGram):
+        """Create the counters of the cooccurrence
+        Returns:
+            (dict, NGramCounter): The keyword name to counter, and the df counter (None if the corpus idf is not used)
+        """
+        return {}, NGramCounter(nGram, self.useNumPy, distinct = True) if self.idfMode != IDFModeStatic else None
+
+    def addCooccurrence(self, counters, terms, nGram, tree, ids = None):
+        """Add the terms of a paragraph to the cooccurrence counters
+        Args:
+            counters(tuple): The counters (see createCooccurrenceCounters)
+            terms([ str ]): The terms
+            nGram(int): The max n
+            tree(FrozenTrieTree): The keyword trie tree
+            ids([ int ]): The term ids, got from the terms if not specified
+        """
+        keywords, dfCounter = counters
+        approximate = self.capacity > 0
+        if dfCounter:
+            if ids is None:
+                ids = self.getTermIDs(terms)
+            dfCounter.add(ids)
+        # Search for all known keywords
+        keywordsInParagraph = {}
+        for node, startIndex in tree.search(terms):
+            namedKeyword = node.attrs["keyword"]
+            if not namedKeyword.name in keywordsInParagraph:
+                keywordsInParagraph[namedKeyword.name] = []
+            keywordsInParagraph[namedKeyword.name].append((startIndex, len(node.attrs["_terms"])))
+        if not keywordsInParagraph:
+            return
+        if ids is None:
+            ids = self.getTermIDs(terms)
+        # The n-gram keys are got once and shared by all the keywords, so are the windows of the same span mask
+        ngramKeys = self.getNGramKeys(ids, nGram)
+        windows = {}
+        # Caculate the related words except the keyword itself
+        for keywordName, indices in keywordsInParagraph.iteritems():
+            # Get counter of the keyword
+            if not keywordName in keywords:
+                keywords[keywordName] = ApproximateCounter(nGram, self.capacity, self.countMin) if approximate else Counter()
+            # Count the paragraph by a local counter then add to the sketches if approximate
+            counter = Counter() if approximate else keywords[keywordName]
+            # Mask the positions covered by the keyword
+            mask = bytearray(len(ids))
+            for startIndex, length in indices:
+                mask[startIndex: startIndex + length] = b"\x01" * length
+            maskKey = str(mask)
+            if maskKey not in windows:
+                windows[maskKey] = self.getWindowKeys(ngramKeys, mask)
+            # Get the cooccurrence terms
+            for key in windows[maskKey]:
+                counter[key] += 1
+            if approximate:
+                keywords[keywordName].updateCounter(counter, self.codec.getLength)
+
+    def getCooccurrenceResult(self, counters):
+        """Get the cooccurrence counting result of the counters
+        Returns:
+            dict: The keyword name to Counter (or ApproximateCounter) of terms (keyed by n-gram keys). And the df
+            Counter (a paragraph is a document) if the corpus idf is used
+        """
+        keywords, dfCounter = counters
+        if dfCounter:
+            return keywords, dfCounter.getCounter()
+        return keywords
+
+    def countCooccurrence(self, newsList, nGram, tree, stopwords):
+        """Count the cooccurrence terms (n-gram) of the keywords in the keyword trie tree
+        Returns:
+            object: The counting result (see getCooccurrenceResult)
+        """
+        return self.countCooccurrenceTerms(self.iterTerms(newsList, stopwords, perParagraph = True), nGram, tree)
+
+    def countCooccurrenceTerms(self, paragraphs, nGram, tree):
+        """Count the cooccurrence terms (n-gram) of the keywords in the tokenized paragraphs
+        Args:
+            paragraphs(iter): The terms of the paragraphs
+        Returns:
+            object: The counting result (see getCooccurrenceResult)
+        """
+        counters = self.createCooccurrenceCounters(nGram)
+        for terms in paragraphs:
+            self.addCooccurrence(counters, terms, nGram, tree)
+        return self.getCooccurrenceResult(counters)
+
+    def cooccurrence(self, nGram, newsList, keywords, outputFile, workers = 1, index = None):
         """Analyze the news cooccurrence words
         Args:
             newsList([ News ]): The news
             keywords([ NamedKeyword ]): The keywords
             outputFile(str): The output file
+            workers(int): The number of worker processes
+            index(NewsIndex): Only count the indexed paragraphs of the keywords (instead of the news) if specified
         """
+        self.checkOptions(workers)
+        if index and self.idfMode != IDFModeStatic:
+            raise ValueError("The corpus idf cannot be counted by the index (only the paragraphs of the keywords are visited)")
         # Get the stop words
         stopwords = self.loadStopwordSet()
         # Build trie tree of key words
-        tree = TrieTree()
-        for namedKeyword in keywords:
-            for word in namedKeyword.words:
-                terms = list(self.tokenize(word, stopwords))
-                if terms:
-                    tree.add(terms, keyword = namedKeyword, word = word, _terms = terms)
+        tree = self.buildKeywordTrieTree(keywords, stopwords)
         # Load idf
-        idf = self.loadIDFDict()
-        keywords = {}
+        idf = self.loadIDF()
         # Get words
         self.logger.info("Start analyze")
-        for terms in self.iterTerms(newsList, stopwords, perParagraph = True):
-            # Search for all known keywords
-            keywordsInParagraph = {}
-            for node, startIndex in tree.search(terms):
-                namedKeyword = node.attrs["keyword"]
-                if not namedKeyword.name in keywordsInParagraph:
-                    keywordsInParagraph[namedKeyword.name] = []
-                keywordsInParagraph[namedKeyword.name].append((startIndex, len(node.attrs["_terms"])))
-            # Caculate the related words except the keyword itself
-            for keywordName, indices in keywordsInParagraph.iteritems():
-                # Get counter of the keyword
-                if not keywordName in keywords:
-                    keywords[keywordName] = Counter()
-                counter = keywords[keywordName]
-                continuousTerms = []
-                # Get the cooccurrence terms
-                for i, term in enumerate(terms):
-                    for startIndex, length in indices:
-                        if i >= startIndex and i < startIndex + length:
-                            # Fall in the keyword
-                            continuousTerms = []
-                            break
-                    else:
-                        # Good
-                        counter[term] += 1
-                        continuousTerms.append(term)
-                        if len(continuousTerms) > nGram:
-                            del continuousTerms[0]
-                        for i in range(nGram):
-                            if len(continuousTerms) - i <= 1:
-                                break
-
-                            counter[tuple(continuousTerms[i:])] += 1
+        with profiler.stage("count") as stage:
+            if index:
+                paragraphs = self.getIndexedParagraphs(index, keywords, stopwords)
+                result = mapReduce(self.countCooccurrenceTerms, stage.iterate(paragraphs), (nGram, tree), workers, self.codec)
+            else:
+                result = mapReduce(self.countCooccurrence, stage.iterate(newsList), (nGram, tree, stopwords), workers, self.codec)
+            keywordCounters = result[0] if self.idfMode != IDFModeStatic else result
+            stage.sizes.update(keywords = len(keywordCounters), terms = sum(len(x) for x in keywordCounters.itervalues()))
         # Get for each trunk
         self.logger.info("Write output")
-        with open(outputFile + ".csv", "wb") as fd:
-            writer = CooccurrenceResultWriter(fd)
-            for keywordName, counter in keywords.iteritems():
-                # Get idf
-                termsIDF = {}
-                for term, tf in counter.iteritems():
-                    termsIDF[term] = tf * idf.get(term, MissingValueIDF)
-                # Write
-                for termCount, termCounter in sorted(self.groupByTermsCount(termsIDF).iteritems(), key = lambda (k, v): k):
-                    for word, count in termCounter.most_common(200):
-                        writer.write({
-                            writer.FieldKeyword: keywordName,
-                            writer.FieldCoword: " ".join(word) if isinstance(word, tuple) else word,
-                            writer.FieldTermsCount: termCount,
-                            writer.FieldTFIDF: count,
-                            writer.FieldFrequency: counter[word]
-                            })
-
-    def cooccurrenceEntity(self, newsList, keywords, outputFile):
+        with profiler.stage("write"):
+            self.writeCooccurrence(result, idf, outputFile)
+
+    def writeCooccurrence(self, result, idf, outputFile):
+        """Write the top tf-idf cooccurrence terms of each keyword
+        Args:
+            result(object): The counting result (see getCooccurrenceResult)
+            idf(dict): The static idf
+        """
+        idf = self.getKeyIDF(idf)
+        if self.idfMode != IDFModeStatic:
+            keywords, dfCounter = result
+            idf = self.getIDF(idf, dfCounter)
+        else:
+            keywords = result
+        approximate = self.capacity > 0
+        with CooccurrenceResultWriter(outputFile, self.outputFormat, approximate) as writer:
+            for keywordName, counter in sorted(keywords.iteritems()):
+                writer.writeRows(self.iterTermRows(self.getTopTerms(counter, idf, self.top), approximate, keywordName))
+
+    def addCooccurrenceEntity(self, keyword2Entities, terms, tree):
+        """Add the terms of a paragraph to the cooccurrence entity counters
+        Args:
+            keyword2Entities(dict): The keyword name (None for global) to entity type to Counter of entity names
+            terms([ str ]): The terms
+            tree(FrozenTrieTree): The keyword trie tree, None to search the entity trie tree only
+        """
+        # Search for each key words
+        keywords = Set()
+        entities = {}
+        for node, _ in searchAll(terms, *((self.entityTree, tree) if tree else (self.entityTree, ))):
+            # Check keyword
+            namedKeyword = node.attrs.get("keyword")
+            if namedKeyword:
+                keywords.add(namedKeyword.name)
+            # Check entities
+            country = node.attrs.get(KeyCountry)
+            if country:
+                if KeyCountry not in entities:
+                    entities[KeyCountry] = Counter()
+                entities[KeyCountry][country.name] += 1
+            # Check region
+            region = node.attrs.get(KeyRegion)
+            if region:
+                if KeyRegion not in entities:
+                    entities[KeyRegion] = Counter()
+                entities[KeyRegion][region.name] += 1
+            # Check province
+            province = node.attrs.get(KeyProvince)
+            if province:
+                if KeyProvince not in entities:
+                    entities[KeyProvince] = Counter()
+                entities[KeyProvince][province.name] += 1
+            # Check city
+            city = node.attrs.get(KeyCity)
+            if city:
+                if KeyCity not in entities:
+                    entities[KeyCity] = Counter()
+                entities[KeyCity][city.name] += 1
+        # Add to global
+        for keyword in [ None ] + list(keywords):
+            if not keyword in keyword2Entities:
+                keyword2Entities[keyword] = {}
+            ents = keyword2Entities[keyword]
+            for entType, counter in entities.iteritems():
+                if not entType in ents:
+                    ents[entType] = Counter()
+                for key, value in counter.iteritems():
+                    ents[entType][key] += value
+
+    def countCooccurrenceEntity(self, newsList, tree, stopwords):
+        """Count the cooccurrence entities of the keywords in the keyword trie tree
+        Returns:
+            dict: The keyword name (None for global) to entity type to Counter of entity names
+        """
+        return self.countCooccurrenceEntityTerms(self.iterTerms(newsList, stopwords, perParagraph = True), tree)
+
+    def countCooccurrenceEntityTerms(self, paragraphs, tree):
+        """Count the cooccurrence entities of the keywords in the tokenized paragraphs
+        Args:
+            paragraphs(iter): The terms of the paragraphs
+            tree(FrozenTrieTree): The keyword trie tree, None to count the (global) entities only
+        Returns:
+            dict: The keyword name (None for global) to entity type to Counter of entity names
+        """
+        keyword2Entities = { None: {} }
+        for terms in paragraphs:
+            self.addCooccurrenceEntity(keyword2Entities, terms, tree)
+        return keyword2Entities
+
+    def countIndexedCooccurrenceEntity(self, paragraphs, tree):
+        """Count the cooccurrence entities of the indexed paragraphs, and their entities searched without the keywords
+        Returns:
+            (dict, dict): The counting result (see countCooccurrenceEntityTerms), and the entity type to Counter of
+            entity names searched by the entity trie tree only
+        """
+        keyword2Entities, entities = { None: {} }, { None: {} }
+        for terms in paragraphs:
+            self.addCooccurrenceEntity(keyword2Entities, terms, tree)
+            self.addCooccurrenceEntity(entities, terms, None)
+        return keyword2Entities, entities[None]
+
+    def buildIndex(self, newsList, index, gazetteer):
+        """Build the index of the paragraphs of the news, and the entity counts of the gazetteer
+        Args:
+            newsList([ News ]): The news
+            index(NewsIndex): The index
+            gazetteer(str): The gazetteer hash
+        """
+        stopwords = self.loadStopwordSet()
+        with profiler.stage("index") as stage:
+            index.build(stage.iterate(self.iterTerms(newsList, stopwords, perParagraph = True)), self.tokenizer, stopwords)
+        self.getIndexedEntityCounts(index, gazetteer)
+
+    def getIndexedEntityCounts(self, index, gazetteer):
+        """Get the entity counts of all indexed paragraphs of the gazetteer (counted and stored if not yet)
+        Returns:
+            dict: The entity type to Counter of entity names
+        """
+        entities = index.getEntityCounts(gazetteer)
+        if entities is None:
+            self.logger.info("Count the entities of all indexed paragraphs of gazetteer [%s]", gazetteer)
+            with profiler.stage("index-entities", index.paragraphs):
+                entities = self.countCooccurrenceEntityTerms(index.iterParagraphs(), None)[None]
+                index.putEntityCounts(gazetteer, entities)
+        return entities
+
+    def getIndexedParagraphs(self, index, keywords, stopwords):
+        """Get the indexed paragraphs containing the words of the keywords
+        Returns:
+            iter: The terms of the paragraphs
+        """
+        index.check(self.tokenizer, stopwords)
+        phrases = [ list(self.tokenize(word, stopwords)) for namedKeyword in keywords for word in namedKeyword.words ]
+        paragraphIDs = index.search(phrases)
+        self.logger.info("Found [%d] of [%d] indexed paragraphs of the keywords", len(paragraphIDs), index.paragraphs)
+        return index.iterParagraphs(paragraphIDs)
+
+    def countCooccurrenceEntityByIndex(self, index, gazetteer, tree, keywords, stopwords, workers = 1):
+        """Count the cooccurrence entities of the keywords by the index
+        NOTE:
+            The global entities are of all paragraphs, they're got from the stored entity counts of the gazetteer, in
+            which the counts of the visited paragraphs are replaced by the ones searched together with the keywords
+            (a longer keyword match hides the entity match of the same start)
+        Returns:
+            dict: The keyword name (None for global) to entity type to Counter of entity names
+        """
+        entities = self.getIndexedEntityCounts(index, gazetteer)
+        paragraphs = self.getIndexedParagraphs(index, keywords, stopwords)
+        keyword2Entities, visited = mapReduce(self.countIndexedCooccurrenceEntity, paragraphs, (tree, ), workers)
+        globalEntities = {}
+        for entType in set(entities) | set(keyword2Entities[None]):
+            counter = Counter(entities.get(entType, {}))
+            counter.update(keyword2Entities[None].get(entType, {}))
+            counter.subtract(visited.get(entType, {}))
+            counter = Counter({ k: v for k, v in counter.iteritems() if v > 0 })
+            if counter:
+                globalEntities[entType] = counter
+        keyword2Entities[None] = globalEntities
+        return keyword2Entities
+
+    def cooccurrenceEntity(self, newsList, keywords, outputFile, workers = 1, index = None, gazetteer = None):
         """Analyze the news cooccurrence words
+        Args:
+            index(NewsIndex): Only count the indexed paragraphs of the keywords (instead of the news) if specified
+            gazetteer(str): The gazetteer hash, required by the index
         """
         # Get the stop words
         stopwords = self.loadStopwordSet()
-        # Build entity trie tree
-        tree = self.buildEntityTrieTree()
-        for namedKeyword in keywords:
-            for word in namedKeyword.words:
-                terms = list(self.tokenize(word, stopwords))
-                if terms:
-                    tree.add(terms, keyword = namedKeyword)
-        keyword2Entities = { None: {} }
+        # Build keyword trie tree, it's searched together with the entity trie tree
+        tree = self.buildKeywordTrieTree(keywords, stopwords, withTerms = False)
         # Get words
         self.logger.info("Start analyze")
-        for terms in self.iterTerms(newsList, stopwords, perParagraph = True):
-            # Search for each key words
-            keywords = Set()
-            entities = {}
-            for node, _ in tree.search(terms):
-                # Check keyword
-                namedKeyword = node.attrs.get("keyword")
-                if namedKeyword:
-                    keywords.add(namedKeyword.name)
-                # Check entities
-                country = node.attrs.get(KeyCountry)
-                if country:
-                    if KeyCountry not in entities:
-                        entities[KeyCountry] = Counter()
-                    entities[KeyCountry][country.name] += 1
-                # Check region
-                region = node.attrs.get(KeyRegion)
-                if region:
-                    if KeyRegion not in entities:
-                        entities[KeyRegion] = Counter()
-                    entities[KeyRegion][region.name] += 1
-                # Check province
-                province = node.attrs.get(KeyProvince)
-                if province:
-                    if KeyProvince not in entities:
-                        entities[KeyProvince] = Counter()
-                    entities[KeyProvince][province.name] += 1
-                # Check city
-                city = node.attrs.get(KeyCity)
-                if city:
-                    if KeyCity not in entities:
-                        entities[KeyCity] = Counter()
-                    entities[KeyCity][city.name] += 1
-            # Add to global
-            for keyword in [ None ] + list(keywords):
-                if not keyword in keyword2Entities:
-                    keyword2Entities[keyword] = {}
-                ents = keyword2Entities[keyword]
-                for entType, counter in entities.iteritems():
-                    if not entType in ents:
-                        ents[entType] = Counter()
-                    for key, value in counter.iteritems():
-                        ents[entType][key] += value
+        with profiler.stage("count") as stage:
+            if index:
+                keyword2Entities = self.countCooccurrenceEntityByIndex(index, gazetteer, tree, keywords, stopwords, workers)
+            else:
+                keyword2Entities = mapReduce(self.countCooccurrenceEntity, stage.iterate(newsList), (tree, stopwords), workers)
+            stage.sizes["keywords"] = len(keyword2Entities)
         # Write out
         self.logger.info("Write output")
-        with open(outputFile + ".csv", "wb") as fd:
-            writer = CooccurrenceEntityResultWriter(fd)
-            # Country
-            if keyword2Entities[None].get(KeyCountry):
-                for key, value in keyword2Entities[None][KeyCountry].most_common()[: 200]:
-                    writer.write({
-                        writer.FieldKeyword: "Global",
-                        writer.FieldEntityType: KeyCountry,
-                        writer.FieldEntity: key,
-                        writer.FieldFrequency: value,
-                    })
-            # Region
-            if keyword2Entities[None].get(KeyRegion):
-                for key, value in keyword2Entities[None][KeyRegion].most_common()[: 200]:
-                    writer.write({
-                        writer.FieldKeyword: "Global",
-                        writer.FieldEntityType: KeyRegion,
-                        writer.FieldEntity: key,
-                        writer.FieldFrequency: value,
-                    })
-            # Province
-            if keyword2Entities[None].get(KeyProvince):
-                for key, value in keyword2Entities[None][KeyProvince].most_common()[: 200]:
-                    writer.write({
-                        writer.FieldKeyword: "Global",
-                        writer.FieldEntityType: KeyProvince,
-                        writer.FieldEntity: key,
-                        writer.FieldFrequency: value,
-                    })
-            # City
-            if keyword2Entities[None].get(KeyCity):
-                for key, value in keyword2Entities[None][KeyCity].most_common()[: 200]:
-                    writer.write({
-                        writer.FieldKeyword: "Global",
-                        writer.FieldEntityType: KeyCity,
-                        writer.FieldEntity: key,
-                        writer.FieldFrequency: value,
-                    })
+        with profiler.stage("write"):
+            self.writeCooccurrenceEntity(keyword2Entities, outputFile)
+
+    def writeCooccurrenceEntity(self, keyword2Entities, outputFile):
+        """Write the most common cooccurrence entities (of global and each keyword)
+        """
+        keyword2Entities.setdefault(None, {})
+        with CooccurrenceEntityResultWriter(outputFile, self.outputFormat) as writer:
+            # Global (country, region, province and city)
+            for entType in (KeyCountry, KeyRegion, KeyProvince, KeyCity):
+                if keyword2Entities[None].get(entType):
+                    writer.writeRows(("Global", entType, key, value) for key, value in self.mostCommon(keyword2Entities[None][entType], self.top))
             # Keywords
-            for keyword, entities in keyword2Entities.iteritems():
+            for keyword, entities in sorted(keyword2Entities.iteritems()):
                 if not keyword:
                     continue
-                for entType, counter in entities.iteritems():
-                    for key, value in counter.most_common()[: 200]:
-                        writer.write({
-                            writer.FieldKeyword: keyword,
-                            writer.FieldEntityType: entType,
-                            writer.FieldEntity: key,
-                            writer.FieldFrequency: value,
-                            })
+                for entType, counter in sorted(entities.iteritems()):
+                    writer.writeRows((keyword, entType, key, value) for key, value in self.mostCommon(counter, self.top))
+
+    def countTrends(self, newsList, nGram, stopwords):
+        """Count the terms (n-gram) of the news titles and contents by the publish date
+        Returns:
+            dict: The date to the title tf, content tf, title df and content df Counters (keyed by n-gram keys)
+        """
+        counters = {}
+        for news in newsList:
+            if not news.date in counters:
+                counters[news.date] = [ NGramCounter(nGram, self.useNumPy), NGramCounter(nGram, self.useNumPy),
+                    NGramCounter(nGram, self.useNumPy, distinct = True), NGramCounter(nGram, self.useNumPy, distinct = True) ]
+            self.addKeywords(
+                counters[news.date],
+                self.getTermIDs(self.tokenize(news.title, stopwords)) if news.title else None,
+                self.getTermIDs(self.tokenize(news.content, stopwords)) if news.content else None,
+                )
+        return { k: tuple(x.getCounter() for x in v) for k, v in counters.iteritems() }
+
+    def iterTrendCounts(self, tf, df):
+        """Iterate the terms and counts of the tf and df Counters (see countTrends)
+        Yield:
+            (unicode, int, int): The term (the terms joined by space), tf and df
+        """
+        decode = self.codec.decode
+        for key, count in tf.iteritems():
+            if key is None:
+                continue
+            term = decode(key)
+            yield " ".join(term) if isinstance(term, tuple) else term, count, df[key]
+
+    def updateTrends(self, nGram, newsList, store, workers = 1, replace = False):
+        """Count the news of the days not in the trend store and put them to the store
+        Args:
+            store(TrendStore): The trend store
+            replace(bool): Recount the days in the store as well (the news of the days are replaced)
+        Returns:
+            [ date ]: The counted days
+        """
+        from .trend import FieldTitle, FieldContent
+        stopwords = self.loadStopwordSet()
+        store.check(nGram, self.tokenizer, stopwords)
+        days = set() if replace else store.getDays()
+        skipped = Counter()
+        def iterNewNews():
+            for news in newsList:
+                if news.date is None:
+                    skipped["undated"] += 1
+                elif news.date in days:
+                    skipped["stored"] += 1
+                else:
+                    yield news
+        self.logger.info("Start count the news of the new days")
+        with profiler.stage("count") as stage:
+            day2Counters = mapReduce(self.countTrends, stage.iterate(iterNewNews()), (nGram, stopwords), workers, self.codec)
+            stage.sizes["days"] = len(day2Counters)
+        if skipped["undated"]:
+            self.logger.warn("Skipped [%d] news without a publish date", skipped["undated"])
+        if skipped["stored"]:
+            self.logger.info("Skipped [%d] news of the days in the store", skipped["stored"])
+        self.logger.info("Write the counts of [%d] days", len(day2Counters))
+        with profiler.stage("write", len(day2Counters)):
+            for day, (titleTF, contentTF, titleDF, contentDF) in sorted(day2Counters.iteritems()):
+                store.putDay(day, max(titleDF.get(None, 0), contentDF.get(None, 0)), {
+                    FieldTitle: self.iterTrendCounts(titleTF, titleDF),
+                    FieldContent: self.iterTrendCounts(contentTF, contentDF),
+                    })
+            store.commit()
+        return sorted(day2Counters)
+
+    def writeTrends(self, store, outputFile, field, period, window, history, until = None, minCount = 2, sort = TrendSortTFIDF):
+        """Write the top trends (by the sort score) of each terms count
+        Args:
+            store(TrendStore): The trend store
+            sort(str): The sort score, see spec.TrendSort*
+            The others are the same as TrendStore.getTrends
+        Returns:
+            (date, date, int): The first and last day of the window and the number of news in the window
+        """
+        with profiler.stage("count") as stage:
+            start, end, news, trends = store.getTrends(field, period, window, history, until, minCount)
+            stage.sizes["terms"] = len(trends)
+        score = 2 if sort == TrendSortTFIDF else 5 if sort == TrendSortVelocity else 6
+        groups = {}
+        for trend in trends:
+            # The terms without the velocity (burst) are ordered last
+            groups.setdefault(trend[1], {})[trend] = trend[score] if trend[score] is not None else float("-inf")
+        with profiler.stage("write"):
+            with TrendResultWriter(outputFile, self.outputFormat) as writer:
+                for _, scores in sorted(groups.iteritems()):
+                    writer.writeRows(trend for trend, _ in self.mostCommon(scores, self.top, lambda x: x[0]))
+        return start, end, news
 
     def iterTerms(self, newsList, stopwords, perParagraph = False):
         """Iterate terms per news or per paragraph
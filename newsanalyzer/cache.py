@@ -0,0 +1,68 @@
+# encoding=utf8
+
+""" The cache
+    Author: lipixun
+    Created Time : 日  2/12 18:20:31 2017
+
+    File Name: cache.py
+    Description:
+
+        The prepared gazetteer (the countries, regions, provinces, cities with the region to country links and the frozen
+        entity trie tree) is pickled to the cache directory, keyed by the hash of the gazetteer sheets of the workbook.
+        So the following runs on a workbook with unchanged gazetteer sheets could skip the preparing.
+
+"""
+
+import os
+import os.path
+import logging
+
+from cPickle import load, dump, HIGHEST_PROTOCOL
+
+from .spec import CachePath, GazetteerCacheVersion
+
+class GazetteerCache(object):
+    """The gazetteer cache
+    """
+    logger = logging.getLogger("newsanalyzer.GazetteerCache")
+
+    def __init__(self, path = CachePath):
+        """Create a new GazetteerCache
+        """
+        self.path = path
+
+    def getFilename(self, key):
+        """Get the cache filename of the key
+        """
+        return os.path.join(self.path, "gazetteer-v%d-%s.pickle" % (GazetteerCacheVersion, key))
+
+    def load(self, key):
+        """Load the gazetteer
+        Returns:
+            dict: The gazetteer, None if not cached
+        """
+        filename = self.getFilename(key)
+        if not os.path.isfile(filename):
+            self.logger.info("Gazetteer cache [%s] not found", key)
+            return
+        try:
+            with open(filename, "rb") as fd:
+                gazetteer = load(fd)
+        except Exception as error:
+            self.logger.warn("Failed to load gazetteer cache [%s], error: %s", filename, error)
+            return
+        self.logger.info("Load gazetteer from cache [%s]", key)
+        return gazetteer
+
+    def save(self, key, gazetteer):
+        """Save the gazetteer
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        filename = self.getFilename(key)
+        # Write to a temp file and rename it, so a broken cache file won't be seen by others
+        tempFilename = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tempFilename, "wb") as fd:
+            dump(gazetteer, fd, HIGHEST_PROTOCOL)
+        os.rename(tempFilename, filename)
+        self.logger.info("Save gazetteer to cache [%s]", key)
@@ -0,0 +1,205 @@
+# encoding=utf8
+
+""" The n-gram counting
+    Author: lipixun
+    Created Time : 日  2/12 21:36:52 2017
+
+    File Name: counting.py
+    Description:
+
+        Count the n-gram keys (see vocab.NGramCodec) of the term id sequences.
+
+        If numpy is installed, the sequences are counted in batches: the ids of a batch are concatenated to a flat
+        array, the n-gram windows of each n are stacked as the rows of a (windows, n) array by shifted slices, and
+        counted by np.unique. The partial tables are merged (by np.unique / np.bincount as well) and converted to the
+        n-gram keys only once at the end. Otherwise they're counted one by one in pure python.
+
+        The counter could also count the document frequency (a sequence is a document) instead of the term frequency,
+        the number of the documents is kept in the counter by the key DocumentsKey.
+
+"""
+
+from itertools import chain, izip
+from collections import Counter
+
+from .vocab import IDBits
+from .utils import LazyModule, isModuleInstalled
+
+# Numpy (imported when used)
+np = LazyModule("numpy") if isModuleInstalled("numpy") else None
+
+# The number of term ids in a batch
+BatchSize = 1 << 20
+# The max number of partial tables of an n before merging them
+MaxPartialTables = 8
+# The key of the number of documents in the document frequency counters
+DocumentsKey = None
+
+def countNGrams(ids, nGram, counter):
+    """Count the n-gram keys of the term ids (in pure python)
+    """
+    for i in xrange(len(ids)):
+        key = 0
+        for termID in ids[i: i + nGram]:
+            key = (key << IDBits) | (termID + 1)
+            counter[key] += 1
+
+def hashRows(rows):
+    """Hash the rows of a 2-d int64 array to uint64
+    """
+    hashes = np.zeros(len(rows), dtype = np.uint64)
+    with np.errstate(over = "ignore"):
+        for i in xrange(rows.shape[1]):
+            hashes ^= rows[:, i].astype(np.uint64)
+            hashes *= np.uint64(0x9E3779B97F4A7C15)
+            hashes ^= hashes >> np.uint64(29)
+    return hashes
+
+def getChanged(rows):
+    """Get if each row of the sorted rows is different to the previous one
+    Returns:
+        np.ndarray: The bool array
+    """
+    changed = np.empty(len(rows), dtype = bool)
+    changed[0] = True
+    np.any(rows[1:] != rows[:-1], axis = 1, out = changed[1:])
+    return changed
+
+def countRows(rows, counts = None):
+    """Count the unique rows of a 2-d int64 array
+    Args:
+        rows(np.ndarray): The rows
+        counts(np.ndarray): The count of each row, 1 if not specified
+    Returns:
+        (np.ndarray, np.ndarray): The unique rows and the counts
+    """
+    if not len(rows):
+        return rows, np.zeros(0, dtype = np.int64)
+    if rows.shape[1] == 1:
+        order = np.argsort(rows[:, 0])
+        changed = getChanged(rows[order])
+    else:
+        # Sort by the hashes of the rows (much faster than lexsort), the equal rows are adjacent unless there's any
+        # hash collision, which is found by comparing the number of the unique hashes and rows
+        hashes = hashRows(rows)
+        order = np.argsort(hashes)
+        hashes = hashes[order]
+        changed = getChanged(rows[order])
+        if np.count_nonzero(hashes[1:] != hashes[:-1]) + 1 != np.count_nonzero(changed):
+            order = np.lexsort(rows.T[::-1])
+            changed = getChanged(rows[order])
+    starts = np.flatnonzero(changed)
+    if counts is None:
+        counts = np.diff(np.append(starts, len(rows)))
+    else:
+        counts = np.add.reduceat(counts[order], starts)
+    return rows[order[starts]], counts.astype(np.int64)
+
+class NGramCounter(object):
+    """The n-gram counter
+    """
+    def __init__(self, nGram, useNumPy = None, batchSize = BatchSize, distinct = False):
+        """Create a new NGramCounter
+        Args:
+            nGram(int): The max n
+            useNumPy(bool): Use numpy or not, None to use numpy if it's installed
+            batchSize(int): The number of term ids in a batch
+            distinct(bool): Count the document frequency (an n-gram is counted once per sequence) or not
+        """
+        if useNumPy and not np:
+            raise ValueError("numpy is not installed")
+        self.nGram = nGram
+        self.distinct = distinct
+        self.documents = 0
+        self.useNumPy = bool(np) if useNumPy is None else useNumPy
+        self.batchSize = batchSize
+        self.counter = Counter()
+        self.batch, self.batchIDs = [], 0
+        self.tables = {}    # n -> [ (rows, counts) ]
+
+    def add(self, ids):
+        """Add the term ids of a sequence
+        """
+        self.documents += 1
+        if not self.useNumPy:
+            if self.distinct:
+                counter = Counter()
+                countNGrams(ids, self.nGram, counter)
+                self.counter.update(counter.iterkeys())
+            else:
+                countNGrams(ids, self.nGram, self.counter)
+            return
+        if ids:
+            self.batch.append(ids)
+            self.batchIDs += len(ids)
+            if self.batchIDs >= self.batchSize:
+                self.flush()
+
+    def flush(self):
+        """Count the current batch
+        NOTE:
+            The n-gram keys are packed into int64 words (from the right, 2 terms per word) as the rows, so a row
+            is the n-gram key split by every 2 * IDBits bits. If distinct, the rows are suffixed by the sequence
+            index and counted uniquely at first
+        """
+        if not self.batch:
+            return
+        lengths = np.array([ len(x) for x in self.batch ], dtype = np.int64)
+        digits = np.fromiter(chain.from_iterable(self.batch), dtype = np.int64, count = self.batchIDs) + 1
+        # The end (exclusive) of the sequence of each position
+        ends = np.repeat(np.cumsum(lengths), lengths)
+        if self.distinct:
+            sequences = np.repeat(np.arange(len(lengths), dtype = np.int64), lengths)
+        positions = np.arange(self.batchIDs, dtype = np.int64)
+        for n in xrange(1, self.nGram + 1):
+            starts = positions[positions + n <= ends]
+            if not len(starts):
+                break
+            pad = n % 2     # The empty slot before the first term
+            columns = (n + 1) // 2
+            rows = np.zeros((len(starts), columns + 1 if self.distinct else columns), dtype = np.int64)
+            for i in xrange(n):
+                slot = i + pad
+                rows[:, slot // 2] |= digits[starts + i] << (IDBits if slot % 2 == 0 else 0)
+            if self.distinct:
+                rows[:, columns] = sequences[starts]
+                rows = countRows(rows)[0][:, : columns]
+            tables = self.tables.setdefault(n, [])
+            tables.append(countRows(rows))
+            if len(tables) > MaxPartialTables:
+                self.tables[n] = [ self.mergeTables(tables) ]
+        self.batch, self.batchIDs = [], 0
+
+    def mergeTables(self, tables):
+        """Merge the partial tables
+        Returns:
+            (rows, counts): The merged table
+        """
+        if len(tables) == 1:
+            return tables[0]
+        return countRows(np.concatenate([ x[0] for x in tables ]), np.concatenate([ x[1] for x in tables ]))
+
+    def getCounter(self):
+        """Get the counter of the n-gram keys
+        Returns:
+            Counter: The counter
+        """
+        if self.distinct:
+            self.counter[DocumentsKey] = self.documents
+        if not self.useNumPy:
+            return self.counter
+        self.flush()
+        counts = {}
+        for n, tables in self.tables.iteritems():
+            rows, tableCounts = self.mergeTables(tables)
+            if rows.shape[1] == 1:
+                keys = rows[:, 0]
+            else:
+                # Python integers (object array), since the keys may not fit in 64 bits
+                keys = rows[:, 0].astype(object)
+                for i in xrange(1, rows.shape[1]):
+                    keys = (keys << (2 * IDBits)) | rows[:, i].astype(object)
+            counts.update(izip(keys.tolist(), tableCounts.tolist()))
+        self.tables = {}
+        self.counter.update(counts)
+        return self.counter
@@ -0,0 +1,213 @@
+# encoding=utf8
+
+""" The near-duplicate news detection
+    Author: lipixun
+    Created Time : 日  2/13 05:41:09 2017
+
+    File Name: dedup.py
+    Description:
+
+        The news are deduplicated (streamed) before counting, so the copies of the syndicated stories are counted once.
+
+        A news is represented by the shingles (the word n-grams) of the content (or the title if no content), and the
+        minhash signature of the shingles, of which the agreement of two signatures estimates the jaccard similarity of
+        the two shingle sets. The signatures are split into bands and hashed to the buckets of each band (lsh), so only
+        the news sharing a bucket with a news are compared with it. The bands and rows of each band are chosen to
+        minimize the false positive and negative probabilities at the similarity threshold.
+
+        A news is a duplicate if the estimated similarity to a kept news (the first news of a cluster) is not less than
+        the threshold, and it's dropped, so each cluster is collapsed to its first news. The minhash is computed by
+        numpy if installed, otherwise in pure python (slower, the same signatures).
+
+"""
+
+import re
+import time
+import zlib
+import random
+import logging
+
+from array import array
+from itertools import izip
+
+from .spec import DedupPermutations, DedupShingleSize
+from .utils import LazyModule, isModuleInstalled
+from .profiling import profiler
+
+# Numpy (imported when used)
+np = LazyModule("numpy") if isModuleInstalled("numpy") else None
+
+# The mersenne prime of the minhash functions, the products of the hashes are less than 2 ^ 62 (fit in uint64)
+HashPrime = (1 << 31) - 1
+# The steps of the numerical integration of the lsh error probabilities
+IntegrationSteps = 100
+
+WordPattern = re.compile(r"\w+", re.UNICODE)
+
+def integrate(function, start, end):
+    """Integrate the function from start to end (by the midpoint rule)
+    """
+    step = (end - start) / IntegrationSteps
+    return sum(function(start + (i + 0.5) * step) for i in xrange(IntegrationSteps)) * step
+
+def getLSHParameters(threshold, permutations):
+    """Get the lsh parameters of the minimal sum of the false positive and negative probabilities at the threshold
+    Returns:
+        (int, int): The number of bands and the rows of each band
+    """
+    best, bestError = None, None
+    for bands in xrange(1, permutations + 1):
+        rows = permutations // bands
+        falsePositive = integrate(lambda s: 1.0 - (1.0 - s ** rows) ** bands, 0.0, threshold)
+        falseNegative = integrate(lambda s: (1.0 - s ** rows) ** bands, threshold, 1.0)
+        if bestError is None or falsePositive + falseNegative < bestError:
+            best, bestError = (bands, rows), falsePositive + falseNegative
+    return best
+
+class MinHasher(object):
+    """The minhash of the shingles
+    """
+    def __init__(self, permutations = DedupPermutations, shingleSize = DedupShingleSize, useNumPy = None, seed = 1):
+        """Create a new MinHasher
+        Args:
+            permutations(int): The number of the hash functions (the length of the signatures)
+            shingleSize(int): The number of words of a shingle
+            useNumPy(bool): Use numpy or not, None to use numpy if it's installed
+            seed(int): The seed of the hash functions, the signatures of different seeds are not comparable
+        """
+        self.permutations = permutations
+        self.shingleSize = shingleSize
+        self.useNumPy = bool(np) if useNumPy is None else useNumPy
+        # The hash functions: (a * x + b) mod p
+        rand = random.Random(seed)
+        self.hashes = [ (rand.randint(1, HashPrime - 1), rand.randint(0, HashPrime - 1)) for _ in xrange(permutations) ]
+        if self.useNumPy:
+            self.a = np.array([ a for a, _ in self.hashes ], dtype = np.uint64).reshape(-1, 1)
+            self.b = np.array([ b for _, b in self.hashes ], dtype = np.uint64).reshape(-1, 1)
+
+    def getShingles(self, words):
+        """Get the hashes of the shingles of the words (all the words are a shingle if less than the shingle size)
+        Returns:
+            set: The hashes
+        """
+        size = min(self.shingleSize, len(words))
+        return set(zlib.crc32(u" ".join(words[i: i + size]).encode("utf8")) % HashPrime for i in xrange(len(words) - size + 1))
+
+    def getSignature(self, words):
+        """Get the minhash signature of the words
+        Returns:
+            array: The signature, None if no words
+        """
+        if not words:
+            return None
+        shingles = self.getShingles(words)
+        if self.useNumPy:
+            values = np.fromiter(shingles, dtype = np.uint64, count = len(shingles)).reshape(1, -1)
+            return array("L", ((self.a * values + self.b) % np.uint64(HashPrime)).min(axis = 1).tolist())
+        return array("L", ( min((a * x + b) % HashPrime for x in shingles) for a, b in self.hashes ))
+
+class NewsDeduplicator(object):
+    """The near-duplicate news deduplicator
+    """
+    logger = logging.getLogger("newsanalyzer.NewsDeduplicator")
+
+    def __init__(self, threshold, permutations = DedupPermutations, shingleSize = DedupShingleSize, useNumPy = None):
+        """Create a new NewsDeduplicator
+        Args:
+            threshold(float): The jaccard similarity threshold of the duplicates, in (0, 1]
+            permutations(int): The length of the minhash signatures
+            shingleSize(int): The number of words of a shingle
+            useNumPy(bool): Use numpy or not, None to use numpy if it's installed
+        """
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("The dedup threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.hasher = MinHasher(permutations, shingleSize, useNumPy)
+        self.bands, self.rows = getLSHParameters(threshold, permutations)
+        self.buckets = [ {} for _ in xrange(self.bands) ]   # The band hash to the kept news ids of each band
+        self.signatures = []                                # The signatures of the kept news
+        self.duplicates = []                                # The number of duplicates of the kept news
+        self.news = 0
+        self.candidates = 0                                 # The number of the compared candidates
+        self.falseCandidates = 0                            # The number of the compared candidates not similar
+
+    def getWords(self, news):
+        """Get the words of the news (the content, or the title if no content)
+        """
+        return WordPattern.findall(news.content or news.title or u"")
+
+    def getBandHashes(self, signature):
+        """Get the hash of each band of the signature
+        """
+        rows = self.rows
+        return [ hash(tuple(signature[i * rows: (i + 1) * rows])) for i in xrange(self.bands) ]
+
+    def getSimilarity(self, signature, other):
+        """Get the estimated jaccard similarity of two signatures
+        """
+        return sum(1 for x, y in izip(signature, other) if x == y) / float(len(signature))
+
+    def add(self, news):
+        """Add a news
+        Returns:
+            bool: True if the news is kept, False if it's a duplicate of a kept news
+        """
+        self.news += 1
+        signature = self.hasher.getSignature(self.getWords(news))
+        if signature is None:
+            # No words, always kept (and never be a duplicate)
+            return True
+        bandHashes = self.getBandHashes(signature)
+        compared = set()
+        for buckets, bandHash in izip(self.buckets, bandHashes):
+            for newsID in buckets.get(bandHash, ()):
+                if newsID in compared:
+                    continue
+                compared.add(newsID)
+                self.candidates += 1
+                if self.getSimilarity(signature, self.signatures[newsID]) >= self.threshold:
+                    self.duplicates[newsID] += 1
+                    return False
+                self.falseCandidates += 1
+        # Keep the news
+        newsID = len(self.signatures)
+        self.signatures.append(signature)
+        self.duplicates.append(0)
+        for buckets, bandHash in izip(self.buckets, bandHashes):
+            buckets.setdefault(bandHash, []).append(newsID)
+        return True
+
+    def iterUnique(self, newsList):
+        """Iterate the news which are not duplicates
+        Yield:
+            News: The news
+        """
+        record = profiler.getAccumulator("dedup") if profiler.enabled else None
+        for news in newsList:
+            if record:
+                startTime, startCPU = time.time(), time.clock()
+                kept = self.add(news)
+                record.add(time.time() - startTime, time.clock() - startCPU)
+            else:
+                kept = self.add(news)
+            if kept:
+                yield news
+        stats = self.getStats()
+        if record:
+            record.sizes.update(stats)
+        self.logger.info("Deduplicated [%d] news: dropped [%d] duplicates of [%d] clusters (largest [%d] news), compared [%d] candidates ([%d] not similar)",
+            stats["news"], stats["duplicates"], stats["clusters"], stats["largestCluster"], stats["candidates"], stats["falseCandidates"])
+
+    def getStats(self):
+        """Get the statistics
+        Returns:
+            dict: The statistics
+        """
+        return {
+            "news": self.news,
+            "duplicates": sum(self.duplicates),
+            "clusters": sum(1 for x in self.duplicates if x),
+            "largestCluster": max(self.duplicates) + 1 if self.duplicates else 0,
+            "candidates": self.candidates,
+            "falseCandidates": self.falseCandidates,
+            }
@@ -11,70 +11,137 @@
 
 import logging
 
-from csv import DictWriter
-from openpyxl import load_workbook
+from hashlib import sha1
+from datetime import date, datetime
 
-from .spec import SheetCountry, SheetRegion, SheetProvince, SheetCity, SheetNews
+from .spec import SheetCountry, SheetRegion, SheetProvince, SheetCity, SheetNews, NewsColumnTitle, NewsColumnContent, \
+    OutputFormatCSV
+from .output import openTable, ColumnString, ColumnInt, ColumnFloat
 from .model import Country, Region, Province, City, News
 
+# The formats of the date strings
+DateFormats = [ "%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%Y%m%d", u"%Y年%m月%d日" ]
+
+def parseDate(value):
+    """Parse the date of the cell value (a datetime, date or string of the date formats, the time is ignored)
+    Returns:
+        date: The date, None if not a date
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    elif isinstance(value, date):
+        return value
+    elif isinstance(value, basestring):
+        value = value.strip().split(" ")[0].split("T")[0]
+        for dateFormat in DateFormats:
+            try:
+                return datetime.strptime(value, dateFormat).date()
+            except ValueError:
+                pass
+
 class ExcelInput(object):
     """The excel input
     """
     logger = logging.getLogger("newsanalyzer.ExcelInput")
 
-    def __init__(self, filename):
+    def __init__(self, filename, gazetteer = True):
         """Create a new ExcelInput
+        Args:
+            filename(str): The workbook filename
+            gazetteer(bool): Load the gazetteer sheets or not (the workbooks of the news only)
+        NOTE:
+            The workbook is opened in read-only mode. The gazetteer sheets are loaded here, while the news are streamed
+            from the news sheet by iterNews, which closes the workbook when the news are exhausted (and reopens it if
+            called again).
         """
         # Initialize
+        self.filename = filename
         self.countries = []
         self.regions = []
         self.provinces = []
         self.cities = []
-        self.news = []
+        self.gazetteerHash = None
         # Load excel
-        self.workbook = load_workbook(filename)
+        self.workbook = None
+        self.open()
+        if gazetteer:
+            self.loadGazetteer()
+
+    def open(self):
+        """Open the workbook (if not opened)
+        """
+        if not self.workbook:
+            from openpyxl import load_workbook     # Imported here since it takes a while
+            self.workbook = load_workbook(self.filename, read_only = True)
+        return self.workbook
+
+    def close(self):
+        """Close the workbook (the file handle of the read-only mode)
+        """
+        if self.workbook:
+            self.workbook.close()
+            self.workbook = None
+
+    def __enter__(self):
+        """Enter the context
+        """
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        """Exit the context
+        """
+        self.close()
+
+    def loadGazetteer(self):
+        """Load the gazetteer sheets
+        """
         # Get data from workbook
         # Country
         self.logger.info("Load country")
-        countrySheet = self.workbook[SheetCountry]
-        self.loadCountryFromSheet(countrySheet)
+        countryRows = self.readSheet(self.workbook[SheetCountry])
+        self.loadCountryFromSheet(countryRows)
         self.logger.info("Totally load [%d] countries", len(self.countries))
         if self.logger.isEnabledFor(logging.DEBUG):
             for country in self.countries:
                 self.logger.debug("Loaded country: %s", country)
         # Region
         self.logger.info("Load region")
-        regionSheet = self.workbook[SheetRegion]
-        self.loadRegionFromSheet(regionSheet)
+        regionRows = self.readSheet(self.workbook[SheetRegion])
+        self.loadRegionFromSheet(regionRows)
         self.logger.info("Totally load [%d] regions", len(self.regions))
         if self.logger.isEnabledFor(logging.DEBUG):
             for region in self.regions:
                 self.logger.debug("Loaded region: %s", region)
         # Province
         self.logger.info("Load province")
-        provinceSheet = self.workbook[SheetProvince]
-        self.loadProvinceFromSheet(provinceSheet)
+        provinceRows = self.readSheet(self.workbook[SheetProvince])
+        self.loadProvinceFromSheet(provinceRows)
         self.logger.info("Totally load [%d] provinces", len(self.provinces))
         if self.logger.isEnabledFor(logging.DEBUG):
             for province in self.provinces:
                 self.logger.debug("Loaded province: %s", province)
         # City
         self.logger.info("Load city")
-        citySheet = self.workbook[SheetCity]
-        self.loadCityFromSheet(citySheet)
+        cityRows = self.readSheet(self.workbook[SheetCity])
+        self.loadCityFromSheet(cityRows)
         self.logger.info("Totally load [%d] cities", len(self.cities))
         if self.logger.isEnabledFor(logging.DEBUG):
             for city in self.cities:
                 self.logger.debug("Loaded city: %s", city)
+        # Hash of the gazetteer
+        self.gazetteerHash = self.hashSheets([
+            (SheetCountry, countryRows),
+            (SheetRegion, regionRows),
+            (SheetProvince, provinceRows),
+            (SheetCity, cityRows),
+            ])
         # People
-        # News
-        self.logger.info("Load news")
-        newsSheet = self.workbook[SheetNews]
-        self.loadNewsFromSheet(newsSheet)
-        self.logger.info("Totally load [%d] news", len(self.news))
-        if self.logger.isEnabledFor(logging.DEBUG):
-            for news in self.news:
-                self.logger.debug("Loaded news: %s", news)
+
+    @property
+    def news(self):
+        """Get the news (streamed)
+        """
+        return self.iterNews()
 
     def normalize(self, text):
         """Normalize text
@@ -84,116 +151,200 @@ class ExcelInput(object):
         # A tricky way to remove useless spaces
         return text.replace("  ", " ").replace("  ", " ").replace("  ", " ").replace("  ", " ").lower()
 
-    def loadCountryFromSheet(self, sheet):
+    def readSheet(self, sheet, **kwargs):
+        """Read the cell values of the sheet
+        Returns:
+            [ [ object ] ]: The rows
+        """
+        return [ [ cell.value for cell in row ] for row in sheet.iter_rows(**kwargs) ]
+
+    def getCell(self, rows, row, column):
+        """Get the value of the cell (1-based index, the same as openpyxl)
+        """
+        if row <= len(rows) and column <= len(rows[row - 1]):
+            return rows[row - 1][column - 1]
+
+    def hashSheets(self, sheets):
+        """Hash the cell values of the sheets
+        Args:
+            sheets([ (str, rows) ]): The sheet names and rows
+        Returns:
+            str: The hex digest
+        """
+        digest = sha1()
+        for name, rows in sheets:
+            digest.update("\x1d%s" % name.encode("utf8"))
+            for row in rows:
+                digest.update("\x1e")
+                for value in row:
+                    if isinstance(value, unicode):
+                        value = value.encode("utf8")
+                    digest.update("\x1f%r" % value)
+        return digest.hexdigest()
+
+    def loadNamesFromRow(self, rows, row):
+        """Load the name and alias names from the row
+        Returns:
+            (str, [ str ]): The name and the alias (including the name itself)
+        """
+        name = self.normalize(self.getCell(rows, row, 1))
+        if not name:
+            return None, None
+        alias = [ name ]
+        index = 1
+        while True:
+            index += 1
+            aliasName = self.normalize(self.getCell(rows, row, index))
+            if not aliasName:
+                break
+            alias.append(aliasName)
+        return name, alias
+
+    def loadCountryFromSheet(self, rows):
         """Load country from sheet
         """
-        for i in range(sheet.min_row, sheet.max_row + 1):
-            name = self.normalize(sheet.cell(row = i, column = 1).value)
+        for i in range(1, len(rows) + 1):
+            name, alias = self.loadNamesFromRow(rows, i)
             if not name:
                 raise ValueError("Country name must not be empty")
-            alias = [ name ]
-            index = 1
-            while True:
-                index += 1
-                aliasName = self.normalize(sheet.cell(row = i, column = index).value)
-                if not aliasName:
-                    break
-                alias.append(aliasName)
             # Add country
             self.countries.append(Country(name, alias))
 
-    def loadRegionFromSheet(self, sheet):
+    def loadRegionFromSheet(self, rows):
         """Load region from sheet
         """
         # Read name and alias
         index = 0
         while True:
             index += 1
-            name = self.normalize(sheet.cell(row = 1, column = index).value)
-            alias = self.normalize(sheet.cell(row = 2, column = index).value)
+            name = self.normalize(self.getCell(rows, 1, index))
+            alias = self.normalize(self.getCell(rows, 2, index))
             if not name or not alias:
                 break
             self.regions.append(Region(name, [ alias ]))
         # Read countries
-        for i in range(sheet.min_row + 2, sheet.max_row + 1):
+        for i in range(3, len(rows) + 1):
             index = 0
             while True:
                 index += 1
-                country = self.normalize(sheet.cell(row = i, column = index).value)
+                country = self.normalize(self.getCell(rows, i, index))
                 if not country:
                     break
                 self.regions[index - 1].countries.append(country.strip())
 
-    def loadProvinceFromSheet(self, sheet):
+    def loadProvinceFromSheet(self, rows):
         """Load province from sheet
         """
-        for i in range(sheet.min_row, sheet.max_row + 1):
-            name = self.normalize(sheet.cell(row = i, column = 1).value)
+        for i in range(1, len(rows) + 1):
+            name, alias = self.loadNamesFromRow(rows, i)
             if not name:
                 raise ValueError("Province name must not be empty")
-            alias = [ name ]
-            index = 1
-            while True:
-                index += 1
-                aliasName = self.normalize(sheet.cell(row = i, column = index).value)
-                if not aliasName:
-                    break
-                alias.append(aliasName)
-            # Add country
+            # Add province
             self.provinces.append(Province(name, alias))
 
-    def loadCityFromSheet(self, sheet):
-        """Load country from sheet
+    def loadCityFromSheet(self, rows):
+        """Load city from sheet
         """
-        for i in range(sheet.min_row, sheet.max_row + 1):
-            name = self.normalize(sheet.cell(row = i, column = 1).value)
+        for i in range(1, len(rows) + 1):
+            name, alias = self.loadNamesFromRow(rows, i)
             if not name:
                 raise ValueError("City name must not be empty")
-            alias = [ name ]
-            index = 1
-            while True:
-                index += 1
-                aliasName = self.normalize(sheet.cell(row = i, column = index).value)
-                if not aliasName:
-                    break
-                alias.append(aliasName)
-            # Add country
+            # Add city
             self.cities.append(City(name, alias))
 
-    def loadNewsFromSheet(self, sheet):
-        """Load news from sheet
+    def iterNews(self, dateColumn = None):
+        """Iterate the news in the news sheet (only the title and content columns are read)
+        Args:
+            dateColumn(int): The column (1-based) of the publish date to read as well, None to not read
+        Yield:
+            News: The news
         """
-        for i in range(sheet.min_row + 2, sheet.max_row + 1):
-            title = self.normalize(sheet.cell(row = i, column = 6).value)
-            content = self.normalize(sheet.cell(row = i, column = 7).value)
+        self.logger.info("Load news")
+        sheet = self.open()[SheetNews]
+        minColumn = min(dateColumn, NewsColumnTitle) if dateColumn else NewsColumnTitle
+        maxColumn = max(dateColumn, NewsColumnContent) if dateColumn else NewsColumnContent
+        count = 0
+        for row in sheet.iter_rows(min_row = (sheet.min_row or 1) + 2, min_col = minColumn, max_col = maxColumn):
+            values = [ cell.value for cell in row ] + [ None ] * (maxColumn - minColumn + 1)
+            title = self.normalize(values[NewsColumnTitle - minColumn])
+            content = self.normalize(values[NewsColumnContent - minColumn])
             if title and content:
-                self.news.append(News(title.strip(), content.strip()))
+                news = News(title.strip(), content.strip(), parseDate(values[dateColumn - minColumn]) if dateColumn else None)
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Loaded news: %s", news)
+                count += 1
+                yield news
+        self.logger.info("Totally load [%d] news", count)
+        # All news are read
+        self.close()
+
+class ResultWriter(object):
+    """The result writer, the rows are tuples in the order of the fields
+    """
+    def __init__(self, filename, fields, outputFormat = OutputFormatCSV):
+        """Create a new ResultWriter
+        Args:
+            filename(str): The output filename (without the extension, which is got by the output format)
+            fields([ (unicode, str) ]): The field names and column types (see output.Column*)
+            outputFormat(str): The output format, see spec.OutputFormat*
+        """
+        self.table = openTable(filename, fields, outputFormat)
+
+    def write(self, row):
+        """Write a row
+        """
+        self.table.write(row)
+
+    def writeRows(self, rows):
+        """Write the rows
+        """
+        self.table.writeRows(rows)
+
+    def close(self):
+        """Close the writer
+        """
+        self.table.close()
+
+    def __enter__(self):
+        """Enter the context
+        """
+        return self
 
-class KeywordResultWriter(object):
+    def __exit__(self, excType, excValue, traceback):
+        """Exit the context
+        """
+        self.close()
+
+class KeywordResultWriter(ResultWriter):
     """The keyword result writer
     """
     FieldKeyword    = u"关键词"
     FieldTermsCount = u"单词个数"
     FieldTFIDF      = u"TF-IDF"
     FieldFrequency  = u"出现次数"
+    FieldTFIDFError = u"TF-IDF误差上限"
+    FieldFrequencyError = u"出现次数误差上限"
 
-    def __init__(self, outStream):
+    def __init__(self, filename, outputFormat = OutputFormatCSV, approximate = False):
         """Create a new KeywordResultWriter
+        Args:
+            filename(str): The output filename (without the extension)
+            outputFormat(str): The output format
+            approximate(bool): Write the max errors of the approximate counting or not, the rows are:
+                (keyword, terms count, tf-idf, frequency[, tf-idf error, frequency error])
         """
-        self.writer = DictWriter(outStream, fieldnames=[
-            self.FieldKeyword,
-            self.FieldTermsCount,
-            self.FieldTFIDF,
-            self.FieldFrequency,
-            ])
-        self.writer.writeheader()
-
-    def write(self, data):
-        """Write data
-        """
-        self.writer.writerow(data)
+        self.approximate = approximate
+        fields = [
+            (self.FieldKeyword, ColumnString),
+            (self.FieldTermsCount, ColumnInt),
+            (self.FieldTFIDF, ColumnFloat),
+            (self.FieldFrequency, ColumnInt),
+            ]
+        if approximate:
+            fields.extend([ (self.FieldTFIDFError, ColumnFloat), (self.FieldFrequencyError, ColumnInt) ])
+        super(KeywordResultWriter, self).__init__(filename, fields, outputFormat)
 
-class CooccurrenceResultWriter(object):
+class CooccurrenceResultWriter(ResultWriter):
     """The cooccurrence result writer
     """
     FieldKeyword    = u"关键词"
@@ -201,25 +352,30 @@ class CooccurrenceResultWriter(object):
     FieldTermsCount = u"单词个数"
     FieldTFIDF      = u"TF-IDF"
     FieldFrequency  = u"出现次数"
+    FieldTFIDFError = u"TF-IDF误差上限"
+    FieldFrequencyError = u"出现次数误差上限"
 
-    def __init__(self, outStream):
-        """Create a new KeywordResultWriter
-        """
-        self.writer = DictWriter(outStream, fieldnames=[
-            self.FieldKeyword,
-            self.FieldCoword,
-            self.FieldTermsCount,
-            self.FieldTFIDF,
-            self.FieldFrequency,
-            ])
-        self.writer.writeheader()
-
-    def write(self, data):
-        """Write data
+    def __init__(self, filename, outputFormat = OutputFormatCSV, approximate = False):
+        """Create a new CooccurrenceResultWriter
+        Args:
+            filename(str): The output filename (without the extension)
+            outputFormat(str): The output format
+            approximate(bool): Write the max errors of the approximate counting or not, the rows are:
+                (keyword, coword, terms count, tf-idf, frequency[, tf-idf error, frequency error])
         """
-        self.writer.writerow(data)
+        self.approximate = approximate
+        fields = [
+            (self.FieldKeyword, ColumnString),
+            (self.FieldCoword, ColumnString),
+            (self.FieldTermsCount, ColumnInt),
+            (self.FieldTFIDF, ColumnFloat),
+            (self.FieldFrequency, ColumnInt),
+            ]
+        if approximate:
+            fields.extend([ (self.FieldTFIDFError, ColumnFloat), (self.FieldFrequencyError, ColumnInt) ])
+        super(CooccurrenceResultWriter, self).__init__(filename, fields, outputFormat)
 
-class CooccurrenceEntityResultWriter(object):
+class CooccurrenceEntityResultWriter(ResultWriter):
     """The cooccurrence result writer
     """
     FieldKeyword    = u"关键词"
@@ -227,18 +383,43 @@ class CooccurrenceEntityResultWriter(object):
     FieldEntity     = u"相关实体"
     FieldFrequency  = u"出现次数"
 
-    def __init__(self, outStream):
-        """Create a new KeywordResultWriter
+    def __init__(self, filename, outputFormat = OutputFormatCSV):
+        """Create a new CooccurrenceEntityResultWriter
+        Args:
+            filename(str): The output filename (without the extension)
+            outputFormat(str): The output format, the rows are: (keyword, entity type, entity, frequency)
         """
-        self.writer = DictWriter(outStream, fieldnames=[
-            self.FieldKeyword,
-            self.FieldEntityType,
-            self.FieldEntity,
-            self.FieldFrequency,
-            ])
-        self.writer.writeheader()
+        super(CooccurrenceEntityResultWriter, self).__init__(filename, [
+            (self.FieldKeyword, ColumnString),
+            (self.FieldEntityType, ColumnString),
+            (self.FieldEntity, ColumnString),
+            (self.FieldFrequency, ColumnInt),
+            ], outputFormat)
+
+class TrendResultWriter(ResultWriter):
+    """The trend result writer
+    """
+    FieldKeyword    = u"关键词"
+    FieldTermsCount = u"单词个数"
+    FieldTFIDF      = u"TF-IDF"
+    FieldFrequency  = u"出现次数"
+    FieldDocumentFrequency = u"新闻数"
+    FieldVelocity   = u"增长速度"
+    FieldBurst      = u"突发度"
 
-    def write(self, data):
-        """Write data
+    def __init__(self, filename, outputFormat = OutputFormatCSV):
+        """Create a new TrendResultWriter
+        Args:
+            filename(str): The output filename (without the extension)
+            outputFormat(str): The output format, the rows are:
+                (keyword, terms count, tf-idf, frequency, document frequency, velocity, burst)
         """
-        self.writer.writerow(data)
+        super(TrendResultWriter, self).__init__(filename, [
+            (self.FieldKeyword, ColumnString),
+            (self.FieldTermsCount, ColumnInt),
+            (self.FieldTFIDF, ColumnFloat),
+            (self.FieldFrequency, ColumnInt),
+            (self.FieldDocumentFrequency, ColumnInt),
+            (self.FieldVelocity, ColumnFloat),
+            (self.FieldBurst, ColumnFloat),
+            ], outputFormat)
@@ -0,0 +1,293 @@
+# encoding=utf8
+
+""" The idf dictionary
+    Author: lipixun
+    Created Time : 日  2/12 18:41:07 2017
+
+    File Name: idf.py
+    Description:
+
+        The idf table is a binary file which is memory-mapped when loading, so nothing needs to be parsed or copied
+        before analyzing. The layout (little endian):
+
+            header: magic (8 bytes), count (uint64), capacity (uint64)
+            slots:  capacity * (key hash (uint64), idf value (float32))
+
+        It's an open addressing hash table (linear probing) of the md5 based 64-bit hashes of the terms, the capacity
+        is a power of 2 and the empty slots have the hash 0.
+
+        The legacy json dictionary (a list of { "w": word, "v": value }) is still supported, and could be converted to
+        the table.
+
+        The idf could also be got from the document frequency of the analyzed corpus itself (CorpusIDF), and blended
+        with the static idf (BlendedIDF).
+
+        The analyzer looks up the idf by the n-gram keys (see vocab.NGramCodec), so the static idf is resolved in the
+        key space (see getKeyIDF) instead of decoding every key to its terms: the terms of the json dictionary are
+        encoded to the keys once, and the table is looked up by the hashes built from the utf8 terms of the key ids
+        (memoized by the keys, since the keys are looked up again by the other counters). The corpus idf is counted by
+        the keys already.
+
+"""
+
+import os
+import math
+import mmap
+import struct
+
+from hashlib import md5
+
+from .utils import json
+from .vocab import IDBits, IDMask
+from .counting import DocumentsKey
+
+IDFTableMagic = "NAIDF\x00\x01\x00"
+
+HeaderStruct = struct.Struct("<8sQQ")
+SlotStruct = struct.Struct("<Qf")
+HashStruct = struct.Struct("<Q")
+
+# The marker of the keys not looked up yet (None is memoized for the keys not in the table)
+Unresolved = object()
+
+def hashTerm(term):
+    """Hash the term (a word or a tuple of words)
+    Returns:
+        int: The 64-bit hash (never 0)
+    """
+    if isinstance(term, (tuple, list)):
+        term = u"\x1f".join(term)
+    if isinstance(term, unicode):
+        term = term.encode("utf8")
+    return HashStruct.unpack_from(md5(term).digest())[0] or 1
+
+class IDFTable(object):
+    """The memory-mapped idf table
+    """
+    def __init__(self, filename):
+        """Create a new IDFTable
+        """
+        self.filename = filename
+        with open(filename, "rb") as fd:
+            self.data = mmap.mmap(fd.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, self.count, self.capacity = HeaderStruct.unpack_from(self.data)
+        if magic != IDFTableMagic:
+            raise ValueError("Invalid idf table file [%s]" % filename)
+        if len(self.data) != HeaderStruct.size + self.capacity * SlotStruct.size:
+            raise ValueError("Broken idf table file [%s]" % filename)
+        self.mask = self.capacity - 1
+
+    def __len__(self):
+        """Get the number of the terms
+        """
+        return self.count
+
+    def __contains__(self, term):
+        """Check if the term is in the table
+        """
+        return self.get(term) is not None
+
+    def get(self, term, default = None):
+        """Get the idf value of the term
+        """
+        return self.getByHash(hashTerm(term), default)
+
+    def getByHash(self, termHash, default = None):
+        """Get the idf value of the term hash (see hashTerm)
+        """
+        data, unpack, size = self.data, SlotStruct.unpack_from, SlotStruct.size
+        offset = HeaderStruct.size + (termHash & self.mask) * size
+        while True:
+            slotHash, value = unpack(data, offset)
+            if slotHash == termHash:
+                return value
+            elif not slotHash:
+                return default
+            offset += size
+            if offset == len(data):
+                offset = HeaderStruct.size
+
+    def close(self):
+        """Close the table
+        """
+        self.data.close()
+
+class KeyIDFTable(object):
+    """The idf table looked up by the n-gram keys
+    """
+    def __init__(self, table, codec):
+        """Create a new KeyIDFTable
+        Args:
+            table(IDFTable): The idf table
+            codec(NGramCodec): The codec of the n-gram keys
+        """
+        self.table = table
+        self.codec = codec
+        self.values = {}
+        self.termBytes = []
+        self.updateTermBytes()
+
+    def __len__(self):
+        """Get the number of the terms
+        """
+        return len(self.table)
+
+    def __contains__(self, key):
+        """Check if the key is in the table
+        """
+        return self.get(key) is not None
+
+    def get(self, key, default = None):
+        """Get the idf value of the key
+        """
+        value = self.values.get(key, Unresolved)
+        if value is Unresolved:
+            value = self.values[key] = self.table.getByHash(self.hashKey(key))
+        return default if value is None else value
+
+    def hashKey(self, key):
+        """Hash the terms of the key (the same hash as hashTerm of the decoded terms)
+        """
+        termBytes, ids, parts = self.termBytes, key, []
+        try:
+            while ids:
+                parts.append(termBytes[(ids & IDMask) - 1])
+                ids >>= IDBits
+        except IndexError:
+            # The terms added to the vocabulary after created
+            self.updateTermBytes()
+            return self.hashKey(key)
+        parts.reverse()
+        return HashStruct.unpack_from(md5("\x1f".join(parts)).digest())[0] or 1
+
+    def updateTermBytes(self):
+        """Update the utf8 bytes of the vocabulary terms (by the term ids)
+        Returns:
+            list: The bytes of the terms
+        """
+        terms = self.codec.vocabulary.terms
+        self.termBytes.extend(x.encode("utf8") if isinstance(x, unicode) else x for x in terms[len(self.termBytes): ])
+        return self.termBytes
+
+class CorpusIDF(object):
+    """The idf of the analyzed corpus (by the n-gram keys)
+    """
+    def __init__(self, counter):
+        """Create a new CorpusIDF
+        Args:
+            counter(Counter): The document frequency of the n-gram keys (with the number of documents)
+        """
+        self.counter = counter
+        self.documents = float(counter.get(DocumentsKey) or 0)
+
+    def __len__(self):
+        """Get the number of the terms
+        """
+        return len(self.counter) - (DocumentsKey in self.counter)
+
+    def __contains__(self, key):
+        """Check if the key is in the corpus
+        """
+        return self.get(key) is not None
+
+    def get(self, key, default = None):
+        """Get the idf value of the key
+        """
+        count = self.counter.get(key) if key is not DocumentsKey else None
+        if not count:
+            return default
+        return math.log(self.documents / count)
+
+class BlendedIDF(object):
+    """The blended idf of the static and corpus idf (by the n-gram keys)
+    """
+    def __init__(self, static, corpus, weight):
+        """Create a new BlendedIDF
+        Args:
+            static(dict): The static idf of the keys (see getKeyIDF)
+            corpus(CorpusIDF): The corpus idf
+            weight(float): The weight of the corpus idf
+        """
+        self.static = static
+        self.corpus = corpus
+        self.weight = weight
+
+    def __contains__(self, key):
+        """Check if the key is in the static or corpus idf
+        """
+        return self.get(key) is not None
+
+    def get(self, key, default = None):
+        """Get the idf value of the key (the weighted sum if in both idf, otherwise the one has it)
+        """
+        static, corpus = self.static.get(key), self.corpus.get(key)
+        if static is None:
+            return default if corpus is None else corpus
+        if corpus is None:
+            return static
+        return (1.0 - self.weight) * static + self.weight * corpus
+
+def getKeyIDF(idf, codec):
+    """Get the idf of the n-gram keys from the static idf of the terms
+    Args:
+        idf(object): The static idf, dict or IDFTable
+        codec(NGramCodec): The codec of the n-gram keys
+    Returns:
+        object: The idf of the keys, dict or KeyIDFTable
+    """
+    if isinstance(idf, IDFTable):
+        return KeyIDFTable(idf, codec)
+    # The terms not in the vocabulary are not counted, so they're skipped
+    keyIDF = {}
+    for term, value in idf.iteritems():
+        key = codec.encodeTerms(term)
+        if key is not None:
+            keyIDF[key] = value
+    return keyIDF
+
+def writeIDFTable(filename, items):
+    """Write the idf table
+    Args:
+        filename(str): The table filename
+        items(iter): The (term, value) pairs
+    """
+    hashes = [ (hashTerm(term), value) for term, value in items ]
+    capacity = 1
+    while capacity < len(hashes) * 2:
+        capacity <<= 1
+    mask = capacity - 1
+    data = bytearray(HeaderStruct.size + capacity * SlotStruct.size)
+    HeaderStruct.pack_into(data, 0, IDFTableMagic, len(hashes), capacity)
+    for termHash, value in hashes:
+        index = termHash & mask
+        while HashStruct.unpack_from(data, HeaderStruct.size + index * SlotStruct.size)[0]:
+            index = (index + 1) & mask
+        SlotStruct.pack_into(data, HeaderStruct.size + index * SlotStruct.size, termHash, value)
+    # Write to a temp file and rename it, since the old table may be mapped by others
+    tempFilename = "%s.%d.tmp" % (filename, os.getpid())
+    with open(tempFilename, "wb") as fd:
+        fd.write(data)
+    os.rename(tempFilename, filename)
+
+def loadIDFDict(filename):
+    """Load the legacy json idf dictionary
+    Returns:
+        dict: The idf dict
+    """
+    idf = {}
+    with open(filename, "rb") as fd:
+        for item in json.load(fd):
+            w, v = item["w"], item["v"]
+            if isinstance(w, list):
+                w = tuple(w)
+            idf[w] = v
+    return idf
+
+def writeIDFDict(filename, items):
+    """Write the legacy json idf dictionary
+    Args:
+        filename(str): The dictionary filename
+        items(iter): The (term, value) pairs
+    """
+    with open(filename, "wb") as fd:
+        json.dump([ {"w": k, "v": v } for k, v in items ], fd, ensure_ascii = False)
@@ -0,0 +1,303 @@
+# encoding=utf8
+
+""" The incremental idf builder
+    Author: lipixun
+    Created Time : 日  2/12 23:06:44 2017
+
+    File Name: idfbuild.py
+    Description:
+
+        The document frequencies (df) of the n-grams are counted into the state directory, so the idf could be built
+        on any corpus, and updated by adding new documents without recounting the old ones:
+
+            meta.json:      The n, the number of documents, the runs and the sources (the corpora already added)
+            run-*.tsv:      The partial df files, the lines of "term\\tcount" sorted by the term (the words of an
+                            n-gram are joined by \\x1f, utf8 encoded)
+
+        The documents are counted in memory (by the n-gram keys of a vocabulary) until the number of the distinct
+        n-grams reaches the spill size, then spilled to a new run. With multiple workers each chunk of documents is
+        counted by a worker to its own runs. The runs are mergeable, the df of all documents is got by merging the
+        sorted runs in a stream (and the runs are compacted to one when there're too many of them), so the memory is
+        bounded by the spill size instead of the size of the corpus.
+
+        The n-grams of a count not greater than the prune count are dropped when spilling, which keeps the runs small
+        but may under count an n-gram by at most (prune count) * (number of spills), so it's disabled by default.
+
+"""
+
+import os
+import math
+import heapq
+import logging
+
+from uuid import uuid4
+from os.path import isdir, isfile, join
+from itertools import groupby
+from collections import Counter
+from multiprocessing import Pool
+
+from .spec import IDFStatePath, IDFSpillSize
+from .utils import json
+from .vocab import Vocabulary, NGramCodec, IDBits
+from .parallel import iterChunks
+
+# The number of documents in a chunk counted by a worker
+DocumentChunkSize = 10000
+# The max number of runs before compacting them
+MaxRuns = 16
+
+MetaVersion = 1
+
+class RunWriter(object):
+    """The run writer
+    """
+    def __init__(self, path):
+        """Create a new RunWriter
+        """
+        self.path = path
+
+    def write(self, items):
+        """Write a run
+        Args:
+            items(iter): The (term, count) sorted by the (utf8 encoded) term
+        Returns:
+            str: The run filename (relative to the path)
+        """
+        name = "run-%s.tsv" % uuid4().hex
+        tempFilename = join(self.path, name + ".tmp")
+        with open(tempFilename, "wb") as fd:
+            for term, count in items:
+                fd.write("%s\t%d\n" % (term, count))
+        os.rename(tempFilename, join(self.path, name))
+        return name
+
+def iterRun(filename):
+    """Iterate the run
+    Yield:
+        (str, int): The utf8 encoded term and the count
+    """
+    with open(filename, "rb") as fd:
+        for line in fd:
+            term, count = line.rstrip("\n").rsplit("\t", 1)
+            yield term, int(count)
+
+def mergeRuns(filenames):
+    """Merge the runs
+    Yield:
+        (str, int): The utf8 encoded term and the total count, sorted by the term
+    """
+    for term, items in groupby(heapq.merge(*[ iterRun(x) for x in filenames ]), key = lambda (k, v): k):
+        yield term, sum(v for _, v in items)
+
+def encodeTerm(term):
+    """Encode the term (a word or a tuple of words) in the run
+    """
+    if isinstance(term, tuple):
+        term = u"\x1f".join(x.decode("utf8") if isinstance(x, str) else x for x in term)
+    if isinstance(term, unicode):
+        term = term.encode("utf8")
+    return term
+
+def decodeTerm(term):
+    """Decode the term in the run
+    Returns:
+        unicode / tuple: The word or the tuple of words
+    """
+    words = term.decode("utf8").split(u"\x1f")
+    return words[0] if len(words) == 1 else tuple(words)
+
+class DocumentCounter(object):
+    """Count the df of the documents and spill to runs
+    """
+    def __init__(self, path, nGram, spillSize = IDFSpillSize, pruneCount = 0):
+        """Create a new DocumentCounter
+        """
+        self.nGram = nGram
+        self.spillSize = spillSize
+        self.pruneCount = pruneCount
+        self.writer = RunWriter(path)
+        self.reset()
+        self.runs = []
+        self.documents = 0
+
+    def reset(self):
+        """Reset the memory counter
+        """
+        self.vocabulary = Vocabulary()
+        self.codec = NGramCodec(self.vocabulary)
+        self.counter = Counter()
+
+    def add(self, document):
+        """Add a document
+        Args:
+            document([ [ str ] ]): The sentences (terms) of the document, the n-grams won't cross the sentences
+        """
+        add, keys = self.vocabulary.add, set()
+        for sentence in document:
+            ids = [ add(x) for x in sentence ]
+            for i in xrange(len(ids)):
+                key = 0
+                for termID in ids[i: i + self.nGram]:
+                    key = (key << IDBits) | (termID + 1)
+                    keys.add(key)
+        self.counter.update(keys)
+        self.documents += 1
+        if len(self.counter) >= self.spillSize:
+            self.spill()
+
+    def spill(self):
+        """Spill the memory counter to a run
+        """
+        if not self.counter:
+            return
+        decode = self.codec.decode
+        items = sorted((encodeTerm(decode(k)), v) for k, v in self.counter.iteritems() if v > self.pruneCount)
+        self.reset()
+        if items:
+            self.runs.append(self.writer.write(items))
+
+def _countDocuments((path, nGram, spillSize, pruneCount, documents)):
+    """Count a chunk of documents in the worker
+    Returns:
+        (int, [ str ]): The number of the documents and the runs
+    """
+    counter = DocumentCounter(path, nGram, spillSize, pruneCount)
+    for document in documents:
+        counter.add(document)
+    counter.spill()
+    return counter.documents, counter.runs
+
+class IDFBuilder(object):
+    """The incremental idf builder
+    """
+    logger = logging.getLogger("newsanalyzer.IDFBuilder")
+
+    def __init__(self, path = IDFStatePath, nGram = 6, spillSize = IDFSpillSize, pruneCount = 0):
+        """Create a new IDFBuilder
+        Args:
+            path(str): The state directory, the existing state is loaded
+            nGram(int): The max n, must be the same as the existing state
+            spillSize(int): The max number of distinct n-grams counted in memory (of each worker)
+            pruneCount(int): Drop the n-grams of a count not greater than it when spilling
+        """
+        self.path = path
+        self.spillSize = spillSize
+        self.pruneCount = pruneCount
+        self.meta = self.loadMeta()
+        if not self.meta:
+            self.meta = { "version": MetaVersion, "nGram": nGram, "documents": 0, "runs": [], "sources": [] }
+        elif self.meta["nGram"] != nGram:
+            raise ValueError("The idf state [%s] is built with nGram [%d] instead of [%d]" % (path, self.meta["nGram"], nGram))
+        self.nGram = nGram
+
+    @property
+    def documents(self):
+        """The number of documents
+        """
+        return self.meta["documents"]
+
+    def getFilename(self, name):
+        """Get the filename in the state directory
+        """
+        return join(self.path, name)
+
+    def loadMeta(self):
+        """Load the meta
+        Returns:
+            dict: The meta, None if the state not exists
+        """
+        filename = self.getFilename("meta.json")
+        if not isfile(filename):
+            return
+        with open(filename, "rb") as fd:
+            meta = json.load(fd)
+        if meta.get("version") != MetaVersion:
+            raise ValueError("Unsupported idf state version [%s]" % meta.get("version"))
+        return meta
+
+    def saveMeta(self):
+        """Save the meta (and remove the runs not referenced by it)
+        """
+        filename = self.getFilename("meta.json")
+        tempFilename = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tempFilename, "wb") as fd:
+            json.dump(self.meta, fd)
+        os.rename(tempFilename, filename)
+        runs = set(self.meta["runs"])
+        for name in os.listdir(self.path):
+            if name.startswith("run-") and name not in runs:
+                os.remove(self.getFilename(name))
+
+    def hasSource(self, source):
+        """Check if the source (corpus) is already added
+        """
+        return source in self.meta["sources"]
+
+    def addDocuments(self, documents, source = None, workers = 1):
+        """Add the documents
+        Args:
+            documents(iter): The documents, each is a list of sentences (terms)
+            source(str): The name of the source, it's recorded so it won't be added again
+            workers(int): The number of worker processes
+        Returns:
+            int: The number of the documents added
+        """
+        if not isdir(self.path):
+            os.makedirs(self.path)
+        if workers <= 1:
+            counter = DocumentCounter(self.path, self.nGram, self.spillSize, self.pruneCount)
+            for document in documents:
+                counter.add(document)
+            counter.spill()
+            count, runs = counter.documents, counter.runs
+        else:
+            count, runs = 0, []
+            pool = Pool(workers)
+            try:
+                for chunkCount, chunkRuns in pool.imap(_countDocuments, (
+                    (self.path, self.nGram, self.spillSize, self.pruneCount, x) for x in iterChunks(documents, DocumentChunkSize)
+                    )):
+                    count += chunkCount
+                    runs.extend(chunkRuns)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        self.meta["documents"] += count
+        self.meta["runs"].extend(runs)
+        if source:
+            self.meta["sources"].append(source)
+        if len(self.meta["runs"]) > MaxRuns:
+            self.compact()
+        self.saveMeta()
+        self.logger.info("Add [%d] documents to [%d] runs", count, len(runs))
+        return count
+
+    def compact(self):
+        """Compact the runs to one run
+        """
+        if len(self.meta["runs"]) <= 1:
+            return
+        self.logger.info("Compact [%d] runs", len(self.meta["runs"]))
+        name = RunWriter(self.path).write(mergeRuns([ self.getFilename(x) for x in self.meta["runs"] ]))
+        self.meta["runs"] = [ name ]
+
+    def iterDF(self):
+        """Iterate the df of all documents
+        Yield:
+            (unicode / tuple, int): The term and the df
+        """
+        for term, count in mergeRuns([ self.getFilename(x) for x in self.meta["runs"] ]):
+            yield decodeTerm(term), count
+
+    def iterIDF(self, minCount = 3):
+        """Iterate the idf of the terms of a df greater than the min count
+        Yield:
+            (unicode / tuple, float): The term and the idf
+        """
+        documents = float(self.documents)
+        for term, count in self.iterDF():
+            if count > minCount:
+                yield term, math.log(documents / count)
@@ -0,0 +1,233 @@
+# encoding=utf8
+
+""" The news index
+    Author: lipixun
+    Created Time : 日  2/13 04:36:52 2017
+
+    File Name: index.py
+    Description:
+
+        The inverted index of the tokenized paragraphs (see NewsAnalyzer.iterTerms) stored in sqlite. Each term has
+        the postings of (paragraph id, positions), so the paragraphs containing a keyword (the terms in sequence) are
+        found by intersecting the postings, and the co-occurrence analyzers only visit them instead of the whole corpus.
+        The terms of the paragraphs are stored as well, so the visited paragraphs are never tokenized again.
+
+        The global co-occurrence entities count all paragraphs, so the entity counts of all paragraphs (searched by the
+        entity trie tree only) are stored for each gazetteer (by the gazetteer hash), and computed from the stored
+        paragraphs when the gazetteer is new to the index.
+
+        The postings of a term are encoded as an int array of: paragraph id, number of positions, positions, ...
+
+        The hashes of the source workbooks are stored when building, so the index of other (or changed) workbooks is
+        not used by the co-occurrence analyzers.
+
+"""
+
+import os
+import sqlite3
+import logging
+
+from array import array
+from hashlib import md5
+from itertools import islice
+from collections import Counter
+
+IndexVersion = 2
+
+# The max number of the paragraphs read by a query
+ReadBatchSize = 500
+
+def getStopwordsHash(stopwords):
+    """Get the hash of the stopwords
+    """
+    return md5(u"\x00".join(sorted(stopwords)).encode("utf8")).hexdigest()
+
+class NewsIndex(object):
+    """The news index
+    """
+    logger = logging.getLogger("newsanalyzer.NewsIndex")
+
+    def __init__(self, filename, workbooks = None):
+        """Create a new NewsIndex
+        Args:
+            filename(str): The sqlite filename
+            workbooks([ str ]): The hashes of the source workbooks (stored when building, checked when used), not
+                checked if None
+        """
+        self.filename = filename
+        self.workbooks = u" ".join(sorted(workbooks)) if workbooks is not None else None
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        # The paragraphs may be iterated by the task feeding thread of the worker pool (see parallel.mapReduce)
+        self.conn = sqlite3.connect(filename, check_same_thread = False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS paragraphs (id INTEGER PRIMARY KEY, terms TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT PRIMARY KEY, data BLOB)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS gazetteers (gazetteer TEXT PRIMARY KEY)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS entities (gazetteer TEXT, type TEXT, name TEXT, count INTEGER, PRIMARY KEY (gazetteer, type, name))")
+
+    def getMeta(self, key):
+        """Get the meta value
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key, )).fetchone()
+        if row:
+            return row[0]
+
+    @property
+    def paragraphs(self):
+        """Get the number of the paragraphs
+        """
+        return int(self.getMeta("paragraphs") or 0)
+
+    def check(self, tokenizer, stopwords):
+        """Check if the index is built and by the same tokenizer and stopwords
+        """
+        if self.getMeta("version") is None:
+            raise ValueError("The index [%s] is not built, build it by the index command" % self.filename)
+        if int(self.getMeta("version")) != IndexVersion:
+            raise ValueError("The index [%s] is of version [%s], rebuild it by the index command" % (self.filename, self.getMeta("version")))
+        if self.getMeta("tokenizer") != tokenizer.name or self.getMeta("stopwords") != getStopwordsHash(stopwords):
+            raise ValueError("The index [%s] is built by tokenizer [%s], not the same as [%s] (or by different stopwords)" % (self.filename, self.getMeta("tokenizer"), tokenizer.name))
+        if self.workbooks is not None and self.getMeta("workbooks") != self.workbooks:
+            raise ValueError("The index [%s] is built from other workbooks (or the workbooks are changed), rebuild it by the index command" % self.filename)
+
+    def build(self, paragraphs, tokenizer, stopwords):
+        """Build the index (the existing one is replaced)
+        Args:
+            paragraphs(iter): The terms of the paragraphs
+            tokenizer(Tokenizer): The tokenizer of the terms
+            stopwords(set): The stopwords of the terms
+        """
+        for table in ("meta", "paragraphs", "postings", "gazetteers", "entities"):
+            self.conn.execute("DELETE FROM %s" % table)
+        postings = {}
+        count = 0
+        for paragraphID, terms in enumerate(paragraphs):
+            self.conn.execute("INSERT INTO paragraphs (id, terms) VALUES (?, ?)", (paragraphID, u" ".join(terms)))
+            positions = {}
+            for position, term in enumerate(terms):
+                if not term in positions:
+                    positions[term] = []
+                positions[term].append(position)
+            for term, termPositions in positions.iteritems():
+                if not term in postings:
+                    postings[term] = array("i")
+                posting = postings[term]
+                posting.append(paragraphID)
+                posting.append(len(termPositions))
+                posting.extend(termPositions)
+            count += 1
+        self.logger.info("Write postings of [%d] terms of [%d] paragraphs", len(postings), count)
+        self.conn.executemany("INSERT INTO postings (term, data) VALUES (?, ?)", ( (term, buffer(posting.tostring())) for term, posting in postings.iteritems() ))
+        self.conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ("version", str(IndexVersion)),
+            ("tokenizer", tokenizer.name),
+            ("stopwords", getStopwordsHash(stopwords)),
+            ("paragraphs", str(count)),
+            ("workbooks", self.workbooks),
+            ])
+        self.conn.commit()
+
+    def getPostings(self, term):
+        """Get the postings of the term
+        Returns:
+            dict: The paragraph id to positions
+        """
+        row = self.conn.execute("SELECT data FROM postings WHERE term = ?", (term, )).fetchone()
+        postings = {}
+        if row:
+            data = array("i")
+            data.fromstring(str(row[0]))
+            index = 0
+            while index < len(data):
+                count = data[index + 1]
+                postings[data[index]] = data[index + 2: index + 2 + count]
+                index += 2 + count
+        return postings
+
+    def searchPhrase(self, terms):
+        """Search the paragraphs containing the terms in sequence
+        Returns:
+            set: The paragraph ids
+        """
+        if not terms:
+            return set()
+        postings = [ self.getPostings(x) for x in terms ]
+        # Intersect the paragraph ids from the shortest postings
+        paragraphIDs = set(min(postings, key = len))
+        for posting in postings:
+            paragraphIDs.intersection_update(posting)
+        if len(terms) == 1:
+            return paragraphIDs
+        matched = set()
+        for paragraphID in paragraphIDs:
+            positions = [ set(x[paragraphID]) for x in postings[1: ] ]
+            for start in postings[0][paragraphID]:
+                if all(start + i + 1 in x for i, x in enumerate(positions)):
+                    matched.add(paragraphID)
+                    break
+        return matched
+
+    def search(self, phrases):
+        """Search the paragraphs containing any of the phrases
+        Args:
+            phrases([ [ str ] ]): The terms of the phrases
+        Returns:
+            [ int ]: The sorted paragraph ids
+        """
+        paragraphIDs = set()
+        for terms in phrases:
+            paragraphIDs.update(self.searchPhrase(terms))
+        return sorted(paragraphIDs)
+
+    def iterParagraphs(self, paragraphIDs = None):
+        """Iterate the terms of the paragraphs (in the order of the paragraph ids)
+        Args:
+            paragraphIDs([ int ]): The sorted paragraph ids, None for all paragraphs
+        Yield:
+            [ str ]: The terms
+        """
+        if paragraphIDs is None:
+            for (terms, ) in self.conn.execute("SELECT terms FROM paragraphs ORDER BY id"):
+                yield terms.split(" ") if terms else []
+        else:
+            paragraphIDs = iter(paragraphIDs)
+            while True:
+                batch = list(islice(paragraphIDs, ReadBatchSize))
+                if not batch:
+                    break
+                sql = "SELECT terms FROM paragraphs WHERE id IN (%s) ORDER BY id" % ", ".join("?" * len(batch))
+                for (terms, ) in self.conn.execute(sql, batch):
+                    yield terms.split(" ") if terms else []
+
+    def getEntityCounts(self, gazetteer):
+        """Get the entity counts of all paragraphs of the gazetteer
+        Returns:
+            dict: The entity type to Counter of entity names, None if not computed
+        """
+        if not self.conn.execute("SELECT 1 FROM gazetteers WHERE gazetteer = ?", (gazetteer, )).fetchone():
+            return None
+        entities = {}
+        for entType, name, count in self.conn.execute("SELECT type, name, count FROM entities WHERE gazetteer = ?", (gazetteer, )):
+            if not entType in entities:
+                entities[entType] = Counter()
+            entities[entType][name] = count
+        return entities
+
+    def putEntityCounts(self, gazetteer, entities):
+        """Put the entity counts of all paragraphs of the gazetteer
+        Args:
+            gazetteer(str): The gazetteer hash
+            entities(dict): The entity type to Counter of entity names
+        """
+        self.conn.execute("DELETE FROM entities WHERE gazetteer = ?", (gazetteer, ))
+        self.conn.executemany("INSERT INTO entities (gazetteer, type, name, count) VALUES (?, ?, ?, ?)",
+            ( (gazetteer, entType, name, count) for entType, counter in entities.iteritems() for name, count in counter.iteritems() ))
+        self.conn.execute("INSERT OR REPLACE INTO gazetteers (gazetteer) VALUES (?)", (gazetteer, ))
+        self.conn.commit()
+
+    def close(self):
+        """Close the index
+        """
+        self.conn.close()
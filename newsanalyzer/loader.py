@@ -0,0 +1,162 @@
+# encoding=utf8
+
+""" The concurrent workbook loader
+    Author: lipixun
+    Created Time : 日  2/13 06:38:25 2017
+
+    File Name: loader.py
+    Description:
+
+        The news of multiple workbooks are loaded concurrently and merged into one stream. Parsing a workbook by openpyxl
+        is cpu bound, so each workbook is parsed by a loader process (at most the number of loaders at the same time),
+        which sends the news in batches by a bounded queue. The news are yielded in the order of the workbooks: while the
+        news of a workbook are tokenized and counted, the next workbooks are parsed, until their queues are full. So the
+        loading overlaps the counting, the memory is bounded by the queues, and the results are the same as loading the
+        workbooks one by one.
+
+        The gazetteer is loaded from the master workbook only, the other workbooks are opened without it.
+
+"""
+
+import os
+import glob
+import logging
+import traceback
+
+from Queue import Empty
+from collections import deque
+from multiprocessing import Process, Queue
+from os.path import expanduser, isdir, join
+
+from .spec import WorkbookExtensions, LoaderBatchSize, LoaderQueueSize
+
+logger = logging.getLogger("newsanalyzer.loader")
+
+def expandWorkbooks(inputs):
+    """Expand the directories (the workbooks in them) and glob patterns of the inputs
+    Args:
+        inputs([ str ]): The workbook filenames, directories or glob patterns
+    Returns:
+        [ str ]: The workbook filenames (the duplicated ones are removed)
+    """
+    filenames = []
+    for pattern in inputs:
+        pattern = expanduser(pattern)
+        if isdir(pattern):
+            # The workbooks in the directory (not the lock files of excel)
+            matched = sorted(join(pattern, x) for x in os.listdir(pattern) if os.path.splitext(x)[1].lower() in WorkbookExtensions and not x.startswith("~$"))
+        else:
+            matched = sorted(glob.glob(pattern))
+        if not matched:
+            raise ValueError("No input excel file matches [%s]" % pattern)
+        for filename in matched:
+            if not filename in filenames:
+                filenames.append(filename)
+    return filenames
+
+def loadWorkbook(filename, queue, dateColumn, batchSize):
+    """Load the news of the workbook and put them to the queue (run in the loader process)
+    The queue items are:
+        ("news", [ News ]): A batch of news
+        ("done", int): All news are loaded, the number of news
+        ("error", str): Failed to load, the traceback
+    """
+    try:
+        from .excelio import ExcelInput
+        batch, count = [], 0
+        for news in ExcelInput(filename, gazetteer = False).iterNews(dateColumn):
+            batch.append(news)
+            if len(batch) >= batchSize:
+                queue.put(("news", batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            queue.put(("news", batch))
+            count += len(batch)
+        queue.put(("done", count))
+    except Exception:
+        queue.put(("error", traceback.format_exc()))
+
+class WorkbookLoader(object):
+    """The concurrent loader of the news of the workbooks
+    """
+    def __init__(self, filenames, loaders = 2, dateColumn = None, batchSize = LoaderBatchSize, queueSize = LoaderQueueSize):
+        """Create a new WorkbookLoader
+        Args:
+            filenames([ str ]): The workbook filenames
+            loaders(int): The max number of the loader processes at the same time
+            dateColumn(int): The column of the publish date to read as well (see ExcelInput.iterNews)
+            batchSize(int): The number of news in a batch
+            queueSize(int): The max number of batches in the queue of a loader
+        """
+        self.filenames = filenames
+        self.loaders = max(loaders, 1)
+        self.dateColumn = dateColumn
+        self.batchSize = batchSize
+        self.queueSize = queueSize
+
+    def __iter__(self):
+        """Iterate the news
+        """
+        return self.iterNews()
+
+    def start(self, filename):
+        """Start the loader process of the workbook
+        Returns:
+            (str, Process, Queue): The filename, process and queue
+        """
+        queue = Queue(self.queueSize)
+        process = Process(target = loadWorkbook, args = (filename, queue, self.dateColumn, self.batchSize))
+        process.daemon = True
+        process.start()
+        return filename, process, queue
+
+    def get(self, filename, process, queue):
+        """Get an item from the queue of the loader process
+        """
+        while True:
+            try:
+                return queue.get(timeout = 1)
+            except Empty:
+                if not process.is_alive() and queue.empty():
+                    raise ValueError("The loader process of [%s] exited unexpectedly (code %s)" % (filename, process.exitcode))
+
+    def iterNews(self):
+        """Iterate the news in the order of the workbooks
+        Yield:
+            News: The news
+        """
+        logger.info("Load news of [%d] workbooks by [%d] loaders", len(self.filenames), min(self.loaders, len(self.filenames)))
+        filenames = iter(self.filenames)
+        loading = deque()
+        try:
+            for filename in filenames:
+                loading.append(self.start(filename))
+                if len(loading) >= self.loaders:
+                    break
+            total = 0
+            while loading:
+                filename, process, queue = loading[0]
+                while True:
+                    kind, data = self.get(filename, process, queue)
+                    if kind == "news":
+                        for news in data:
+                            yield news
+                    elif kind == "error":
+                        raise ValueError("Failed to load news of [%s]:\n%s" % (filename, data))
+                    else:
+                        logger.info("Loaded [%d] news of [%s]", data, filename)
+                        total += data
+                        break
+                loading.popleft()
+                process.join()
+                # Start the next workbook
+                for filename in filenames:
+                    loading.append(self.start(filename))
+                    break
+            logger.info("Totally load [%d] news of [%d] workbooks", total, len(self.filenames))
+        finally:
+            # Stop the loaders if not finished (failed or closed)
+            for _, process, _ in loading:
+                process.terminate()
+                process.join()
@@ -7,20 +7,30 @@
     File Name: main.py
     Description:
 
+        The modules which take a while to import (the workbook reader, the analyzer, the server and so on) are imported
+        by the subcommands using them, so the startup (and --help) stays fast.
+
 """
 
-import math
+import os
+import shutil
 import logging
 
-from os.path import expanduser, isfile
+from os.path import expanduser, isdir, isfile
+from hashlib import sha1
 from argparse import ArgumentParser
-from collections import Counter
+from itertools import chain
 
-from .spec import IDFDictFilename
-from .utils import nltk, json
-from .model import News, NamedKeyword
-from .excelio import ExcelInput
-from .analyzer import NewsAnalyzer
+from .idf import loadIDFDict, writeIDFDict, writeIDFTable
+from .spec import IDFDictFilename, IDFTableFilename, IDFStatePath, IDFSpillSize, TokenCacheFilename, TokenCacheCapacity, \
+    IDFModeStatic, IDFModeCorpus, IDFModeBlend, IDFBlendWeight, ProfileEngineCProfile, ProfileEnginePyInstrument, \
+    OutputFormatCSV, OutputFormatJSONLines, OutputFormatParquet, OutputFormatArrow, ResultTopTerms, NewsColumnDate, \
+    TrendStoreFilename, TrendPeriodDay, TrendPeriodWeek, TrendSortTFIDF, TrendSortVelocity, TrendSortBurst, TextFormatLines, TextFormatJSONLines, \
+    WorkbookLoaders
+from .utils import nltk, isModuleInstalled
+from .model import NamedKeyword
+from .tokenizer import Tokenizers, NLTKTokenizer, getTokenizer, compareTokenizers
+from .profiling import profiler, ProfiledTokenizer
 
 logger = logging.getLogger("newsanalyzer")
 
@@ -28,35 +38,157 @@ def getArguments(args):
     """Get arguments from args
     """
     parser = ArgumentParser(prog = "newsanalyzer", description = "News Analyzer For WanXuanAo")
+    outputFormats = [ OutputFormatCSV, OutputFormatJSONLines, OutputFormatParquet, OutputFormatArrow ]
     parser.add_argument("--debug", dest = "debug", default = False, action = "store_true", help = "Enable debug mode")
+    parser.add_argument("--no-cache", dest = "noCache", default = False, action = "store_true", help = "Disable the gazetteer cache")
+    parser.add_argument("--tokenizer", dest = "tokenizer", choices = sorted(Tokenizers), default = NLTKTokenizer.name, help = "The tokenizer")
+    parser.add_argument("--token-cache-size", dest = "tokenCacheSize", type = int, default = TokenCacheCapacity, help = "The max number of texts in the memory token cache, 0 to disable")
+    parser.add_argument("--disk-token-cache", dest = "diskTokenCache", default = False, action = "store_true", help = "Enable the disk token cache")
+    parser.add_argument("--profile", dest = "profile", help = "Write the profile report (time, memory and sizes of each stage) as json to the file")
+    parser.add_argument("--profile-hot", dest = "profileHot", help = "Capture the stage (e.g. count) by the profile engine and add the top functions to the profile report")
+    parser.add_argument("--profile-engine", dest = "profileEngine", choices = [ ProfileEngineCProfile, ProfileEnginePyInstrument ], default = ProfileEngineCProfile, help = "The profile engine of the hot stage")
+    parser.add_argument("--profile-hot-output", dest = "profileHotOutput", help = "Write the raw output of the profile engine (cProfile stats or pyinstrument text) to the file")
     subParsers = parser.add_subparsers(dest = "action")
     # Prepare
     _ = subParsers.add_parser("prepare-nltk", help = "Prepare nltk")
-    prepareIDFParser = subParsers.add_parser("prepare-idf", help = "Prepare idf directory")
+    prepareIDFParser = subParsers.add_parser("prepare-idf", help = "Prepare idf (incrementally, by adding the corpora to the document frequency state)")
     prepareIDFParser.add_argument("-n", "--ngram", dest = "nGram", type = int, default = 6, help = "The nGram")
+    prepareIDFParser.add_argument("--format", dest = "format", choices = [ "table", "json" ], default = "table", help = "The idf file format")
+    prepareIDFParser.add_argument("-i", "--input", dest = "inputs", action = "append", help = "Add the news of the excel file to the corpus, could be specified multiple times")
+    prepareIDFParser.add_argument("--no-reuters", dest = "noReuters", default = False, action = "store_true", help = "Do not add the nltk reuters corpus")
+    prepareIDFParser.add_argument("--state", dest = "state", default = IDFStatePath, help = "The document frequency state directory")
+    prepareIDFParser.add_argument("--reset", dest = "reset", default = False, action = "store_true", help = "Remove the existing state before adding")
+    prepareIDFParser.add_argument("-w", "--workers", dest = "workers", type = int, default = 1, help = "The number of worker processes")
+    prepareIDFParser.add_argument("--min-count", dest = "minCount", type = int, default = 3, help = "Keep the terms of a document frequency greater than it")
+    prepareIDFParser.add_argument("--spill-size", dest = "spillSize", type = int, default = IDFSpillSize, help = "The max number of n-grams counted in memory (of each worker) before spilling to disk")
+    prepareIDFParser.add_argument("--prune-count", dest = "pruneCount", type = int, default = 0, help = "Drop the n-grams of a count not greater than it when spilling (may under count them)")
+    convertIDFParser = subParsers.add_parser("convert-idf", help = "Convert the json idf dictionary to the idf table")
+    convertIDFParser.add_argument("-i", "--input", dest = "input", default = IDFDictFilename, help = "Input json idf dictionary")
+    convertIDFParser.add_argument("-o", "--output", dest = "output", default = IDFTableFilename, help = "Output idf table")
+    checkTokenizerParser = subParsers.add_parser("check-tokenizer", help = "Report the differences of the tokenizer to the nltk tokenizer")
+    checkTokenizerParser.add_argument("-i", "--input", dest = "input", required = True, help = "Input excel file")
+    checkTokenizerParser.add_argument("--max-report", dest = "maxReport", type = int, default = 20, help = "The max number of differences to report")
     # keyword
     keywordParser = subParsers.add_parser("keyword", help = "Run keyword analyzer")
-    keywordParser.add_argument("-i", "--input", dest = "input", required = True, help = "Input excel file")
-    keywordParser.add_argument("--text-title-input", dest = "textTitleInput", help = "The text title input")
-    keywordParser.add_argument("--text-content-input", dest = "textContentInput", help = "The text content input")
+    keywordParser.add_argument("-i", "--input", dest = "inputs", action = "append", required = True, help = "Input excel file, a directory (of the excel files) or a glob pattern, could be specified multiple times")
+    keywordParser.add_argument("--gazetteer", dest = "gazetteer", help = "The excel file of the gazetteer (the first input if not specified), the gazetteer of the other inputs are not read")
+    keywordParser.add_argument("--loaders", dest = "loaders", type = int, default = WorkbookLoaders, help = "The number of processes loading the input excel files concurrently (if multiple)")
+    keywordParser.add_argument("-w", "--workers", dest = "workers", type = int, default = 1, help = "The number of worker processes")
+    keywordParser.add_argument("--output-format", dest = "outputFormat", choices = outputFormats, default = OutputFormatCSV, help = "The output format (parquet and arrow require pyarrow), the extension is added to the output files")
+    keywordParser.add_argument("--top", dest = "top", type = int, default = ResultTopTerms, help = "The number of the top terms (entities) of each group to write, 0 to write all")
+    keywordParser.add_argument("--text-title-input", dest = "textTitleInput", action = "append", help = "The text title input (a title per line, or the json lines of the title field), could be a glob pattern or - for stdin, gzip or zstd compressed, could be specified multiple times")
+    keywordParser.add_argument("--text-content-input", dest = "textContentInput", action = "append", help = "The text content input (a content per line, or the json lines of the content field), could be a glob pattern or - for stdin, gzip or zstd compressed, could be specified multiple times")
+    keywordParser.add_argument("--text-input", dest = "textInput", action = "append", help = "The json lines text input of the title and content fields, could be a glob pattern or - for stdin, gzip or zstd compressed, could be specified multiple times")
+    keywordParser.add_argument("--text-format", dest = "textFormat", choices = [ TextFormatLines, TextFormatJSONLines ], help = "The format of the text inputs, detected by the extensions (.jsonl or .json) if not specified")
+    keywordParser.add_argument("--dedup-threshold", dest = "dedupThreshold", type = float, help = "Drop the near-duplicate news of the jaccard similarity (of the word shingles) not less than it to the kept ones, in (0, 1]")
     keywordParser.add_argument("-n", "--ngram", dest = "nGram", type = int, default = 6, help = "The nGram")
+    keywordParser.add_argument("--approximate", dest = "capacity", type = int, default = 0, help = "Count approximately by the space-saving top-k sketches of the capacity (of each n), 0 to count exactly")
+    keywordParser.add_argument("--idf", dest = "idfMode", choices = [ IDFModeStatic, IDFModeCorpus, IDFModeBlend ], default = IDFModeStatic, help = "Use the static idf, the idf of the analyzed news, or blend them")
+    keywordParser.add_argument("--idf-weight", dest = "idfWeight", type = float, default = IDFBlendWeight, help = "The weight of the idf of the analyzed news when blending")
+    keywordParser.add_argument("--count-min", dest = "countMin", type = int, nargs = 2, metavar = ("WIDTH", "DEPTH"), help = "Tighten the approximate counts by the count-min sketches of the width and depth (single worker only)")
+    keywordParser.add_argument("--no-numpy", dest = "noNumPy", default = False, action = "store_true", help = "Count n-grams in pure python even if numpy is installed")
     keywordParser.add_argument("--output-title", dest = "outputTitle", default = "~/Desktop/keywords-title", help = "Mined from title output file")
     keywordParser.add_argument("--output-content", dest = "outputContent", default = "~/Desktop/keywords-content", help = "Mined from content output file")
     # Cooccurrence
     cooccurrenceParser = subParsers.add_parser("cooccurrence", help = "Run co-occurrence analyzer")
-    cooccurrenceParser.add_argument("-i", "--input", dest = "input", required = True, help = "Input excel file")
-    cooccurrenceParser.add_argument("--text-content-input", dest = "textContentInput", help = "The text content input")
+    cooccurrenceParser.add_argument("-i", "--input", dest = "inputs", action = "append", required = True, help = "Input excel file, a directory (of the excel files) or a glob pattern, could be specified multiple times")
+    cooccurrenceParser.add_argument("--gazetteer", dest = "gazetteer", help = "The excel file of the gazetteer (the first input if not specified), the gazetteer of the other inputs are not read")
+    cooccurrenceParser.add_argument("--loaders", dest = "loaders", type = int, default = WorkbookLoaders, help = "The number of processes loading the input excel files concurrently (if multiple)")
+    cooccurrenceParser.add_argument("-w", "--workers", dest = "workers", type = int, default = 1, help = "The number of worker processes")
+    cooccurrenceParser.add_argument("--output-format", dest = "outputFormat", choices = outputFormats, default = OutputFormatCSV, help = "The output format (parquet and arrow require pyarrow), the extension is added to the output files")
+    cooccurrenceParser.add_argument("--top", dest = "top", type = int, default = ResultTopTerms, help = "The number of the top terms (entities) of each group to write, 0 to write all")
+    cooccurrenceParser.add_argument("--text-content-input", dest = "textContentInput", action = "append", help = "The text content input (a content per line, or the json lines of the content field), could be a glob pattern or - for stdin, gzip or zstd compressed, could be specified multiple times")
+    cooccurrenceParser.add_argument("--text-format", dest = "textFormat", choices = [ TextFormatLines, TextFormatJSONLines ], help = "The format of the text inputs, detected by the extensions (.jsonl or .json) if not specified")
+    cooccurrenceParser.add_argument("--dedup-threshold", dest = "dedupThreshold", type = float, help = "Drop the near-duplicate news of the jaccard similarity (of the word shingles) not less than it to the kept ones, in (0, 1]")
     cooccurrenceParser.add_argument("-n", "--ngram", dest = "nGram", type = int, default = 6, help = "The nGram")
+    cooccurrenceParser.add_argument("--approximate", dest = "capacity", type = int, default = 0, help = "Count approximately by the space-saving top-k sketches of the capacity (of each n), 0 to count exactly")
+    cooccurrenceParser.add_argument("--idf", dest = "idfMode", choices = [ IDFModeStatic, IDFModeCorpus, IDFModeBlend ], default = IDFModeStatic, help = "Use the static idf, the idf of the analyzed news, or blend them")
+    cooccurrenceParser.add_argument("--idf-weight", dest = "idfWeight", type = float, default = IDFBlendWeight, help = "The weight of the idf of the analyzed news when blending")
+    cooccurrenceParser.add_argument("--count-min", dest = "countMin", type = int, nargs = 2, metavar = ("WIDTH", "DEPTH"), help = "Tighten the approximate counts by the count-min sketches of the width and depth (single worker only)")
     cooccurrenceParser.add_argument("-o", "--output", dest = "output", default = "~/Desktop/cooccurrence", help = "Output file")
+    cooccurrenceParser.add_argument("--index", dest = "index", help = "Only count the paragraphs of the keywords in the index (built by the index command) instead of the news")
     cooccurrenceParser.add_argument("words", nargs = "*", help = "The words")
     # Cooccurrence entity
     cooccurrenceEntityParser = subParsers.add_parser("cooccurrence-entity", help = "Run co-occurrence entity analyzer")
-    cooccurrenceEntityParser.add_argument("-i", "--input", dest = "input", required = True, help = "Input excel file")
-    cooccurrenceEntityParser.add_argument("--text-content-input", dest = "textContentInput", help = "The text content input")
+    cooccurrenceEntityParser.add_argument("-i", "--input", dest = "inputs", action = "append", required = True, help = "Input excel file, a directory (of the excel files) or a glob pattern, could be specified multiple times")
+    cooccurrenceEntityParser.add_argument("--gazetteer", dest = "gazetteer", help = "The excel file of the gazetteer (the first input if not specified), the gazetteer of the other inputs are not read")
+    cooccurrenceEntityParser.add_argument("--loaders", dest = "loaders", type = int, default = WorkbookLoaders, help = "The number of processes loading the input excel files concurrently (if multiple)")
+    cooccurrenceEntityParser.add_argument("-w", "--workers", dest = "workers", type = int, default = 1, help = "The number of worker processes")
+    cooccurrenceEntityParser.add_argument("--output-format", dest = "outputFormat", choices = outputFormats, default = OutputFormatCSV, help = "The output format (parquet and arrow require pyarrow), the extension is added to the output files")
+    cooccurrenceEntityParser.add_argument("--top", dest = "top", type = int, default = ResultTopTerms, help = "The number of the top terms (entities) of each group to write, 0 to write all")
+    cooccurrenceEntityParser.add_argument("--text-content-input", dest = "textContentInput", action = "append", help = "The text content input (a content per line, or the json lines of the content field), could be a glob pattern or - for stdin, gzip or zstd compressed, could be specified multiple times")
+    cooccurrenceEntityParser.add_argument("--text-format", dest = "textFormat", choices = [ TextFormatLines, TextFormatJSONLines ], help = "The format of the text inputs, detected by the extensions (.jsonl or .json) if not specified")
+    cooccurrenceEntityParser.add_argument("--dedup-threshold", dest = "dedupThreshold", type = float, help = "Drop the near-duplicate news of the jaccard similarity (of the word shingles) not less than it to the kept ones, in (0, 1]")
     cooccurrenceEntityParser.add_argument("-o", "--output", dest = "output", default = "~/Desktop/cooccurrence-entity", help = "Output file")
+    cooccurrenceEntityParser.add_argument("--index", dest = "index", help = "Only count the paragraphs of the keywords in the index (built by the index command) instead of the news")
     cooccurrenceEntityParser.add_argument("words", nargs = "*", help = "The words")
+    # Index
+    indexParser = subParsers.add_parser("index", help = "Build the index of the news paragraphs for the co-occurrence analyzers")
+    indexParser.add_argument("-i", "--input", dest = "inputs", action = "append", required = True, help = "Input excel file, a directory (of the excel files) or a glob pattern, could be specified multiple times")
+    indexParser.add_argument("--gazetteer", dest = "gazetteer", help = "The excel file of the gazetteer (the first input if not specified), the gazetteer of the other inputs are not read")
+    indexParser.add_argument("--loaders", dest = "loaders", type = int, default = WorkbookLoaders, help = "The number of processes loading the input excel files concurrently (if multiple)")
+    indexParser.add_argument("--text-content-input", dest = "textContentInput", action = "append", help = "The text content input (a content per line, or the json lines of the content field), could be a glob pattern or - for stdin, gzip or zstd compressed, could be specified multiple times")
+    indexParser.add_argument("--text-format", dest = "textFormat", choices = [ TextFormatLines, TextFormatJSONLines ], help = "The format of the text inputs, detected by the extensions (.jsonl or .json) if not specified")
+    indexParser.add_argument("--dedup-threshold", dest = "dedupThreshold", type = float, help = "Drop the near-duplicate news of the jaccard similarity (of the word shingles) not less than it to the kept ones, in (0, 1]")
+    indexParser.add_argument("-o", "--output", dest = "output", required = True, help = "The index file (replaced if exists)")
+    # Trend
+    trendParser = subParsers.add_parser("trend", help = "Add the news of the new days to the trend store and get the trends of the last periods")
+    trendParser.add_argument("-i", "--input", dest = "inputs", action = "append", help = "Input excel file, a directory or a glob pattern (could be specified multiple times), the news of the days not in the store are added (only the stored days are analyzed if not specified)")
+    trendParser.add_argument("--gazetteer", dest = "gazetteer", help = "The excel file of the gazetteer (the first input if not specified), the gazetteer of the other inputs are not read")
+    trendParser.add_argument("--loaders", dest = "loaders", type = int, default = WorkbookLoaders, help = "The number of processes loading the input excel files concurrently (if multiple)")
+    trendParser.add_argument("-w", "--workers", dest = "workers", type = int, default = 1, help = "The number of worker processes")
+    trendParser.add_argument("--date-column", dest = "dateColumn", type = int, default = NewsColumnDate, help = "The column (1-based) of the publish date in the news sheet")
+    trendParser.add_argument("--store", dest = "store", default = TrendStoreFilename, help = "The trend store file")
+    trendParser.add_argument("--replace", dest = "replace", default = False, action = "store_true", help = "Recount the days of the input already in the store")
+    trendParser.add_argument("-n", "--ngram", dest = "nGram", type = int, default = 3, help = "The nGram (of the new store, the existing store must be counted by the same nGram)")
+    trendParser.add_argument("--field", dest = "field", choices = [ "title", "content" ], default = "content", help = "Get the trends of the titles or contents")
+    trendParser.add_argument("--period", dest = "period", choices = [ TrendPeriodDay, TrendPeriodWeek ], default = TrendPeriodDay, help = "The period of the window and history")
+    trendParser.add_argument("--window", dest = "window", type = int, default = 7, help = "The number of periods of the window")
+    trendParser.add_argument("--history", dest = "history", type = int, default = 28, help = "The number of periods before the window to get the burst scores")
+    trendParser.add_argument("--until", dest = "until", help = "The window ends at the period of the date (YYYY-MM-DD), the last stored day if not specified")
+    trendParser.add_argument("--min-count", dest = "minCount", type = int, default = 2, help = "The min frequency of the terms in the window")
+    trendParser.add_argument("--sort", dest = "sort", choices = [ TrendSortTFIDF, TrendSortVelocity, TrendSortBurst ], default = TrendSortBurst, help = "Get the top terms by the score")
+    trendParser.add_argument("--output-format", dest = "outputFormat", choices = outputFormats, default = OutputFormatCSV, help = "The output format (parquet and arrow require pyarrow), the extension is added to the output files")
+    trendParser.add_argument("--top", dest = "top", type = int, default = ResultTopTerms, help = "The number of the top terms (entities) of each group to write, 0 to write all")
+    trendParser.add_argument("-o", "--output", dest = "output", default = "~/Desktop/trends", help = "Output file")
+    # All
+    analyzeAllParser = subParsers.add_parser("analyze-all", help = "Run keyword, co-occurrence and co-occurrence entity analyzers in one pass")
+    analyzeAllParser.add_argument("-i", "--input", dest = "inputs", action = "append", required = True, help = "Input excel file, a directory (of the excel files) or a glob pattern, could be specified multiple times")
+    analyzeAllParser.add_argument("--gazetteer", dest = "gazetteer", help = "The excel file of the gazetteer (the first input if not specified), the gazetteer of the other inputs are not read")
+    analyzeAllParser.add_argument("--loaders", dest = "loaders", type = int, default = WorkbookLoaders, help = "The number of processes loading the input excel files concurrently (if multiple)")
+    analyzeAllParser.add_argument("-w", "--workers", dest = "workers", type = int, default = 1, help = "The number of worker processes")
+    analyzeAllParser.add_argument("--output-format", dest = "outputFormat", choices = outputFormats, default = OutputFormatCSV, help = "The output format (parquet and arrow require pyarrow), the extension is added to the output files")
+    analyzeAllParser.add_argument("--top", dest = "top", type = int, default = ResultTopTerms, help = "The number of the top terms (entities) of each group to write, 0 to write all")
+    analyzeAllParser.add_argument("--text-title-input", dest = "textTitleInput", action = "append", help = "The text title input (a title per line, or the json lines of the title field), could be a glob pattern or - for stdin, gzip or zstd compressed, could be specified multiple times")
+    analyzeAllParser.add_argument("--text-content-input", dest = "textContentInput", action = "append", help = "The text content input (a content per line, or the json lines of the content field), could be a glob pattern or - for stdin, gzip or zstd compressed, could be specified multiple times")
+    analyzeAllParser.add_argument("--text-input", dest = "textInput", action = "append", help = "The json lines text input of the title and content fields, could be a glob pattern or - for stdin, gzip or zstd compressed, could be specified multiple times")
+    analyzeAllParser.add_argument("--text-format", dest = "textFormat", choices = [ TextFormatLines, TextFormatJSONLines ], help = "The format of the text inputs, detected by the extensions (.jsonl or .json) if not specified")
+    analyzeAllParser.add_argument("--dedup-threshold", dest = "dedupThreshold", type = float, help = "Drop the near-duplicate news of the jaccard similarity (of the word shingles) not less than it to the kept ones, in (0, 1]")
+    analyzeAllParser.add_argument("-n", "--ngram", dest = "nGram", type = int, default = 6, help = "The nGram")
+    analyzeAllParser.add_argument("--no-numpy", dest = "noNumPy", default = False, action = "store_true", help = "Count n-grams in pure python even if numpy is installed")
+    analyzeAllParser.add_argument("--approximate", dest = "capacity", type = int, default = 0, help = "Count approximately by the space-saving top-k sketches of the capacity (of each n), 0 to count exactly")
+    analyzeAllParser.add_argument("--idf", dest = "idfMode", choices = [ IDFModeStatic, IDFModeCorpus, IDFModeBlend ], default = IDFModeStatic, help = "Use the static idf, the idf of the analyzed news, or blend them")
+    analyzeAllParser.add_argument("--idf-weight", dest = "idfWeight", type = float, default = IDFBlendWeight, help = "The weight of the idf of the analyzed news when blending")
+    analyzeAllParser.add_argument("--count-min", dest = "countMin", type = int, nargs = 2, metavar = ("WIDTH", "DEPTH"), help = "Tighten the approximate counts by the count-min sketches of the width and depth (single worker only)")
+    analyzeAllParser.add_argument("--output-title", dest = "outputTitle", default = "~/Desktop/keywords-title", help = "Mined from title output file")
+    analyzeAllParser.add_argument("--output-content", dest = "outputContent", default = "~/Desktop/keywords-content", help = "Mined from content output file")
+    analyzeAllParser.add_argument("--output-cooccurrence", dest = "outputCooccurrence", default = "~/Desktop/cooccurrence", help = "Co-occurrence output file")
+    analyzeAllParser.add_argument("--output-cooccurrence-entity", dest = "outputCooccurrenceEntity", default = "~/Desktop/cooccurrence-entity", help = "Co-occurrence entity output file")
+    analyzeAllParser.add_argument("words", nargs = "*", help = "The words")
+    # Serve
+    serveParser = subParsers.add_parser("serve", help = "Serve the analysis jobs over http or unix socket")
+    serveParser.add_argument("-i", "--input", dest = "input", required = True, help = "Input excel file (of the gazetteer)")
+    serveParser.add_argument("-w", "--workers", dest = "workers", type = int, default = 4, help = "The number of worker processes, 0 to run the jobs one by one in the server process")
+    serveParser.add_argument("-n", "--ngram", dest = "nGram", type = int, default = 6, help = "The default nGram")
+    serveParser.add_argument("--host", dest = "host", default = "127.0.0.1", help = "The http host")
+    serveParser.add_argument("--port", dest = "port", type = int, default = 8400, help = "The http port")
+    serveParser.add_argument("--unix-socket", dest = "unixSocket", help = "Serve on the unix socket instead of http")
     # Done
-    return parser.parse_args(args)
+    args = parser.parse_args(args)
+    # Check the optional dependencies of the options before running anything
+    if getattr(args, "outputFormat", None) in (OutputFormatParquet, OutputFormatArrow) and not isModuleInstalled("pyarrow"):
+        parser.error("The [%s] output format requires pyarrow, install by: pip install pyarrow" % args.outputFormat)
+    return args
 
 def main(args):
     """The application main entry
@@ -66,17 +198,40 @@ def main(args):
         logging.basicConfig(format = "%(asctime)s - %(levelname)s - %(name)s - %(message)s", level = logging.DEBUG)
     else:
         logging.basicConfig(format = "%(asctime)s - %(levelname)s - %(name)s - %(message)s", level = logging.INFO)
-    # Check actions
+    if not args.profile:
+        return runAction(args)
+    # Run with the profiler
+    profiler.enable(args.profileHot, args.profileEngine, normalizeFilename(args.profileHotOutput) if args.profileHotOutput else None)
+    try:
+        return runAction(args)
+    finally:
+        profiler.write(normalizeFilename(args.profile), args.action)
+
+def runAction(args):
+    """Run the action in args
+    """
     if args.action == "prepare-nltk":
         prepareNLTK(args)
     elif args.action == "prepare-idf":
         prepareIDF(args)
+    elif args.action == "convert-idf":
+        convertIDF(args)
+    elif args.action == "check-tokenizer":
+        return checkTokenizer(args)
     elif args.action == "keyword":
         return getKeyWords(args)
     elif args.action == "cooccurrence":
         return cooccurrence(args)
     elif args.action == "cooccurrence-entity":
         return cooccurrenceEntity(args)
+    elif args.action == "index":
+        return buildIndex(args)
+    elif args.action == "trend":
+        return trend(args)
+    elif args.action == "analyze-all":
+        return analyzeAll(args)
+    elif args.action == "serve":
+        return serve(args)
     else:
         raise ValueError("Unknown action [%s]" % args.action)
 
@@ -87,65 +242,218 @@ def prepareNLTK(_):
     nltk.download()
 
 def prepareIDF(args):
-    """Prepare for idf
-    """
-    logger.info("Start prepare idf directory (by calculating on nltk reuters corpus)")
-    # Count word per paragraph
-    counter = Counter()
-    paragraphCount = 0
-    for paras in nltk.corpus.reuters.paras():
-        words = set()
-        for sentence in paras:
-            for i in range(len(sentence)):
-                for j in range(1, args.nGram + 1):
-                    terms = [ x.lower() for x in sentence[i: i+j] ]
-                    if len(terms) != j:
-                        break
-                    if len(terms) == 1:
-                        words.add(terms[0])
-                    else:
-                        words.add(tuple(terms))
-        for word in words:
-            counter[word] += 1
-        paragraphCount += 1
-    # Calculate IDF score
-    idf = {}
-    for word, count in counter.iteritems():
-        if count > 3:
-            idf[word] = math.log(float(paragraphCount) / float(count))
-    with open(IDFDictFilename, "wb") as fd:
-        json.dump([ {"w": k, "v": v } for k, v in idf.iteritems() ], fd, ensure_ascii = False)
+    """Prepare for idf (by adding the corpora not added yet to the document frequency state)
+    """
+    from .excelio import ExcelInput
+    from .idfbuild import IDFBuilder
+    state = normalizeFilename(args.state)
+    if args.reset and isdir(state):
+        logger.info("Remove idf state [%s]", state)
+        shutil.rmtree(state)
+    builder = IDFBuilder(state, args.nGram, args.spillSize, args.pruneCount)
+    # The nltk reuters corpus, a document per paragraph
+    if not args.noReuters:
+        if builder.hasSource("nltk:reuters"):
+            logger.info("Skip nltk reuters corpus (already added)")
+        else:
+            logger.info("Add nltk reuters corpus")
+            with profiler.stage("count") as stage:
+                documents = ( [ [ x.lower() for x in sentence ] for sentence in paras ] for paras in stage.iterate(nltk.corpus.reuters.paras()) )
+                builder.addDocuments(documents, "nltk:reuters", args.workers)
+    # The news, a document per paragraph
+    if args.inputs:
+        tokenizer = createTokenizer(args)
+        stopwords = set(nltk.corpus.stopwords.words("english"))
+        try:
+            for filename in args.inputs:
+                filename = normalizeFilename(filename)
+                source = "excel:%s" % hashFile(filename)
+                if builder.hasSource(source):
+                    logger.info("Skip news of [%s] (already added)", filename)
+                    continue
+                logger.info("Add news of [%s]", filename)
+                with profiler.stage("count") as stage:
+                    documents = ( [ list(tokenizer.tokenize(x, stopwords)) ] for x in stage.iterate(iterParagraphs(loadNews(ExcelInput(filename)))) )
+                    builder.addDocuments(documents, source, args.workers)
+        finally:
+            tokenizer.close()
+    # Write idf
+    logger.info("Write idf of [%d] documents", builder.documents)
+    with profiler.stage("write", builder.documents):
+        if args.format == "table":
+            writeIDFTable(IDFTableFilename, builder.iterIDF(args.minCount))
+        else:
+            writeIDFDict(IDFDictFilename, builder.iterIDF(args.minCount))
+            if isfile(IDFTableFilename):
+                # The table is preferred when loading, don't leave a stale one
+                logger.info("Remove the stale idf table [%s]", IDFTableFilename)
+                os.remove(IDFTableFilename)
+
+def convertIDF(args):
+    """Convert the json idf dictionary to the idf table
+    """
+    logger.info("Convert idf dictionary [%s] to table [%s]", args.input, args.output)
+    idf = loadIDFDict(normalizeFilename(args.input))
+    writeIDFTable(normalizeFilename(args.output), idf.iteritems())
+    logger.info("Totally convert [%d] terms", len(idf))
+
+def hashFile(filename):
+    """Get the sha1 of the file content
+    """
+    digest = sha1()
+    with open(filename, "rb") as fd:
+        for block in iter(lambda: fd.read(1 << 20), ""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iterParagraphs(newsList):
+    """Iterate the content paragraphs of the news
+    """
+    for news in newsList:
+        if news.content:
+            for paragraph in [ x.strip() for x in news.content.split("\n") ]:
+                if paragraph:
+                    yield paragraph
+
+def iterTexts(newsList):
+    """Iterate the titles, contents and the content paragraphs of the news (the texts tokenized by analyzers)
+    """
+    for news in newsList:
+        if news.title:
+            yield news.title
+        if news.content:
+            yield news.content
+            for paragraph in [ x.strip() for x in news.content.split("\n") ]:
+                if paragraph:
+                    yield paragraph
+
+def checkTokenizer(args):
+    """Check the tokenizer by comparing to the nltk tokenizer
+    """
+    from .excelio import ExcelInput
+    tokenizer, reference = getTokenizer(args.tokenizer), NLTKTokenizer()
+    logger.info("Check tokenizer [%s] against [%s]", tokenizer.name, reference.name)
+    stopwords = set(nltk.corpus.stopwords.words("english"))
+    differences = 0
+    for text, terms, referenceTerms in compareTokenizers(tokenizer, reference, iterTexts(loadNews(ExcelInput(args.input))), stopwords):
+        differences += 1
+        if differences <= args.maxReport:
+            logger.warn("Different terms of text: %s\n\t%s: %s\n\t%s: %s", text, tokenizer.name, " ".join(terms), reference.name, " ".join(referenceTerms))
+    logger.info("Totally found [%d] different texts", differences)
+    return differences
+
+def loadExcel(filename):
+    """Load the excel (the gazetteer, while the news are streamed by loadNews)
+    """
+    from .excelio import ExcelInput
+    logger.info("Load excel")
+    with profiler.stage("excel-load"):
+        return ExcelInput(filename)
 
 def loadNews(excelInput):
-    """Load news
+    """Load news (streamed)
     """
-    logger.info("Load news")
-    return list(excelInput.news)
+    return excelInput.iterNews()
 
-def normalizeFilename(filename):
-    """Normalize filename
+def loadInputs(args):
+    """Load the gazetteer excel and get the input excel files in args
+    Returns:
+        (ExcelInput, [ str ]): The excel of the gazetteer, and the input excel files
     """
-    return expanduser(filename)
+    from .loader import expandWorkbooks
+    filenames = expandWorkbooks(args.inputs)
+    excelInput = loadExcel(normalizeFilename(args.gazetteer) if args.gazetteer else filenames[0])
+    return excelInput, filenames
+
+def loadWorkbookNews(excelInput, filenames, args, dateColumn = None):
+    """Load the news of the input excel files (streamed), loaded concurrently if multiple
+    """
+    from .loader import WorkbookLoader
+    if filenames == [ excelInput.filename ]:
+        return excelInput.iterNews(dateColumn)
+    # The news of the gazetteer workbook (if it's an input) are loaded by the loaders
+    excelInput.close()
+    return WorkbookLoader(filenames, args.loaders, dateColumn).iterNews()
+
+def loadInputNews(excelInput, filenames, args):
+    """Load the news of the input excel files and the text inputs (if any) in args (streamed)
+    """
+    from .textio import TextSource
+    news = loadWorkbookNews(excelInput, filenames, args)
+    textFormat = getattr(args, "textFormat", None)
+    for inputs, field in ((getattr(args, "textTitleInput", None), "title"), (getattr(args, "textContentInput", None), "content"), (getattr(args, "textInput", None), None)):
+        if inputs:
+            news = chain(news, TextSource(inputs, field, textFormat))
+    if getattr(args, "dedupThreshold", None) is not None:
+        news = dedupNews(news, args.dedupThreshold)
+    return news
+
+def dedupNews(newsList, threshold):
+    """Drop the near-duplicate news (streamed)
+    """
+    from .dedup import NewsDeduplicator
+    logger.info("Deduplicate news by similarity threshold [%s]", threshold)
+    return NewsDeduplicator(threshold).iterUnique(newsList)
+
+def createTokenizer(args):
+    """Create the tokenizer (with the token cache if enabled)
+    """
+    from .tokencache import TokenCache, CachedTokenizer
+    tokenizer = getTokenizer(args.tokenizer)
+    if profiler.enabled:
+        tokenizer = ProfiledTokenizer(tokenizer, profiler.getAccumulator("tokenize"))
+    if args.tokenCacheSize > 0 or args.diskTokenCache:
+        cache = TokenCache(args.tokenCacheSize, TokenCacheFilename if args.diskTokenCache else None)
+        tokenizer = CachedTokenizer(tokenizer, cache)
+    return tokenizer
+
+def createAnalyzer(excelInput, args):
+    """Create the prepared analyzer of the gazetteer in the excel (load from cache if possible)
+    """
+    from .cache import GazetteerCache
+    from .analyzer import NewsAnalyzer
+    with profiler.stage("gazetteer-prepare") as stage:
+        cache = None if args.noCache else GazetteerCache()
+        if cache:
+            gazetteer = cache.load(excelInput.gazetteerHash)
+            if gazetteer:
+                return NewsAnalyzer(tokenizer = createTokenizer(args), **gazetteer)
+        analyzer = NewsAnalyzer(excelInput.countries, excelInput.regions, excelInput.provinces, excelInput.cities, tokenizer = createTokenizer(args))
+        analyzer.prepare()
+        if cache:
+            cache.save(excelInput.gazetteerHash, analyzer.getGazetteer())
+        return analyzer
+
+def setApproximate(analyzer, args):
+    """Set the approximate counting options of the analyzer
+    """
+    if args.capacity > 0:
+        analyzer.capacity = args.capacity
+        analyzer.countMin = tuple(args.countMin) if args.countMin else None
+        logger.info("Count approximately by the top-k sketches of capacity [%d]", args.capacity)
+    elif args.countMin:
+        raise ValueError("The count-min sketches require the approximate counting")
+
+def setOutput(analyzer, args):
+    """Set the output options of the analyzer
+    """
+    if args.top < 0:
+        raise ValueError("The number of the top terms must not be negative")
+    analyzer.outputFormat = args.outputFormat
+    analyzer.top = args.top
 
-def loadTitleTexts(titleTextFile):
-    """Load title texts from file
+def setIDFMode(analyzer, args):
+    """Set the idf mode of the analyzer
     """
-    if isfile(titleTextFile):
-        texts = []
-        with open(titleTextFile, "rb") as fd:
-            for content in fd:
-                texts.append(unicode(content))
-        return texts
+    if not 0.0 <= args.idfWeight <= 1.0:
+        raise ValueError("The idf weight must be in [0, 1]")
+    analyzer.idfMode = args.idfMode
+    analyzer.idfWeight = args.idfWeight
 
-def loadContentTexts(contentTextFile):
-    """Load content texts from file
+def normalizeFilename(filename):
+    """Normalize filename
     """
-    if isfile(contentTextFile):
-        texts = []
-        with open(contentTextFile, "rb") as fd:
-            for content in fd:
-                texts.append(unicode(content))
-        return texts
+    return expanduser(filename)
 
 def readWords():
     """Read words
@@ -169,86 +477,209 @@ def readWords():
         except EOFError:
             return keywords
 
+def getNamedKeywords(args):
+    """Get the keywords of the words in args (read from input if not specified)
+    Returns:
+        [ NamedKeyword ]: The keywords
+    """
+    if not args.words:
+        # Read words
+        return readWords()
+    keywords = []
+    for word in args.words:
+        words = [ x.strip() for x in word.split(",") if x.strip() ]
+        if words:
+            keywords.append(NamedKeyword(",".join(words), words))
+    return keywords
+
 def getKeyWords(args):
     """Get keywords
     """
     # Load excel
-    logger.info("Load excel")
-    excelInput = ExcelInput(args.input)
+    excelInput, filenames = loadInputs(args)
     # Load news
-    news = loadNews(excelInput)
-    if args.textTitleInput:
-        titles = loadTitleTexts(args.textTitleInput)
-        if titles:
-            news.extend([ News(title = x) for x in titles ])
-        logger.info("Load [%d] lines from text title input", len(titles) if titles else 0)
-    if args.textContentInput:
-        contents = loadContentTexts(args.textContentInput)
-        if contents:
-            news.extend([ News(content = x) for x in contents ])
-        logger.info("Load [%d] lines from text content input", len(contents) if contents else 0)
+    news = loadInputNews(excelInput, filenames, args)
     # Run analyzer
-    analyzer = NewsAnalyzer(excelInput.countries, excelInput.regions, excelInput.provinces, excelInput.cities)
-    analyzer.prepare()
+    analyzer = createAnalyzer(excelInput, args)
+    if args.noNumPy:
+        analyzer.useNumPy = False
+    setApproximate(analyzer, args)
+    setIDFMode(analyzer, args)
+    setOutput(analyzer, args)
     logger.info("Start analyze keywords")
-    return analyzer.getKeywords(args.nGram, news, normalizeFilename(args.outputTitle), normalizeFilename(args.outputContent))
+    try:
+        return analyzer.getKeywords(args.nGram, news, normalizeFilename(args.outputTitle), normalizeFilename(args.outputContent), args.workers)
+    finally:
+        analyzer.tokenizer.close()
 
 def cooccurrence(args):
     """Get cooccurrence
     """
     # Load excel
-    logger.info("Load excel")
-    excelInput = ExcelInput(args.input)
-    # Load news
-    news = loadNews(excelInput)
-    if args.textContentInput:
-        contents = loadContentTexts(args.textContentInput)
-        if contents:
-            news.extend([ News(content = x) for x in contents ])
-        logger.info("Load [%d] lines from text content input", len(contents) if contents else 0)
+    excelInput, filenames = loadInputs(args)
+    # Load news (not used if the index is specified)
+    index = openIndex(args, filenames)
+    news = loadInputNews(excelInput, filenames, args) if not index else []
     # Run analyzer
-    analyzer = NewsAnalyzer(excelInput.countries, excelInput.regions, excelInput.provinces, excelInput.cities)
-    analyzer.prepare()
+    analyzer = createAnalyzer(excelInput, args)
     # Read words
-    if not args.words:
-        # Read words
-        keywords = readWords()
-    else:
-        keywords = []
-        for word in args.words:
-            words = [ x.strip() for x in word.split(",") if x.strip() ]
-            if words:
-                keywords.append(NamedKeyword(",".join(words), words))
+    keywords = getNamedKeywords(args)
+    setApproximate(analyzer, args)
+    setIDFMode(analyzer, args)
+    setOutput(analyzer, args)
     # Run
     logger.info("Start analyze co-occurrence on words: %s", "|".join([ x.name for x in keywords ]))
-    return analyzer.cooccurrence(args.nGram, news, keywords, normalizeFilename(args.output))
+    try:
+        return analyzer.cooccurrence(args.nGram, news, keywords, normalizeFilename(args.output), args.workers, index)
+    finally:
+        analyzer.tokenizer.close()
+        if index:
+            index.close()
 
 def cooccurrenceEntity(args):
     """Get cooccurrence entity
     """
     # Load excel
-    logger.info("Load excel")
-    excelInput = ExcelInput(args.input)
+    excelInput, filenames = loadInputs(args)
+    # Load news (not used if the index is specified)
+    index = openIndex(args, filenames)
+    news = loadInputNews(excelInput, filenames, args) if not index else []
+    # Run analyzer
+    analyzer = createAnalyzer(excelInput, args)
+    # Read words
+    keywords = getNamedKeywords(args)
+    setOutput(analyzer, args)
+    # Run
+    logger.info("Start analyze co-occurrence on words: %s", "|".join([ x.name for x in keywords ]))
+    try:
+        return analyzer.cooccurrenceEntity(news, keywords, normalizeFilename(args.output), args.workers, index, excelInput.gazetteerHash)
+    finally:
+        analyzer.tokenizer.close()
+        if index:
+            index.close()
+
+def openIndex(args, filenames):
+    """Open the index in args
+    Args:
+        filenames([ str ]): The input excel files, the index must be built from them
+    Returns:
+        NewsIndex: The index, None if not specified
+    """
+    if args.index:
+        from .index import NewsIndex
+        # The news are read from the index, so the options of the news would be ignored
+        for option, value in (("--text-content-input", args.textContentInput), ("--text-input", getattr(args, "textInput", None)), ("--dedup-threshold", args.dedupThreshold)):
+            if value is not None:
+                raise ValueError("%s cannot be used with --index (the news are read from the index)" % option)
+        filename = normalizeFilename(args.index)
+        if not isfile(filename):
+            raise ValueError("Index [%s] not found, build it by the index command" % filename)
+        return NewsIndex(filename, [ hashFile(x) for x in filenames ])
+
+def buildIndex(args):
+    """Build the index of the news paragraphs
+    """
+    from .index import NewsIndex
+    # Load excel
+    excelInput, filenames = loadInputs(args)
+    # Load news
+    news = loadInputNews(excelInput, filenames, args)
+    # Run analyzer
+    analyzer = createAnalyzer(excelInput, args)
+    index = NewsIndex(normalizeFilename(args.output), [ hashFile(x) for x in filenames ])
+    logger.info("Start build index")
+    try:
+        analyzer.buildIndex(news, index, excelInput.gazetteerHash)
+    finally:
+        index.close()
+        analyzer.tokenizer.close()
+
+def trend(args):
+    """Update the trend store and get the trends
+    """
+    from .excelio import parseDate
+    from .analyzer import NewsAnalyzer
+    from .trend import TrendStore
+    if args.window < 1 or args.history < 0 or args.dateColumn < 1:
+        raise ValueError("The window and date column must be positive and the history must not be negative")
+    until = parseDate(args.until) if args.until else None
+    if args.until and not until:
+        raise ValueError("Invalid date [%s]" % args.until)
+    store = TrendStore(normalizeFilename(args.store))
+    try:
+        if args.inputs:
+            # Add the news of the new days
+            excelInput, filenames = loadInputs(args)
+            analyzer = createAnalyzer(excelInput, args)
+            try:
+                days = analyzer.updateTrends(args.nGram, loadWorkbookNews(excelInput, filenames, args, args.dateColumn), store, args.workers, args.replace)
+            finally:
+                analyzer.tokenizer.close()
+            if days:
+                logger.info("Added [%d] days from [%s] to [%s] to trend store", len(days), days[0], days[-1])
+            else:
+                logger.info("No new days to add to trend store")
+        else:
+            # The trends are got from the store only
+            analyzer = NewsAnalyzer(tokenizer = getTokenizer(args.tokenizer))
+        setOutput(analyzer, args)
+        logger.info("Start analyze trends")
+        start, end, news = analyzer.writeTrends(store, normalizeFilename(args.output), args.field, args.period, args.window, args.history, until, args.minCount, args.sort)
+        if not news:
+            logger.warn("No news in the window of [%s] to [%s]", start, end)
+    finally:
+        store.close()
+
+def analyzeAll(args):
+    """Run all the analyzers in one pass
+    """
+    from .pipeline import Pipeline, KeywordStage, CooccurrenceStage, CooccurrenceEntityStage
+    # Load excel
+    excelInput, filenames = loadInputs(args)
     # Load news
-    news = loadNews(excelInput)
-    if args.textContentInput:
-        contents = loadContentTexts(args.textContentInput)
-        if contents:
-            news.extend([ News(content = x) for x in contents ])
-        logger.info("Load [%d] lines from text content input", len(contents) if contents else 0)
+    news = loadInputNews(excelInput, filenames, args)
     # Run analyzer
-    analyzer = NewsAnalyzer(excelInput.countries, excelInput.regions, excelInput.provinces, excelInput.cities)
-    analyzer.prepare()
+    analyzer = createAnalyzer(excelInput, args)
+    if args.noNumPy:
+        analyzer.useNumPy = False
+    setApproximate(analyzer, args)
+    setIDFMode(analyzer, args)
+    setOutput(analyzer, args)
     # Read words
-    if not args.words:
-        # Read words
-        keywords = readWords()
+    keywords = getNamedKeywords(args)
+    stages = [ KeywordStage(analyzer, args.nGram, normalizeFilename(args.outputTitle), normalizeFilename(args.outputContent)) ]
+    if keywords:
+        stages.append(CooccurrenceStage(analyzer, args.nGram, keywords, normalizeFilename(args.outputCooccurrence)))
+        stages.append(CooccurrenceEntityStage(analyzer, keywords, normalizeFilename(args.outputCooccurrenceEntity)))
     else:
-        keywords = []
-        for word in args.words:
-            words = [ x.strip() for x in word.split(",") if x.strip() ]
-            if words:
-                keywords.append(NamedKeyword(",".join(words), words))
+        logger.warn("No keywords, skip the co-occurrence analyzers")
     # Run
-    logger.info("Start analyze co-occurrence on words: %s", "|".join([ x.name for x in keywords ]))
-    return analyzer.cooccurrenceEntity(news, keywords, normalizeFilename(args.output))
+    logger.info("Start analyze all on words: %s", "|".join([ x.name for x in keywords ]))
+    try:
+        return Pipeline(analyzer, stages).run(news, args.workers)
+    finally:
+        analyzer.tokenizer.close()
+
+def serve(args):
+    """Serve the analysis jobs
+    """
+    from .server import AnalysisService, AnalysisExecutor, AnalysisHTTPServer, AnalysisUnixServer
+    # Load the gazetteer and the shared data
+    with loadExcel(args.input) as excelInput:
+        analyzer = createAnalyzer(excelInput, args)
+    service = AnalysisService(analyzer.getGazetteer(), analyzer.tokenizer, args.nGram)
+    executor = AnalysisExecutor(service, args.workers)
+    if args.unixSocket:
+        server = AnalysisUnixServer(normalizeFilename(args.unixSocket), executor)
+        logger.info("Serve on unix socket [%s] with [%d] workers", args.unixSocket, args.workers)
+    else:
+        server = AnalysisHTTPServer((args.host, args.port), executor)
+        logger.info("Serve on http://%s:%d with [%d] workers", args.host, args.port, args.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stop serving")
+    finally:
+        server.server_close()
+        executor.close()
+        analyzer.tokenizer.close()
@@ -78,11 +78,12 @@ class City(object):
 class News(object):
     """The news
     """
-    def __init__(self, title = None, content = None):
+    def __init__(self, title = None, content = None, date = None):
         """Create a new News
         """
         self.title = title
         self.content = content
+        self.date = date        # The publish date (datetime.date), None if unknown
 
     def __str__(self):
         """Convert to string
@@ -0,0 +1,225 @@
+# encoding=utf8
+
+""" The table output
+    Author: lipixun
+    Created Time : 日  2/13 03:58:21 2017
+
+    File Name: output.py
+    Description:
+
+        The result tables are written by the table writers of the output formats, the rows are tuples in the order of
+        the columns and written in batches:
+
+        * csv:      By csv.writer.writerows of each batch
+        * jsonl:    A json object (keyed by the column names) per line, the lines of each batch are written at once
+        * parquet:  A row group of each batch (requires pyarrow)
+        * arrow:    The arrow ipc file, a record batch of each batch (requires pyarrow)
+
+        The parquet and arrow files are typed by the column types, so they could be loaded by the dataframe tools
+        directly.
+
+"""
+
+import csv
+
+from itertools import islice
+
+from .spec import OutputFormatCSV, OutputFormatJSONLines, OutputFormatParquet, OutputFormatArrow, OutputBatchSize
+from .utils import json, isModuleInstalled
+
+ColumnString    = "string"
+ColumnInt       = "int"
+ColumnFloat     = "float"
+
+class TableWriter(object):
+    """The table writer
+    """
+    extension = None
+
+    def __init__(self, filename, columns, batchSize = OutputBatchSize):
+        """Create a new TableWriter
+        Args:
+            filename(str): The filename (without the extension)
+            columns([ (unicode, str) ]): The column names and types (see Column*)
+            batchSize(int): The number of rows of a batch
+        """
+        self.filename = filename + self.extension
+        self.columns = columns
+        self.names = [ x[0] for x in columns ]
+        self.batchSize = batchSize
+        self.batch = []
+
+    def write(self, row):
+        """Write a row
+        """
+        self.batch.append(row)
+        if len(self.batch) >= self.batchSize:
+            self.flush()
+
+    def writeRows(self, rows):
+        """Write the rows (added to the pending batch, so the small groups of rows are written in full batches)
+        """
+        rows = iter(rows)
+        while True:
+            self.batch.extend(islice(rows, self.batchSize - len(self.batch)))
+            if len(self.batch) < self.batchSize:
+                break
+            self.flush()
+
+    def flush(self):
+        """Write the pending rows
+        """
+        if self.batch:
+            batch, self.batch = self.batch, []
+            self.writeBatch(batch)
+
+    def writeBatch(self, batch):
+        """Write a batch of rows
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Close the writer
+        """
+        self.flush()
+
+    def __enter__(self):
+        """Enter the context
+        """
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        """Exit the context
+        """
+        self.close()
+
+class CSVTableWriter(TableWriter):
+    """The csv table writer
+    """
+    extension = ".csv"
+
+    def __init__(self, filename, columns, batchSize = OutputBatchSize):
+        """Create a new CSVTableWriter
+        """
+        super(CSVTableWriter, self).__init__(filename, columns, batchSize)
+        self.fd = open(self.filename, "wb")
+        self.writer = csv.writer(self.fd)
+        self.writer.writerow(self.names)
+
+    def writeBatch(self, batch):
+        """Write a batch of rows
+        """
+        self.writer.writerows(batch)
+
+    def close(self):
+        """Close the writer
+        """
+        try:
+            super(CSVTableWriter, self).close()
+        finally:
+            self.fd.close()
+
+class JSONLinesTableWriter(TableWriter):
+    """The json lines table writer
+    """
+    extension = ".jsonl"
+
+    def __init__(self, filename, columns, batchSize = OutputBatchSize):
+        """Create a new JSONLinesTableWriter
+        """
+        super(JSONLinesTableWriter, self).__init__(filename, columns, batchSize)
+        self.fd = open(self.filename, "wb")
+
+    def writeBatch(self, batch):
+        """Write a batch of rows
+        """
+        names, dumps = self.names, json.dumps
+        self.fd.write("".join(dumps(dict(zip(names, row)), ensure_ascii = False).encode("utf8") + "\n" for row in batch))
+
+    def close(self):
+        """Close the writer
+        """
+        try:
+            super(JSONLinesTableWriter, self).close()
+        finally:
+            self.fd.close()
+
+class ArrowTableWriter(TableWriter):
+    """The base of the table writers by pyarrow
+    """
+    def __init__(self, filename, columns, batchSize = OutputBatchSize):
+        """Create a new ArrowTableWriter
+        """
+        if not isModuleInstalled("pyarrow"):
+            raise ValueError("The [%s] output format requires pyarrow, install by: pip install pyarrow" % self.extension[1:])
+        super(ArrowTableWriter, self).__init__(filename, columns, batchSize)
+        import pyarrow      # Imported here since it's optional and takes a while
+        self.pyarrow = pyarrow
+        types = { ColumnString: pyarrow.string(), ColumnInt: pyarrow.int64(), ColumnFloat: pyarrow.float64() }
+        self.types = [ types[x[1]] for x in columns ]
+        self.schema = pyarrow.schema([ pyarrow.field(name, type) for name, type in zip(self.names, self.types) ])
+        self.writer = None
+
+    def getArrays(self, batch):
+        """Get the column arrays of the batch
+        """
+        return [ self.pyarrow.array(list(values), type = type) for values, type in zip(zip(*batch), self.types) ]
+
+    def close(self):
+        """Close the writer
+        """
+        try:
+            super(ArrowTableWriter, self).close()
+            if not self.writer:
+                # Write the empty table
+                self.writeBatch([])
+        finally:
+            if self.writer:
+                self.writer.close()
+
+class ParquetTableWriter(ArrowTableWriter):
+    """The parquet table writer
+    """
+    extension = ".parquet"
+
+    def writeBatch(self, batch):
+        """Write a batch of rows as a row group
+        """
+        from pyarrow import parquet
+        if not self.writer:
+            self.writer = parquet.ParquetWriter(self.filename, self.schema)
+        if batch:
+            self.writer.write_table(self.pyarrow.Table.from_arrays(self.getArrays(batch), names = self.names))
+
+class ArrowIPCTableWriter(ArrowTableWriter):
+    """The arrow ipc file table writer
+    """
+    extension = ".arrow"
+
+    def writeBatch(self, batch):
+        """Write a batch of rows as a record batch
+        """
+        if not self.writer:
+            self.writer = self.pyarrow.RecordBatchFileWriter(self.filename, self.schema)
+        if batch:
+            self.writer.write_batch(self.pyarrow.RecordBatch.from_arrays(self.getArrays(batch), names = self.names))
+
+TableWriters = {
+    OutputFormatCSV: CSVTableWriter,
+    OutputFormatJSONLines: JSONLinesTableWriter,
+    OutputFormatParquet: ParquetTableWriter,
+    OutputFormatArrow: ArrowIPCTableWriter,
+}
+
+def openTable(filename, columns, outputFormat = OutputFormatCSV):
+    """Open the table writer of the output format
+    Args:
+        filename(str): The filename (without the extension)
+        columns([ (unicode, str) ]): The column names and types
+        outputFormat(str): The output format, see spec.OutputFormat*
+    Returns:
+        TableWriter: The writer
+    """
+    if not outputFormat in TableWriters:
+        raise ValueError("Unknown output format [%s]" % outputFormat)
+    return TableWriters[outputFormat](filename, columns)
@@ -0,0 +1,179 @@
+# encoding=utf8
+
+""" The parallel (multiprocess) analysis
+    Author: lipixun
+    Created Time : 日  2/12 19:02:46 2017
+
+    File Name: parallel.py
+    Description:
+
+        The news are split into chunks and counted by a pool of forked worker processes, the partial results
+        (Counters, approximate counters or dicts / tuples of them) are merged in the order of the chunks.
+
+        The count function and its arguments (the trie trees, stopwords and so on) are set as a module variable before
+        forking the workers, so they're shared (copy-on-write) by the workers instead of being pickled to them.
+
+        If the results are keyed by n-gram keys, the terms added to the (forked) vocabulary by a worker are sent back
+        with each result, and the keys are translated to the ids of the vocabulary in the main process when merging.
+
+        In the same way, the states of the registered objects changed by a worker (e.g. the token cache stats and new
+        entries) are sent back with each result and merged into the objects in the main process, see addWorkerState.
+
+"""
+
+import os
+import logging
+
+from itertools import islice
+from collections import Counter
+from multiprocessing import Pool
+
+from .sketch import ApproximateCounter
+
+ChunkSize = 256
+
+logger = logging.getLogger("newsanalyzer.parallel")
+
+# The (func, args, codec) to run in the workers, inherited by forking
+_context = None
+# The number of terms in the vocabulary which are known by the main process, in the worker
+_knownTerms = None
+# The objects whose states changed in the workers are merged into the main process
+_workerStates = []
+
+def addWorkerState(obj):
+    """Add an object whose state changed in the workers is sent back with each result and merged in the main process
+    The object implements:
+        popWorkerState(): Get the state changed since the last call (in the worker), None if not changed
+        mergeWorkerState(state): Merge the state of a worker (in the main process)
+    """
+    if not obj in _workerStates:
+        _workerStates.append(obj)
+
+def removeWorkerState(obj):
+    """Remove the object added by addWorkerState
+    """
+    if obj in _workerStates:
+        _workerStates.remove(obj)
+
+def _countChunk(chunk):
+    """Count a chunk in the worker
+    Returns:
+        (int, [ str ], list, object): The worker pid, the terms newly added to the vocabulary, the changed worker states
+            and the result
+    """
+    global _knownTerms
+    func, args, codec = _context
+    if codec and _knownTerms is None:
+        # The first chunk of the worker
+        _knownTerms = len(codec.vocabulary)
+    result = func(chunk, *args)
+    states = [ x.popWorkerState() for x in _workerStates ]
+    if not codec:
+        return os.getpid(), None, states, result
+    vocabulary = codec.vocabulary
+    terms = vocabulary.terms[_knownTerms: ]
+    _knownTerms = len(vocabulary)
+    return os.getpid(), terms, states, result
+
+def iterChunks(iterable, size):
+    """Iterate the chunks of the iterable
+    Yield:
+        list: The chunk
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
+
+def merge(target, source):
+    """Merge the source counting result into the target
+    Returns:
+        The merged result
+    """
+    if isinstance(target, Counter):
+        target.update(source)
+    elif isinstance(target, ApproximateCounter):
+        target.merge(source)
+    elif isinstance(target, dict):
+        for key, value in source.iteritems():
+            if key in target:
+                target[key] = merge(target[key], value)
+            else:
+                target[key] = value
+    elif isinstance(target, tuple):
+        target = tuple(merge(t, s) for t, s in zip(target, source))
+    else:
+        raise TypeError("Cannot merge type [%s]" % type(target).__name__)
+    return target
+
+def translate(result, codec, ids):
+    """Translate the n-gram keys in the result
+    Args:
+        result(object): The counting result
+        codec(NGramCodec): The codec
+        ids([ int ]): The id in main process of each id in the worker
+    Returns:
+        The translated result
+    """
+    if isinstance(result, Counter):
+        translated = Counter()
+        for key, count in result.iteritems():
+            if isinstance(key, (int, long)):
+                key = codec.encode([ ids[x] for x in codec.getIDs(key) ])
+            translated[key] = count
+        return translated
+    elif isinstance(result, ApproximateCounter):
+        return result.mapKeys(lambda key: codec.encode([ ids[x] for x in codec.getIDs(key) ]))
+    elif isinstance(result, dict):
+        return { k: translate(v, codec, ids) for k, v in result.iteritems() }
+    elif isinstance(result, tuple):
+        return tuple(translate(x, codec, ids) for x in result)
+    raise TypeError("Cannot translate type [%s]" % type(result).__name__)
+
+def mapReduce(func, newsList, args, workers = 1, codec = None, chunkSize = ChunkSize):
+    """Run func(news, *args) on the chunks of the news and merge the results
+    Args:
+        func(callable): The count function
+        newsList(iter): The news
+        args(tuple): The other arguments of the count function
+        workers(int): The number of worker processes, run in current process if not greater than 1
+        codec(NGramCodec): The codec of the n-gram keys in the results, None if not keyed by n-gram keys
+    Returns:
+        The merged result
+    """
+    global _context
+    if workers <= 1:
+        return func(newsList, *args)
+    logger.info("Start [%d] workers", workers)
+    _context = (func, args, codec)
+    workerIDs = {}
+    knownTerms = len(codec.vocabulary) if codec else 0
+    workerStates = list(_workerStates)
+    pool = Pool(workers)
+    try:
+        result = None
+        for pid, terms, states, partial in pool.imap(_countChunk, iterChunks(newsList, chunkSize)):
+            for obj, state in zip(workerStates, states):
+                if state is not None:
+                    obj.mergeWorkerState(state)
+            if codec:
+                # Translate to the ids of current vocabulary
+                ids = workerIDs.setdefault(pid, range(knownTerms))
+                ids.extend(codec.vocabulary.add(x) for x in terms)
+                if len(ids) > knownTerms:
+                    partial = translate(partial, codec, ids)
+            result = partial if result is None else merge(result, partial)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _context = None
+    if result is None:
+        # No news at all
+        result = func([], *args)
+    return result
@@ -0,0 +1,269 @@
+# encoding=utf8
+
+""" The single-pass analysis pipeline
+    Author: lipixun
+    Created Time : 日  2/12 23:41:18 2017
+
+    File Name: pipeline.py
+    Description:
+
+        The pipeline reads the news once, tokenizes each text (the title, the content and the content paragraphs) at
+        most once, and feeds the tokenized news to all the stages. A stage counts the tokenized news into its own
+        (mergeable) result, and writes the output when all news are counted:
+
+            * KeywordStage:             The keywords of the titles and contents (see NewsAnalyzer.getKeywords)
+            * CooccurrenceStage:        The cooccurrence terms of the keywords (see NewsAnalyzer.cooccurrence)
+            * CooccurrenceEntityStage:  The cooccurrence entities of the keywords (see NewsAnalyzer.cooccurrenceEntity)
+
+        The stop words and the static idf are loaded once and shared by the stages. The counting runs in the worker
+        processes in the same way as the single analysis (see parallel.mapReduce).
+
+"""
+
+import logging
+
+from .parallel import mapReduce
+from .profiling import profiler
+
+class TokenizedNews(object):
+    """The news of which the texts are tokenized lazily (and only once)
+    """
+    __slots__ = ("news", "analyzer", "stopwords", "_titleIDs", "_contentIDs", "_paragraphs")
+
+    def __init__(self, news, analyzer, stopwords):
+        """Create a new TokenizedNews
+        """
+        self.news = news
+        self.analyzer = analyzer
+        self.stopwords = stopwords
+        self._titleIDs, self._contentIDs, self._paragraphs = None, None, None
+
+    @property
+    def titleIDs(self):
+        """The term ids of the title, None if no title
+        """
+        if self._titleIDs is None and self.news.title:
+            self._titleIDs = self.analyzer.getTermIDs(self.analyzer.tokenize(self.news.title, self.stopwords))
+        return self._titleIDs
+
+    @property
+    def contentIDs(self):
+        """The term ids of the content, None if no content
+        """
+        if self._contentIDs is None and self.news.content:
+            self._contentIDs = self.analyzer.getTermIDs(self.analyzer.tokenize(self.news.content, self.stopwords))
+        return self._contentIDs
+
+    @property
+    def paragraphs(self):
+        """The terms of the (non-empty) content paragraphs
+        """
+        if self._paragraphs is None:
+            self._paragraphs = list(self.analyzer.iterTerms([ self.news ], self.stopwords, perParagraph = True))
+        return self._paragraphs
+
+class Stage(object):
+    """The analysis stage
+    """
+    name = None
+
+    def __init__(self, analyzer):
+        """Create a new Stage
+        """
+        self.analyzer = analyzer
+
+    def prepare(self, pipeline):
+        """Prepare (in the main process) before counting
+        """
+        pass
+
+    def begin(self):
+        """Begin counting
+        Returns:
+            object: The counters
+        """
+        raise NotImplementedError
+
+    def add(self, counters, news):
+        """Add a tokenized news to the counters
+        """
+        raise NotImplementedError
+
+    def end(self, counters):
+        """End counting
+        Returns:
+            object: The (mergeable) result of the counters
+        """
+        raise NotImplementedError
+
+    def write(self, pipeline, result):
+        """Write the output of the (merged) result
+        """
+        raise NotImplementedError
+
+class KeywordStage(Stage):
+    """The keyword stage
+    """
+    name = "keyword"
+
+    def __init__(self, analyzer, nGram, titleFile, contentFile):
+        """Create a new KeywordStage
+        """
+        super(KeywordStage, self).__init__(analyzer)
+        self.nGram = nGram
+        self.titleFile = titleFile
+        self.contentFile = contentFile
+
+    def begin(self):
+        """Begin counting
+        """
+        return self.analyzer.createKeywordCounters(self.nGram)
+
+    def add(self, counters, news):
+        """Add a tokenized news
+        """
+        self.analyzer.addKeywords(counters, news.titleIDs, news.contentIDs)
+
+    def end(self, counters):
+        """End counting
+        """
+        return tuple(x.getCounter() for x in counters)
+
+    def write(self, pipeline, result):
+        """Write the output
+        """
+        self.analyzer.writeKeywords(result, pipeline.idf, self.titleFile, self.contentFile)
+
+class CooccurrenceStage(Stage):
+    """The cooccurrence stage
+    """
+    name = "cooccurrence"
+
+    def __init__(self, analyzer, nGram, keywords, outputFile):
+        """Create a new CooccurrenceStage
+        """
+        super(CooccurrenceStage, self).__init__(analyzer)
+        self.nGram = nGram
+        self.keywords = keywords
+        self.outputFile = outputFile
+        self.tree = None
+
+    def prepare(self, pipeline):
+        """Build the keyword trie tree
+        """
+        self.tree = self.analyzer.buildKeywordTrieTree(self.keywords, pipeline.stopwords)
+
+    def begin(self):
+        """Begin counting
+        """
+        return self.analyzer.createCooccurrenceCounters(self.nGram)
+
+    def add(self, counters, news):
+        """Add a tokenized news
+        """
+        for terms in news.paragraphs:
+            self.analyzer.addCooccurrence(counters, terms, self.nGram, self.tree)
+
+    def end(self, counters):
+        """End counting
+        """
+        return self.analyzer.getCooccurrenceResult(counters)
+
+    def write(self, pipeline, result):
+        """Write the output
+        """
+        self.analyzer.writeCooccurrence(result, pipeline.idf, self.outputFile)
+
+class CooccurrenceEntityStage(Stage):
+    """The cooccurrence entity stage
+    """
+    name = "cooccurrence-entity"
+
+    def __init__(self, analyzer, keywords, outputFile):
+        """Create a new CooccurrenceEntityStage
+        """
+        super(CooccurrenceEntityStage, self).__init__(analyzer)
+        self.keywords = keywords
+        self.outputFile = outputFile
+        self.tree = None
+
+    def prepare(self, pipeline):
+        """Build the keyword trie tree
+        """
+        self.tree = self.analyzer.buildKeywordTrieTree(self.keywords, pipeline.stopwords, withTerms = False)
+
+    def begin(self):
+        """Begin counting
+        """
+        return { None: {} }
+
+    def add(self, counters, news):
+        """Add a tokenized news
+        """
+        for terms in news.paragraphs:
+            self.analyzer.addCooccurrenceEntity(counters, terms, self.tree)
+
+    def end(self, counters):
+        """End counting
+        """
+        return counters
+
+    def write(self, pipeline, result):
+        """Write the output
+        """
+        self.analyzer.writeCooccurrenceEntity(result, self.outputFile)
+
+class Pipeline(object):
+    """The analysis pipeline
+    """
+    logger = logging.getLogger("newsanalyzer.Pipeline")
+
+    def __init__(self, analyzer, stages, stopwords = None, idf = None):
+        """Create a new Pipeline
+        Args:
+            analyzer(NewsAnalyzer): The (prepared) analyzer
+            stages([ Stage ]): The stages
+            stopwords(set): The stop words, loaded by the analyzer if not specified
+            idf(dict): The static idf, loaded by the analyzer if not specified
+        """
+        self.analyzer = analyzer
+        self.stages = stages
+        self.stopwords = stopwords
+        self.idf = idf
+
+    def count(self, newsList):
+        """Count the news by all stages
+        Returns:
+            tuple: The result of each stage
+        """
+        stages = self.stages
+        counters = [ x.begin() for x in stages ]
+        for news in newsList:
+            news = TokenizedNews(news, self.analyzer, self.stopwords)
+            for stage, stageCounters in zip(stages, counters):
+                stage.add(stageCounters, news)
+        return tuple(stage.end(x) for stage, x in zip(stages, counters))
+
+    def run(self, newsList, workers = 1):
+        """Run the pipeline
+        Args:
+            newsList(iter): The news
+            workers(int): The number of worker processes
+        """
+        self.analyzer.checkOptions(workers)
+        # Load the shared data and prepare the stages
+        if self.stopwords is None:
+            self.stopwords = self.analyzer.loadStopwordSet()
+        if self.idf is None:
+            self.idf = self.analyzer.loadIDF()
+        for stage in self.stages:
+            stage.prepare(self)
+        # Count
+        self.logger.info("Start analyze by stages: %s", ", ".join(x.name for x in self.stages))
+        with profiler.stage("count") as record:
+            results = mapReduce(self.count, record.iterate(newsList), (), workers, self.analyzer.codec)
+        # Write out
+        for stage, result in zip(self.stages, results):
+            self.logger.info("Write output of stage [%s]", stage.name)
+            with profiler.stage("write:%s" % stage.name):
+                stage.write(self, result)
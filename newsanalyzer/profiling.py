@@ -0,0 +1,279 @@
+# encoding=utf8
+
+""" The profiling
+    Author: lipixun
+    Created Time : 日  2/13 03:12:45 2017
+
+    File Name: profiling.py
+    Description:
+
+        The profiler records the stages of the analysis flow (excel load, gazetteer prepare, trie build, idf load,
+        tokenize, count and write): the wall time, cpu time, rss growth and peak rss, the number of items (and items per
+        second) and the sizes of the counters. It's disabled by default, in which case the stages are not measured at
+        all, and enabled by the --profile option to write the report as json.
+
+        The tokenize stage is accumulated over the calls by the ProfiledTokenizer, and it's a part of the count stage.
+        It's wrapped by the token cache, so only the texts actually tokenized are recorded. When counting by multiple
+        worker processes, the tokenizing happens in the workers and is not recorded.
+
+        The hot stage could be captured by cProfile (or pyinstrument if installed), the top functions (or the text
+        output of pyinstrument) are added to the report.
+
+"""
+
+import os
+import time
+import logging
+import resource
+
+from contextlib import contextmanager
+
+from .spec import ProfileEngineCProfile, ProfileEnginePyInstrument, ProfileTopFunctions
+from .utils import json, isModuleInstalled
+from .tokenizer import Tokenizer
+
+def getRSS():
+    """Get the current rss in kilobytes (None if /proc is not available)
+    """
+    try:
+        with open("/proc/self/statm", "rb") as fd:
+            return int(fd.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (IOError, OSError, ValueError):
+        return None
+
+def getCPUSeconds(usage):
+    """Get the cpu (user and system) seconds of the resource usage
+    """
+    return usage.ru_utime + usage.ru_stime
+
+class StageRecord(object):
+    """The record of a stage
+    """
+    def __init__(self, name, items = None, depth = 0):
+        """Create a new StageRecord
+        Args:
+            name(str): The stage name
+            items(int): The number of the processed items, None if unknown
+            depth(int): The depth of the nested stages
+        """
+        self.name = name
+        self.items = items
+        self.depth = depth
+        self.calls = 0
+        self.seconds = 0.0
+        self.cpuSeconds = 0.0
+        self.rssGrowth = None
+        self.peakRSS = None
+        self.sizes = {}         # The name to size of the counters (or anything else)
+
+    def iterate(self, iterable):
+        """Iterate the iterable and count the items
+        """
+        self.items = self.items or 0
+        for item in iterable:
+            self.items += 1
+            yield item
+
+    def add(self, seconds, cpuSeconds, items = 1):
+        """Add a call of the accumulated stage
+        """
+        self.calls += 1
+        self.seconds += seconds
+        self.cpuSeconds += cpuSeconds
+        self.items = (self.items or 0) + items
+
+    def toDict(self):
+        """Convert to dict
+        """
+        data = {
+            "name": self.name,
+            "depth": self.depth,
+            "seconds": self.seconds,
+            "cpuSeconds": self.cpuSeconds,
+            }
+        if self.calls:
+            data["calls"] = self.calls
+        if self.items is not None:
+            data["items"] = self.items
+            data["itemsPerSecond"] = self.items / self.seconds if self.seconds > 0 else None
+        if self.peakRSS is not None:
+            data["peakRSS"] = self.peakRSS
+        if self.rssGrowth is not None:
+            data["rssGrowth"] = self.rssGrowth
+        if self.sizes:
+            data["sizes"] = self.sizes
+        return data
+
+class Profiler(object):
+    """The stage profiler
+    """
+    logger = logging.getLogger("newsanalyzer.Profiler")
+
+    def __init__(self):
+        """Create a new Profiler
+        """
+        self.enabled = False
+        self.records = []           # The records of the finished stages
+        self.accumulators = {}      # The name to the record of the accumulated stages
+        self.depth = 0
+        self.hotStage = None
+        self.hotEngine = ProfileEngineCProfile
+        self.hotOutput = None
+        self.hotReport = None
+        self.startTime = None
+
+    def enable(self, hotStage = None, hotEngine = ProfileEngineCProfile, hotOutput = None):
+        """Enable the profiler
+        Args:
+            hotStage(str): The name of the stage to capture by the hot engine (the first one only), None to disable
+            hotEngine(str): The hot engine, see spec.ProfileEngine*
+            hotOutput(str): The file to write the raw output of the hot engine (the cProfile stats or the pyinstrument
+                text), None to not write
+        """
+        if hotStage and hotEngine == ProfileEnginePyInstrument and not isModuleInstalled("pyinstrument"):
+            raise ValueError("The pyinstrument profile engine requires pyinstrument, install by: pip install pyinstrument")
+        self.enabled = True
+        self.hotStage = hotStage
+        self.hotEngine = hotEngine
+        self.hotOutput = hotOutput
+        self.startTime = time.time()
+
+    @contextmanager
+    def stage(self, name, items = None):
+        """Measure a stage
+        Args:
+            name(str): The stage name
+            items(int): The number of the processed items (could be set or counted by the yielded record as well)
+        Yield:
+            StageRecord: The record
+        """
+        record = StageRecord(name, items, self.depth)
+        if not self.enabled:
+            yield record
+            return
+        hot = self.startHot() if name == self.hotStage and self.hotReport is None else None
+        startTime, startUsage, startRSS = time.time(), resource.getrusage(resource.RUSAGE_SELF), getRSS()
+        self.depth += 1
+        try:
+            yield record
+        finally:
+            self.depth -= 1
+            usage, rss = resource.getrusage(resource.RUSAGE_SELF), getRSS()
+            record.calls = 1
+            record.seconds = time.time() - startTime
+            record.cpuSeconds = getCPUSeconds(usage) - getCPUSeconds(startUsage)
+            # ru_maxrss is in kilobytes on linux
+            record.peakRSS = usage.ru_maxrss
+            if rss is not None and startRSS is not None:
+                record.rssGrowth = rss - startRSS
+            if hot:
+                self.stopHot(hot)
+            self.records.append(record)
+            self.logger.info("Stage [%s] done in %.3fs (cpu %.3fs)", name, record.seconds, record.cpuSeconds)
+
+    def getAccumulator(self, name):
+        """Get the record of an accumulated stage (see StageRecord.add)
+        """
+        record = self.accumulators.get(name)
+        if record is None:
+            record = self.accumulators[name] = StageRecord(name)
+        return record
+
+    def startHot(self):
+        """Start the hot engine
+        """
+        self.logger.info("Capture stage [%s] by %s", self.hotStage, self.hotEngine)
+        if self.hotEngine == ProfileEnginePyInstrument:
+            from pyinstrument import Profiler as PyInstrumentProfiler
+            hot = PyInstrumentProfiler()
+            hot.start()
+        else:
+            from cProfile import Profile
+            hot = Profile()
+            hot.enable()
+        return hot
+
+    def stopHot(self, hot):
+        """Stop the hot engine and get the hot report
+        """
+        if self.hotEngine == ProfileEnginePyInstrument:
+            hot.stop()
+            text = hot.output_text()
+            self.hotReport = { "stage": self.hotStage, "engine": self.hotEngine, "text": text }
+            if self.hotOutput:
+                with open(self.hotOutput, "wb") as fd:
+                    fd.write(text.encode("utf8") if isinstance(text, unicode) else text)
+        else:
+            from pstats import Stats
+            hot.disable()
+            stats = Stats(hot)
+            functions = []
+            for (filename, line, function), (_, calls, totalSeconds, cumulativeSeconds, _) in stats.stats.iteritems():
+                functions.append({
+                    "function": "%s:%d(%s)" % (filename, line, function),
+                    "calls": calls,
+                    "totalSeconds": totalSeconds,
+                    "cumulativeSeconds": cumulativeSeconds,
+                    })
+            functions.sort(key = lambda x: x["cumulativeSeconds"], reverse = True)
+            self.hotReport = { "stage": self.hotStage, "engine": self.hotEngine, "functions": functions[: ProfileTopFunctions] }
+            if self.hotOutput:
+                stats.dump_stats(self.hotOutput)
+
+    def getReport(self, command = None):
+        """Get the report
+        Returns:
+            dict: The report
+        """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        report = {
+            "command": command,
+            "seconds": time.time() - self.startTime if self.startTime else None,
+            "cpuSeconds": getCPUSeconds(usage),
+            "peakRSS": usage.ru_maxrss,
+            "stages": [ x.toDict() for x in self.records ],
+            "accumulated": [ x.toDict() for x in sorted(self.accumulators.itervalues(), key = lambda x: x.name) ],
+            }
+        # The worker processes (if any) are reaped by this process
+        workersRSS = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if workersRSS:
+            report["workersPeakRSS"] = workersRSS
+        if self.hotReport:
+            report["hot"] = self.hotReport
+        return report
+
+    def write(self, filename, command = None):
+        """Write the report as json
+        """
+        self.logger.info("Write profile report to [%s]", filename)
+        with open(filename, "wb") as fd:
+            json.dump(self.getReport(command), fd, indent = 4, sort_keys = True)
+
+class ProfiledTokenizer(Tokenizer):
+    """The tokenizer which accumulates the tokenize time to a stage record
+    """
+    def __init__(self, tokenizer, record):
+        """Create a new ProfiledTokenizer
+        """
+        self.name = tokenizer.name
+        self.tokenizer = tokenizer
+        self.record = record
+
+    def tokenize(self, text, stopwords):
+        """Tokenize the text
+        Returns:
+            tuple: The terms
+        """
+        startTime, startCPU = time.time(), time.clock()
+        terms = tuple(self.tokenizer.tokenize(text, stopwords))
+        self.record.add(time.time() - startTime, time.clock() - startCPU)
+        self.record.sizes["terms"] = self.record.sizes.get("terms", 0) + len(terms)
+        return terms
+
+    def close(self):
+        """Close the tokenizer
+        """
+        self.tokenizer.close()
+
+# The profiler of the process
+profiler = Profiler()
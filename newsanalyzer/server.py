@@ -0,0 +1,386 @@
+# encoding=utf8
+
+""" The analysis server
+    Author: lipixun
+    Created Time : 日  2/13 00:12:37 2017
+
+    File Name: server.py
+    Description:
+
+        The server keeps the prepared gazetteer, the tokenizer (with the nltk data loaded), the stop words and the
+        static idf in memory, and runs the analysis jobs sent over http or a unix socket.
+
+        A job is a json object:
+
+            {
+                "news":         [ { "title": "...", "content": "..." } ],
+                "keywords":     [ "America, usa", [ "China", "PRC" ], { "name": "...", "words": [ "..." ] } ],
+                "analyses":     [ "keyword", "cooccurrence", "cooccurrence-entity" ],     (optional, default all)
+                "nGram":        6,                                                          (optional)
+                "approximate":  0,                                                          (optional)
+                "idf":          "static",                                                   (optional)
+                "idfWeight":    0.5,                                                        (optional)
+                "format":       "json"                                                      (optional, json or csv)
+            }
+
+        The result is a json object of the outputs (keywords-title, keywords-content, cooccurrence and
+        cooccurrence-entity), each is the list of rows (json format, written as json lines, so the values are typed by
+        the columns) or the csv text (csv format), the same as the files written by the command line. A malformed job
+        is responded with status 400.
+
+        The http server accepts POST /analyze with the job as the body, and GET /health. The unix socket server
+        accepts a job per line and responds a json line. The jobs run concurrently by a pool of worker processes
+        forked after the state is loaded, so the workers share the warm state.
+
+"""
+
+import os
+import time
+import shutil
+import socket
+import logging
+import tempfile
+
+from os.path import join
+from threading import Lock
+from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from multiprocessing import Pool
+
+from .spec import IDFModeStatic, IDFModeCorpus, IDFModeBlend, IDFBlendWeight, OutputFormatCSV, OutputFormatJSONLines
+from .utils import json
+from .model import News, NamedKeyword
+from .analyzer import NewsAnalyzer
+from .pipeline import Pipeline, KeywordStage, CooccurrenceStage, CooccurrenceEntityStage
+
+AnalysisKeyword             = "keyword"
+AnalysisCooccurrence        = "cooccurrence"
+AnalysisCooccurrenceEntity  = "cooccurrence-entity"
+Analyses = (AnalysisKeyword, AnalysisCooccurrence, AnalysisCooccurrenceEntity)
+
+FormatJSON  = "json"
+FormatCSV   = "csv"
+
+# The max size of a job (in bytes)
+MaxJobSize = 64 << 20
+
+# The service run by the worker processes, inherited by forking
+_service = None
+
+def _runJob(job):
+    """Run the job in the worker
+    """
+    return _service.run(job)
+
+def getOutputFormat(format):
+    """Get the output format (see spec.OutputFormat*) written for the response format
+    """
+    return OutputFormatCSV if format == FormatCSV else OutputFormatJSONLines
+
+def readOutput(filename, format):
+    """Read the output file (csv or json lines, see getOutputFormat)
+    Returns:
+        object: The csv text or the list of rows
+    """
+    if format == FormatCSV:
+        with open(filename + ".csv", "rb") as fd:
+            return fd.read().decode("utf8")
+    with open(filename + ".jsonl", "rb") as fd:
+        return [ json.loads(line) for line in fd ]
+
+def getNumber(job, key, parse, default, minimum = None, maximum = None):
+    """Get the number option of the job
+    Args:
+        job(dict): The job
+        key(str): The option
+        parse(callable): int or float
+        default(object): The default value if not specified
+        minimum(object): The min value, not checked if None
+        maximum(object): The max value, not checked if None
+    """
+    value = job.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+        raise ValueError("Invalid %s: %r" % (key, value))
+    value = parse(value)
+    # Not by the negative comparisons, so nan is rejected too
+    if minimum is not None and not value >= minimum:
+        raise ValueError("Invalid %s: %r (must be >= %r)" % (key, value, minimum))
+    if maximum is not None and not value <= maximum:
+        raise ValueError("Invalid %s: %r (must be <= %r)" % (key, value, maximum))
+    return value
+
+class AnalysisService(object):
+    """The analysis service
+    """
+    logger = logging.getLogger("newsanalyzer.AnalysisService")
+
+    def __init__(self, gazetteer, tokenizer, nGram = 6):
+        """Create a new AnalysisService
+        Args:
+            gazetteer(dict): The prepared gazetteer (see NewsAnalyzer.getGazetteer)
+            tokenizer(Tokenizer): The tokenizer
+            nGram(int): The default nGram
+        """
+        self.gazetteer = gazetteer
+        self.tokenizer = tokenizer
+        self.nGram = nGram
+        # Load the shared data
+        analyzer = self.createAnalyzer()
+        self.stopwords = analyzer.loadStopwordSet()
+        self.idf = analyzer.loadIDFDict()
+        # Warm up the tokenizer (load the nltk data)
+        list(tokenizer.tokenize(u"Warm up the tokenizer. It's ready.", self.stopwords))
+
+    def createAnalyzer(self):
+        """Create an analyzer (of an empty vocabulary) of the gazetteer
+        """
+        return NewsAnalyzer(tokenizer = self.tokenizer, **self.gazetteer)
+
+    def parseNews(self, newsList):
+        """Parse the news of the job
+        Returns:
+            [ News ]: The news
+        """
+        if newsList is None:
+            return []
+        if not isinstance(newsList, list):
+            raise ValueError("Invalid news: must be a list of objects")
+        news = []
+        for index, item in enumerate(newsList):
+            if not isinstance(item, dict):
+                raise ValueError("Invalid news [%d]: must be an object" % index)
+            for field in ("title", "content"):
+                if not isinstance(item.get(field) or u"", basestring):
+                    raise ValueError("Invalid news [%d]: %s must be a string" % (index, field))
+            news.append(News(title = item.get("title"), content = item.get("content")))
+        return news
+
+    def parseKeywords(self, keywords):
+        """Parse the keywords of the job
+        Returns:
+            [ NamedKeyword ]: The keywords
+        """
+        if keywords is None:
+            return []
+        if not isinstance(keywords, list):
+            raise ValueError("Invalid keywords: must be a list")
+        namedKeywords = []
+        for keyword in keywords:
+            if isinstance(keyword, dict):
+                words = keyword.get("words") or []
+                name = keyword.get("name")
+            elif isinstance(keyword, list):
+                words, name = keyword, None
+            elif isinstance(keyword, basestring):
+                words, name = keyword.split(","), None
+            else:
+                raise ValueError("Invalid keyword: %r" % keyword)
+            if not isinstance(words, list) or not all(isinstance(x, basestring) for x in words) or not isinstance(name or u"", basestring):
+                raise ValueError("Invalid keyword: %r" % keyword)
+            words = [ x.strip() for x in words if x.strip() ]
+            if words:
+                namedKeywords.append(NamedKeyword(name or ",".join(words), words))
+        return namedKeywords
+
+    def run(self, job):
+        """Run the job
+        Returns:
+            dict: The outputs
+        """
+        if not isinstance(job, dict):
+            raise ValueError("Job must be a json object")
+        start = time.time()
+        news = self.parseNews(job.get("news"))
+        keywords = self.parseKeywords(job.get("keywords"))
+        analyses = job.get("analyses") or Analyses
+        if not isinstance(analyses, (list, tuple)):
+            raise ValueError("Invalid analyses: must be a list")
+        for analysis in analyses:
+            if analysis not in Analyses:
+                raise ValueError("Unknown analysis [%s]" % analysis)
+        format = job.get("format") or FormatJSON
+        if format not in (FormatJSON, FormatCSV):
+            raise ValueError("Unknown format [%s]" % format)
+        nGram = getNumber(job, "nGram", int, self.nGram, 1)
+        # Create the analyzer
+        analyzer = self.createAnalyzer()
+        analyzer.outputFormat = getOutputFormat(format)
+        analyzer.capacity = getNumber(job, "approximate", int, 0, 0)
+        analyzer.idfMode = job.get("idf") or IDFModeStatic
+        if analyzer.idfMode not in (IDFModeStatic, IDFModeCorpus, IDFModeBlend):
+            raise ValueError("Unknown idf mode [%s]" % analyzer.idfMode)
+        analyzer.idfWeight = getNumber(job, "idfWeight", float, IDFBlendWeight, 0.0, 1.0)
+        # Run the stages, the outputs are written to a temp directory
+        path = tempfile.mkdtemp(prefix = "newsanalyzer-")
+        try:
+            stages, outputs = [], []
+            if AnalysisKeyword in analyses:
+                stages.append(KeywordStage(analyzer, nGram, join(path, "keywords-title"), join(path, "keywords-content")))
+                outputs.extend([ "keywords-title", "keywords-content" ])
+            if AnalysisCooccurrence in analyses and keywords:
+                stages.append(CooccurrenceStage(analyzer, nGram, keywords, join(path, "cooccurrence")))
+                outputs.append("cooccurrence")
+            if AnalysisCooccurrenceEntity in analyses and keywords:
+                stages.append(CooccurrenceEntityStage(analyzer, keywords, join(path, "cooccurrence-entity")))
+                outputs.append("cooccurrence-entity")
+            Pipeline(analyzer, stages, self.stopwords, self.idf if analyzer.idfMode != IDFModeCorpus else None).run(news)
+            result = { x: readOutput(join(path, x), format) for x in outputs }
+        finally:
+            shutil.rmtree(path, ignore_errors = True)
+        self.logger.info("Run job of [%d] news and [%d] keywords in [%.3f]s", len(news), len(keywords), time.time() - start)
+        return result
+
+class AnalysisExecutor(object):
+    """Run the jobs by a pool of worker processes (or in current process if no workers)
+    """
+    def __init__(self, service, workers):
+        """Create a new AnalysisExecutor
+        """
+        global _service
+        self.service = service
+        self.lock = Lock()
+        self.pool = None
+        if workers > 0:
+            _service = service
+            self.pool = Pool(workers)
+
+    def __call__(self, job):
+        """Run the job
+        Returns:
+            dict: The response
+        """
+        start = time.time()
+        try:
+            if self.pool:
+                outputs = self.pool.apply(_runJob, (job, ))
+            else:
+                with self.lock:
+                    outputs = self.service.run(job)
+        except ValueError as error:
+            return 400, { "error": str(error) }
+        except Exception as error:
+            self.service.logger.exception("Failed to run job")
+            return 500, { "error": str(error) }
+        return 200, { "outputs": outputs, "seconds": time.time() - start }
+
+    def close(self):
+        """Close the pool
+        """
+        if self.pool:
+            self.pool.terminate()
+            self.pool.join()
+
+class AnalysisHTTPRequestHandler(BaseHTTPRequestHandler):
+    """The http request handler
+    """
+    def sendJSON(self, status, data):
+        """Send the json response
+        """
+        body = json.dumps(data, ensure_ascii = False)
+        if isinstance(body, unicode):
+            body = body.encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """Handle GET
+        """
+        if self.path == "/health":
+            self.sendJSON(200, { "status": "ok" })
+        else:
+            self.sendJSON(404, { "error": "Not found" })
+
+    def do_POST(self):
+        """Handle POST
+        """
+        if self.path != "/analyze":
+            return self.sendJSON(404, { "error": "Not found" })
+        length = self.headers.getheader("Content-Length")
+        if length is None:
+            return self.sendJSON(411, { "error": "Content-Length required" })
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self.sendJSON(400, { "error": "Invalid Content-Length" })
+        if length > MaxJobSize:
+            return self.sendJSON(413, { "error": "Job too large" })
+        try:
+            job = json.loads(self.rfile.read(length))
+        except ValueError as error:
+            return self.sendJSON(400, { "error": "Invalid json: %s" % error })
+        self.sendJSON(*self.server.executor(job))
+
+    def log_message(self, format, *args):
+        """Log by logging
+        """
+        logging.getLogger("newsanalyzer.http").info("%s - %s", self.address_string(), format % args)
+
+class AnalysisHTTPServer(ThreadingMixIn, HTTPServer):
+    """The http server
+    """
+    daemon_threads = True
+
+    def __init__(self, address, executor):
+        """Create a new AnalysisHTTPServer
+        """
+        HTTPServer.__init__(self, address, AnalysisHTTPRequestHandler)
+        self.executor = executor
+
+class AnalysisStreamRequestHandler(StreamRequestHandler):
+    """The unix socket request handler (a json job per line)
+    """
+    def handle(self):
+        """Handle the jobs of the connection
+        """
+        while True:
+            line = self.rfile.readline(MaxJobSize)
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                status, data = self.server.executor(json.loads(line))
+            except ValueError as error:
+                status, data = 400, { "error": "Invalid json: %s" % error }
+            data["status"] = status
+            response = json.dumps(data, ensure_ascii = False)
+            if isinstance(response, unicode):
+                response = response.encode("utf8")
+            self.wfile.write(response + "\n")
+            self.wfile.flush()
+
+class AnalysisUnixServer(ThreadingMixIn, UnixStreamServer):
+    """The unix socket server
+    """
+    daemon_threads = True
+
+    def __init__(self, filename, executor):
+        """Create a new AnalysisUnixServer
+        """
+        if os.path.exists(filename):
+            # Remove the stale socket
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(filename)
+            except socket.error:
+                os.remove(filename)
+            else:
+                raise ValueError("Socket [%s] is in use" % filename)
+            finally:
+                probe.close()
+        UnixStreamServer.__init__(self, filename, AnalysisStreamRequestHandler)
+        self.executor = executor
+
+    def server_close(self):
+        """Close the server and remove the socket
+        """
+        UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
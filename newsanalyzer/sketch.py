@@ -0,0 +1,277 @@
+# encoding=utf8
+
+""" The streaming sketches
+    Author: lipixun
+    Created Time : 日  2/12 22:15:03 2017
+
+    File Name: sketch.py
+    Description:
+
+        The sketches count the items of a stream approximately in fixed memory:
+
+        * SpaceSaving:      Monitors at most `capacity` items (the heavy hitters). The count of a monitored item is never
+                            under estimated, and over estimated by at most its error (<= total / capacity).
+        * CountMinSketch:   Estimates the count of any item by a depth x width counter table. The count is never under
+                            estimated, and over estimated by at most e / width * total with probability 1 - e ^ -depth.
+
+        The ApproximateCounter counts the n-gram keys (see vocab.NGramCodec) by a SpaceSaving (and optionally a
+        CountMinSketch to tighten the counts) of each n, so the memory is bounded by the capacity instead of the number
+        of the distinct n-grams.
+
+"""
+
+import math
+import heapq
+import random
+
+from array import array
+
+from .vocab import IDBits
+
+# The mersenne prime for the hash functions of the count-min sketch
+HashPrime = (1 << 61) - 1
+
+class SpaceSaving(object):
+    """The space-saving top-k sketch
+    """
+    def __init__(self, capacity):
+        """Create a new SpaceSaving
+        """
+        if capacity <= 0:
+            raise ValueError("Capacity must be greater than 0")
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.heap = []      # The (count, item) of the monitored items, the count may be outdated
+        self.total = 0
+
+    def __len__(self):
+        """Get the number of the monitored items
+        """
+        return len(self.counts)
+
+    def getMinCount(self):
+        """Get the min count of the monitored items (0 if the sketch is not full)
+        """
+        if len(self.counts) < self.capacity:
+            return 0
+        heap, counts = self.heap, self.counts
+        while True:
+            count, item = heap[0]
+            current = counts.get(item)
+            if current == count:
+                return count
+            if current is None:
+                # Not monitored any more
+                heapq.heappop(heap)
+            else:
+                # Outdated
+                heapq.heapreplace(heap, (current, item))
+
+    def update(self, item, count = 1):
+        """Add the count of the item
+        """
+        self.total += count
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+            heapq.heappush(self.heap, (count, item))
+        else:
+            # Replace the item of the min count
+            minCount = self.getMinCount()
+            _, minItem = heapq.heapreplace(self.heap, (minCount + count, item))
+            del counts[minItem]
+            del self.errors[minItem]
+            counts[item] = minCount + count
+            self.errors[item] = minCount
+
+    def items(self):
+        """Get the monitored items
+        Returns:
+            [ (item, count, error) ]: The items
+        """
+        return [ (item, count, self.errors[item]) for item, count in self.counts.iteritems() ]
+
+    def rebuild(self, items, total):
+        """Rebuild by the (item, count, error)s (keep the top `capacity` ones)
+        """
+        items = heapq.nlargest(self.capacity, items, key = lambda x: x[1])
+        self.counts = { item: count for item, count, _ in items }
+        self.errors = { item: error for item, _, error in items }
+        self.heap = [ (count, item) for item, count, _ in items ]
+        heapq.heapify(self.heap)
+        self.total = total
+
+    def merge(self, other):
+        """Merge another sketch (of the same capacity)
+        """
+        minCount, otherMinCount = self.getMinCount(), other.getMinCount()
+        merged = {}
+        for item, count, error in self.items():
+            merged[item] = [ count + otherMinCount, error + otherMinCount ]
+        for item, count, error in other.items():
+            if item in merged:
+                # Replace the min count of other by the real one
+                merged[item][0] += count - otherMinCount
+                merged[item][1] += error - otherMinCount
+            else:
+                merged[item] = [ count + minCount, error + minCount ]
+        self.rebuild([ (k, v[0], v[1]) for k, v in merged.iteritems() ], self.total + other.total)
+        return self
+
+    def mapItems(self, func):
+        """Map the monitored items by func
+        """
+        self.rebuild([ (func(item), count, error) for item, count, error in self.items() ], self.total)
+        return self
+
+class CountMinSketch(object):
+    """The count-min sketch of the integer items
+    """
+    def __init__(self, width, depth):
+        """Create a new CountMinSketch
+        """
+        self.width = width
+        self.depth = depth
+        self.tables = [ array("l", [ 0 ]) * width for _ in range(depth) ]
+        # The hash functions: ((a * x + b) mod p) mod width, seeded to keep the estimations reproducible
+        rand = random.Random(depth)
+        self.hashes = [ (rand.randint(1, HashPrime - 1), rand.randint(0, HashPrime - 1)) for _ in range(depth) ]
+        self.total = 0
+
+    def update(self, item, count = 1):
+        """Add the count of the item
+        """
+        self.total += count
+        item %= HashPrime
+        for table, (a, b) in zip(self.tables, self.hashes):
+            table[((a * item + b) % HashPrime) % self.width] += count
+
+    def estimate(self, item):
+        """Estimate the count of the item
+        """
+        item %= HashPrime
+        return min(table[((a * item + b) % HashPrime) % self.width] for table, (a, b) in zip(self.tables, self.hashes))
+
+    def getErrorBound(self):
+        """Get the error bound of the estimated counts (with probability 1 - e ^ -depth)
+        """
+        return math.e / self.width * self.total
+
+    def merge(self, other):
+        """Merge another sketch (of the same width and depth)
+        """
+        for table, otherTable in zip(self.tables, other.tables):
+            for i, count in enumerate(otherTable):
+                table[i] += count
+        self.total += other.total
+        return self
+
+class ApproximateCounter(object):
+    """The approximate counter of the n-gram keys
+    """
+    def __init__(self, nGram, capacity, countMin = None):
+        """Create a new ApproximateCounter
+        Args:
+            nGram(int): The max n
+            capacity(int): The capacity of the SpaceSaving of each n
+            countMin((int, int)): The (width, depth) of the CountMinSketch of each n, None to disable
+        """
+        self.nGram = nGram
+        self.capacity = capacity
+        self.countMin = countMin
+        self.sketches = {}      # n -> SpaceSaving
+        self.countMins = {}     # n -> CountMinSketch
+
+    def __len__(self):
+        """Get the number of the monitored n-grams
+        """
+        return sum(len(x) for x in self.sketches.itervalues())
+
+    def update(self, key, n, count = 1):
+        """Add the count of the n-gram key
+        """
+        sketch = self.sketches.get(n)
+        if sketch is None:
+            sketch = self.sketches[n] = SpaceSaving(self.capacity)
+            if self.countMin:
+                self.countMins[n] = CountMinSketch(*self.countMin)
+        sketch.update(key, count)
+        if self.countMin:
+            self.countMins[n].update(key, count)
+
+    def updateCounter(self, counter, getLength):
+        """Add the counts of the n-gram keys in the counter
+        Args:
+            counter(dict): The n-gram key to count
+            getLength(callable): Get the n of the n-gram key
+        """
+        for key, count in counter.iteritems():
+            self.update(key, getLength(key), count)
+
+    def add(self, ids):
+        """Add the term ids of a sequence (count all the n-grams in it)
+        """
+        update = self.update
+        for i in xrange(len(ids)):
+            key = 0
+            for n, termID in enumerate(ids[i: i + self.nGram], 1):
+                key = (key << IDBits) | (termID + 1)
+                update(key, n)
+
+    def getCounter(self):
+        """Get the counter (itself, in the same way as NGramCounter)
+        """
+        return self
+
+    def getNs(self):
+        """Get the counted n
+        """
+        return sorted(self.sketches)
+
+    def getItems(self, n):
+        """Get the monitored n-gram keys of n
+        Returns:
+            [ (key, count, error) ]: The keys, the (over estimated) counts and the max errors of the counts
+        """
+        items = self.sketches[n].items()
+        countMin = self.countMins.get(n)
+        if countMin:
+            tightened = []
+            for key, count, error in items:
+                estimate = countMin.estimate(key)
+                if estimate < count:
+                    # The lower bound of the count (count - error) is not changed
+                    error, count = error - (count - estimate), estimate
+                tightened.append((key, count, error))
+            items = tightened
+        return items
+
+    def merge(self, other):
+        """Merge another counter
+        """
+        for n, sketch in other.sketches.iteritems():
+            if n in self.sketches:
+                self.sketches[n].merge(sketch)
+            else:
+                self.sketches[n] = sketch
+        for n, countMin in other.countMins.iteritems():
+            if n in self.countMins:
+                self.countMins[n].merge(countMin)
+            else:
+                self.countMins[n] = countMin
+        return self
+
+    def mapKeys(self, func):
+        """Map the n-gram keys by func
+        NOTE:
+            The count-min sketches are hashed by the keys, so they cannot be mapped
+        """
+        if self.countMins:
+            raise ValueError("Cannot map the keys of the count-min sketches")
+        for sketch in self.sketches.itervalues():
+            sketch.mapItems(func)
+        return self
@@ -21,6 +21,10 @@ SheetProvince       = "province"
 SheetCity           = "city"
 SheetNews           = u"数字版"
 
+NewsColumnDate      = 2
+NewsColumnTitle     = 6
+NewsColumnContent   = 7
+
 KeyCountry          = u"国家"
 KeyRegion           = u"地区"
 KeyProvince         = u"省"
@@ -28,9 +32,53 @@ KeyCity             = u"城市"
 
 
 IDFDictFilename     = join(DataPath, "idf.dict")
+IDFTableFilename    = join(DataPath, "idf.table")
+IDFStatePath        = join(DataPath, "idfstate")
+IDFSpillSize        = 2000000           # The max number of distinct n-grams counted in memory before spilling
+
+CachePath           = join(DataPath, "cache")
+GazetteerCacheVersion = 1
+TokenCacheFilename  = join(CachePath, "tokens.sqlite")
+TokenCacheCapacity  = 100000
+
+TrendStoreFilename  = join(DataPath, "trend.sqlite")
+TrendPeriodDay      = "day"
+TrendPeriodWeek     = "week"            # The week starts on Monday
+TrendFrequencyBase  = 1000.0            # The frequencies of the trends are the counts per 1000 news
+TrendSortTFIDF      = "tfidf"
+TrendSortVelocity   = "velocity"
+TrendSortBurst      = "burst"
+
+WorkbookExtensions  = { ".xlsx", ".xlsm" }     # The workbooks in the input directories
+WorkbookLoaders     = 2                 # The default number of the processes loading the workbooks concurrently
+LoaderBatchSize     = 256               # The number of news sent by a loader process at once
+LoaderQueueSize     = 16                # The max number of batches of news pending in the queue of a loader process
+
+TextChunkSize       = 1 << 20           # The size of the chunks read from the text inputs
+TextFormatLines     = "lines"           # A line per title (or content)
+TextFormatJSONLines = "jsonl"           # A json object (of the title and content fields) per line
+
+DedupPermutations   = 128               # The length of the minhash signatures of the news
+DedupShingleSize    = 3                 # The number of words of a shingle
 
 MissingValueIDF     = math.log(100.0)   # p = 1/100
 
+IDFModeStatic       = "static"          # The static idf (of the idf table / dictionary)
+IDFModeCorpus       = "corpus"          # The idf of the analyzed news
+IDFModeBlend        = "blend"           # The weighted sum of the static and corpus idf
+IDFBlendWeight      = 0.5               # The default weight of the corpus idf
+
+OutputFormatCSV         = "csv"
+OutputFormatJSONLines   = "jsonl"
+OutputFormatParquet     = "parquet"
+OutputFormatArrow       = "arrow"
+OutputBatchSize         = 10000     # The number of rows written at once
+ResultTopTerms          = 200       # The default number of the top terms (entities) of each group in the results
+
+ProfileEngineCProfile       = "cprofile"
+ProfileEnginePyInstrument   = "pyinstrument"
+ProfileTopFunctions         = 30        # The number of the top functions of the hot stage in the profile report
+
 DropWords = {
     "'s"
 }
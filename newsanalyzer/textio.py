@@ -0,0 +1,207 @@
+# encoding=utf8
+
+""" The text input
+    Author: lipixun
+    Created Time : 日  2/13 06:07:33 2017
+
+    File Name: textio.py
+    Description:
+
+        The news of the text inputs are streamed: the files are read in chunks, split into lines and converted to the
+        news lazily, so the memory doesn't grow with the input size. An input is a filename, a glob pattern (of
+        multiple files, read in the order of the names) or "-" for stdin.
+
+        The compression is detected by the magic bytes, so stdin could be compressed as well:
+
+        * gzip:     By zlib (the concatenated gzip members as well)
+        * zstd:     By the zstandard module (requires zstandard)
+
+        The lines of a plain text input are the titles (or contents) of the news. The json lines inputs (of the .jsonl
+        or .json extension before the compression extension, or of the format specified) carry the title and content
+        fields of a news in each line.
+
+"""
+
+import io
+import os
+import sys
+import glob
+import zlib
+import logging
+
+from os.path import expanduser, splitext
+
+from .spec import TextChunkSize, TextFormatLines, TextFormatJSONLines
+from .utils import json, isModuleInstalled
+from .model import News
+
+GzipMagic   = "\x1f\x8b"
+ZstdMagic   = "\x28\xb5\x2f\xfd"
+
+# The extensions of the compressed files and json lines files
+CompressionExtensions   = { ".gz", ".gzip", ".zst", ".zstd" }
+JSONLinesExtensions     = { ".jsonl", ".json" }
+
+logger = logging.getLogger("newsanalyzer.textio")
+
+def expandInputs(inputs):
+    """Expand the glob patterns of the inputs
+    Args:
+        inputs([ str ]): The filenames, glob patterns or "-" for stdin
+    Returns:
+        [ str ]: The filenames (or "-")
+    """
+    filenames = []
+    for pattern in inputs:
+        if pattern == "-":
+            filenames.append(pattern)
+            continue
+        pattern = expanduser(pattern)
+        matched = sorted(x for x in glob.glob(pattern) if os.path.isfile(x))
+        if not matched:
+            logger.warn("No text input file matches [%s]", pattern)
+        filenames.extend(matched)
+    return filenames
+
+def getTextFormat(filename):
+    """Get the text format of the file by the extension
+    Returns:
+        str: The format, see spec.TextFormat*
+    """
+    if filename == "-":
+        return TextFormatLines
+    name, extension = splitext(filename.lower())
+    if extension in CompressionExtensions:
+        extension = splitext(name)[1]
+    return TextFormatJSONLines if extension in JSONLinesExtensions else TextFormatLines
+
+def openText(filename, chunkSize = TextChunkSize):
+    """Open the text file
+    Args:
+        filename(str): The filename, "-" for stdin
+        chunkSize(int): The buffer size
+    Returns:
+        file: The buffered binary file object
+    """
+    if filename == "-":
+        return io.open(sys.stdin.fileno(), "rb", buffering = chunkSize, closefd = False)
+    return io.open(filename, "rb", buffering = chunkSize)
+
+def iterGzipChunks(chunks):
+    """Iterate the decompressed chunks of the gzip compressed chunks (of one or more gzip members)
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = decompressor.unused_data
+            if chunk:
+                # The next member
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = decompressor.flush()
+    if data:
+        yield data
+
+def iterChunks(filename, chunkSize = TextChunkSize):
+    """Iterate the decompressed chunks of the (compressed) text file, the compression is detected by the magic bytes
+    Yield:
+        str: The chunk
+    """
+    fd = openText(filename, chunkSize)
+    try:
+        magic = fd.peek(len(ZstdMagic))[: len(ZstdMagic)]
+        chunks = iter(lambda: fd.read(chunkSize), "")
+        if magic.startswith(GzipMagic):
+            chunks = iterGzipChunks(chunks)
+        elif magic == ZstdMagic:
+            if not isModuleInstalled("zstandard"):
+                raise ValueError("The zstd compressed input [%s] requires zstandard, install by: pip install zstandard" % filename)
+            import zstandard    # Imported here since it's optional
+            reader = zstandard.ZstdDecompressor().stream_reader(fd)
+            chunks = iter(lambda: reader.read(chunkSize), "")
+        for chunk in chunks:
+            yield chunk
+    finally:
+        fd.close()
+
+def iterLines(filename, chunkSize = TextChunkSize):
+    """Iterate the lines of the (compressed) text file by reading the chunks
+    Yield:
+        unicode: The line (with the line break)
+    """
+    pending = ""
+    for chunk in iterChunks(filename, chunkSize):
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield (line + "\n").decode("utf8")
+    if pending:
+        yield pending.decode("utf8")
+
+class TextSource(object):
+    """The news of the text inputs
+    """
+    def __init__(self, inputs, field = None, textFormat = None, chunkSize = TextChunkSize):
+        """Create a new TextSource
+        Args:
+            inputs([ str ]): The filenames, glob patterns or "-" for stdin
+            field(str): The field (title or content) of the lines of the plain text inputs, and the only field read from
+                the json lines inputs. None to read both fields of the json lines inputs (plain text inputs not allowed)
+            textFormat(str): The text format, see spec.TextFormat*, None to detect by the extension
+            chunkSize(int): The size of the chunks to read
+        """
+        self.inputs = inputs
+        self.field = field
+        self.textFormat = textFormat
+        self.chunkSize = chunkSize
+        self.lines = 0
+
+    def __iter__(self):
+        """Iterate the news
+        """
+        return self.iterNews()
+
+    def iterNews(self):
+        """Iterate the news
+        Yield:
+            News: The news
+        """
+        for filename in expandInputs(self.inputs):
+            textFormat = self.textFormat or getTextFormat(filename)
+            logger.info("Load text input [%s] (%s)", filename, textFormat)
+            if textFormat == TextFormatJSONLines:
+                news = self.iterJSONLinesNews(filename)
+            elif self.field:
+                news = self.iterLinesNews(filename)
+            else:
+                raise ValueError("The text input [%s] is not json lines, the title and content cannot be got" % filename)
+            for item in news:
+                yield item
+        logger.info("Totally load [%d] lines from text input %s", self.lines, ", ".join(self.inputs))
+
+    def iterLinesNews(self, filename):
+        """Iterate the news of the lines
+        """
+        for line in iterLines(filename, self.chunkSize):
+            self.lines += 1
+            yield News(**{ self.field: line })
+
+    def iterJSONLinesNews(self, filename):
+        """Iterate the news of the json lines (the blank lines are skipped)
+        """
+        for number, line in enumerate(iterLines(filename, self.chunkSize), 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                raise ValueError("Invalid json at line [%d] of [%s]" % (number, filename))
+            if not isinstance(data, dict):
+                raise ValueError("Not a json object at line [%d] of [%s]" % (number, filename))
+            self.lines += 1
+            title = data.get("title") if self.field in (None, "title") else None
+            content = data.get("content") if self.field in (None, "content") else None
+            if title or content:
+                yield News(title, content)
@@ -0,0 +1,216 @@
+# encoding=utf8
+
+""" The token cache
+    Author: lipixun
+    Created Time : 日  2/12 20:48:19 2017
+
+    File Name: tokencache.py
+    Description:
+
+        The terms of the tokenized texts are cached by the hash of the text content (and the tokenizer name and the
+        stopwords), in a LRU bounded memory cache and optionally a sqlite store on disk. So the unchanged texts are
+        never tokenized again, neither in the same run nor (with the disk store) in the following runs.
+
+        The disk store is only written by the main process: in the forked worker processes (see parallel.mapReduce)
+        it's read only, the new entries and the stats of the workers are sent back with the results and merged into the
+        cache of the main process, so the workers never lock the store.
+
+"""
+
+import os
+import sqlite3
+import logging
+
+from hashlib import md5
+from collections import OrderedDict
+
+from .spec import TokenCacheCapacity
+from .tokenizer import Tokenizer
+from .parallel import addWorkerState, removeWorkerState
+
+# The number of the disk store entries written in a transaction
+CommitSize = 10000
+
+class TokenCache(object):
+    """The token cache
+    """
+    logger = logging.getLogger("newsanalyzer.TokenCache")
+
+    def __init__(self, capacity = TokenCacheCapacity, filename = None):
+        """Create a new TokenCache
+        Args:
+            capacity(int): The max number of texts cached in memory
+            filename(str): The sqlite filename of the disk store, None to disable
+        """
+        self.capacity = capacity
+        self.filename = filename
+        self.items = OrderedDict()
+        self.hits, self.diskHits, self.misses = 0, 0, 0
+        self.pendings = 0
+        self.newItems = []                  # The new entries of the disk store in the worker
+        self.conn, self.pid = None, os.getpid()
+        self.ownerPID = self.pid
+        if filename:
+            # Create the store before forking any worker
+            dirname = os.path.dirname(filename)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self.getConnection().execute("CREATE TABLE IF NOT EXISTS tokens (key BLOB PRIMARY KEY, terms TEXT)")
+        addWorkerState(self)
+
+    def checkProcess(self):
+        """Reset the stats, new entries and connection inherited by a forked worker (at the first call in it)
+        """
+        if self.pid != os.getpid():
+            self.hits, self.diskHits, self.misses = 0, 0, 0
+            self.pendings, self.newItems = 0, []
+            self.conn, self.pid = None, os.getpid()
+
+    def isWorker(self):
+        """Check if in a forked worker
+        """
+        return self.pid != self.ownerPID
+
+    def getConnection(self):
+        """Get the sqlite connection (for current process)
+        """
+        if not self.filename:
+            return
+        if not self.conn:
+            # Not shared with the forked processes
+            self.conn = sqlite3.connect(self.filename, timeout = 60)
+        return self.conn
+
+    def getKey(self, namespace, text):
+        """Get the cache key of the text
+        """
+        if isinstance(text, unicode):
+            text = text.encode("utf8")
+        return md5("%s\x00%s" % (namespace, text)).digest()
+
+    def get(self, key):
+        """Get the cached terms
+        Returns:
+            tuple: The terms, None if not cached
+        """
+        self.checkProcess()
+        terms = self.items.pop(key, None)
+        if terms is not None:
+            self.hits += 1
+            self.items[key] = terms
+            return terms
+        conn = self.getConnection()
+        if conn:
+            row = conn.execute("SELECT terms FROM tokens WHERE key = ?", (buffer(key), )).fetchone()
+            if row:
+                self.diskHits += 1
+                terms = tuple(row[0].split(" ")) if row[0] else ()
+                self.putMemory(key, terms)
+                return terms
+        self.misses += 1
+
+    def put(self, key, terms):
+        """Put the terms
+        """
+        self.checkProcess()
+        terms = tuple(terms)
+        self.putMemory(key, terms)
+        if self.filename:
+            if self.isWorker():
+                # Written by the main process
+                self.newItems.append((key, terms))
+            else:
+                self.putDisk(key, terms)
+        return terms
+
+    def putDisk(self, key, terms):
+        """Put the terms to the disk store (in the main process)
+        """
+        conn = self.getConnection()
+        conn.execute("INSERT OR REPLACE INTO tokens (key, terms) VALUES (?, ?)", (buffer(key), u" ".join(terms)))
+        self.pendings += 1
+        if self.pendings >= CommitSize:
+            conn.commit()
+            self.pendings = 0
+
+    def putMemory(self, key, terms):
+        """Put the terms to the memory cache
+        """
+        if self.capacity <= 0:
+            return
+        self.items[key] = terms
+        while len(self.items) > self.capacity:
+            self.items.popitem(last = False)
+
+    def popWorkerState(self):
+        """Get the stats and new entries since the last call in the worker (see parallel.addWorkerState)
+        Returns:
+            (int, int, int, list): The memory hits, disk hits, misses and the new entries, None if no lookups
+        """
+        self.checkProcess()
+        if not self.hits and not self.diskHits and not self.misses:
+            return None
+        state = (self.hits, self.diskHits, self.misses, self.newItems)
+        self.hits, self.diskHits, self.misses, self.newItems = 0, 0, 0, []
+        return state
+
+    def mergeWorkerState(self, state):
+        """Merge the stats and new entries of a worker (see parallel.addWorkerState)
+        """
+        hits, diskHits, misses, newItems = state
+        self.hits += hits
+        self.diskHits += diskHits
+        self.misses += misses
+        for key, terms in newItems:
+            self.putMemory(key, terms)
+            self.putDisk(key, terms)
+
+    def close(self):
+        """Close the cache (and log the stats)
+        """
+        total = self.hits + self.diskHits + self.misses
+        self.logger.info("Token cache stats: [%d] lookups, [%d] memory hits, [%d] disk hits, [%d] misses, hit rate [%.2f%%]",
+            total, self.hits, self.diskHits, self.misses, 100.0 * (self.hits + self.diskHits) / total if total else 0.0)
+        if self.conn and not self.isWorker():
+            self.conn.commit()
+            self.conn.close()
+        self.conn = None
+        removeWorkerState(self)
+
+class CachedTokenizer(Tokenizer):
+    """The tokenizer with the token cache
+    """
+    def __init__(self, tokenizer, cache):
+        """Create a new CachedTokenizer
+        """
+        self.name = tokenizer.name
+        self.tokenizer = tokenizer
+        self.cache = cache
+        self.namespaces = {}
+
+    def getNamespace(self, stopwords):
+        """Get the cache namespace of the tokenizer and the stopwords
+        """
+        cached = self.namespaces.get(id(stopwords))
+        if not cached or cached[0] is not stopwords:
+            namespace = "%s:%s" % (self.name, md5(u"\x00".join(sorted(stopwords)).encode("utf8")).hexdigest())
+            # Keep the reference of the stopwords, so its id won't be reused
+            cached = (stopwords, namespace)
+            self.namespaces[id(stopwords)] = cached
+        return cached[1]
+
+    def tokenize(self, text, stopwords):
+        """Tokenize the text
+        Returns:
+            tuple: The terms
+        """
+        key = self.cache.getKey(self.getNamespace(stopwords), text)
+        terms = self.cache.get(key)
+        if terms is None:
+            terms = self.cache.put(key, self.tokenizer.tokenize(text, stopwords))
+        return terms
+
+    def close(self):
+        """Close the tokenizer
+        """
+        self.cache.close()
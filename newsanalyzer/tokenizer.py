@@ -0,0 +1,149 @@
+# encoding=utf8
+
+""" The tokenizer
+    Author: lipixun
+    Created Time : 日  2/12 20:11:35 2017
+
+    File Name: tokenizer.py
+    Description:
+
+        The tokenizers convert text to a sequence of lower case terms without stopwords, drop words and punctuations.
+
+        * nltk:     The standard one by nltk.tokenize.word_tokenize (punkt sentence splitting and treebank regexes)
+        * regex:    A fast one by a single precompiled regex, which follows the treebank rules for the news text.
+                    The difference to the nltk one could be reported by compareTokenizers (check-tokenizer command),
+                    and is checked on the fixed texts by benchmarks/tokenizer.py (make check-tokenizer). The
+                    abbreviations are the ones of the punkt model. The sentence ends which punkt decides by the case
+                    of the next word (e.g. "in the U.S. He said", "in 2017. next") are not followed, since the regex
+                    runs on the lower case text
+
+"""
+
+import re
+
+from .spec import DropWords
+from .utils import nltk
+
+PunctuationRegex = re.compile(r"""^[\!\"\#\$\%\&\'\(\)\*\+\,\-\.\/\:\;\<\=\>\?\@\[\\\]\^\_\`\{\|\}\~]+$""")
+
+# The characters which are always split from a word by treebank
+WordChars = ur"""[^\s;@#$%&?!()\[\]{}<>"',:.“”‘’«»…]"""
+
+# The position where treebank has inserted a space before splitting the contractions (NOTE: not any whitespace)
+Separator = ur"""(?=[ ;@#$%&?!()\[\]{}<>"“”‘’«»…]|[,:](?!\d)|\.(?!\w)|--|$)"""
+
+# What follows the final period of the text, which is split by treebank unless it follows another period (NOTE: only
+# the end of the text, the other sentence ends found by punkt are not known here)
+FinalPeriod = ur"""[\s\])}>"']*$"""
+
+# Only the terms (group 1) are kept, the other matches (drop words) and unmatched characters (punctuations) are dropped.
+# The period after a word is split by treebank (as a sentence end found by punkt) unless the word is an abbreviation of
+# the punkt model, a single letter (an initial) or followed by another period
+TokenPattern = ur"""
+    (?<=\w)'s%(sep)s                                            # Drop word 's
+    |(
+        (?:[a-z]\.){2,}(?=-)%(word)s+                            # Acronym compound, e.g. u.s.-based
+        |%(word)s+(?:\.%(word)s+)*\.\.(?![.\w])                  # Word before a second period, e.g. u.s..
+        |(?<![\w.'])(?=\w+(?:\.\w+)*\.(?![\w.]))(?:%(abbr)s|[^\W\d_])\.(?![\w.])(?!%(final)s)
+                                                                # Abbreviation or initial, e.g. mr., u.s., j.
+        |\w+(?=n't%(sep)s)|(?<=\w)n't%(sep)s                     # Contraction, e.g. ca n't
+        |(?<=\w)'(?:m|d|ll|re|ve)%(sep)s                         # Contraction, e.g. i 'm
+        |\b(?:can(?=not\b)|gim(?=me\b)|gon(?=na\b)|got(?=ta\b)|lem(?=me\b)|wan(?=na\b))
+                                                                # Contraction, e.g. can not
+        |(?:(?<![\w'])'(?!(?!re|ve|ll|m|t|s|d)\w\b))?(?=%(word)s*?\w)%(word)s+(?:(?:\.|'(?!(?:s|m|d|ll|re|ve)%(sep)s)|(?<=\d)[,:](?=\d))%(word)s+)*
+                                                                # Word, e.g. well-known, o'neill, 1,000, 5.5, 'em (not 'n)
+        |[“”‘’«»…]                                              # Unicode punctuation (kept by treebank)
+    )
+    """
+
+# The token regex (see getTokenRegex)
+_tokenRegex = None
+
+def getAbbreviations():
+    """Get the abbreviations of the english punkt model (without the final period, e.g. mr, u.s)
+    Returns:
+        [ unicode ]: The abbreviations
+    """
+    punkt = nltk.data.load("tokenizers/punkt/english.pickle")
+    return [ x for x in punkt._params.abbrev_types if re.match(r"^\w+(?:\.\w+)*$", x, re.UNICODE) ]
+
+def getTokenRegex():
+    """Get the token regex (compiled at the first call, since the abbreviations are loaded from the punkt model)
+    """
+    global _tokenRegex
+    if _tokenRegex is None:
+        abbreviations = "|".join(re.escape(x) for x in sorted(getAbbreviations(), key = lambda x: (-len(x), x)))
+        _tokenRegex = re.compile(TokenPattern % { "word": WordChars, "sep": Separator, "final": FinalPeriod, "abbr": abbreviations },
+            re.UNICODE | re.VERBOSE)
+    return _tokenRegex
+
+class Tokenizer(object):
+    """The tokenizer
+    """
+    name = None
+
+    def tokenize(self, text, stopwords):
+        """Tokenize the text
+        Yield:
+            str: The term
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Close the tokenizer
+        """
+        pass
+
+class NLTKTokenizer(Tokenizer):
+    """The nltk tokenizer
+    """
+    name = "nltk"
+
+    def tokenize(self, text, stopwords):
+        """Tokenize the text
+        Yield:
+            str: The term
+        """
+        for word in nltk.tokenize.word_tokenize(text):
+            word = word.lower()
+            if word in stopwords or word in DropWords or PunctuationRegex.match(word):
+                continue
+            # Good
+            yield word
+
+class RegexTokenizer(Tokenizer):
+    """The regex tokenizer
+    """
+    name = "regex"
+
+    def tokenize(self, text, stopwords):
+        """Tokenize the text
+        Yield:
+            str: The term
+        """
+        for word in getTokenRegex().findall(text.lower()):
+            if word and not word in stopwords and not word in DropWords:
+                yield word
+
+Tokenizers = {
+    NLTKTokenizer.name: NLTKTokenizer,
+    RegexTokenizer.name: RegexTokenizer,
+}
+
+def getTokenizer(name):
+    """Get the tokenizer by name
+    """
+    if not name in Tokenizers:
+        raise ValueError("Unknown tokenizer [%s]" % name)
+    return Tokenizers[name]()
+
+def compareTokenizers(tokenizer, reference, texts, stopwords):
+    """Compare the tokenizer to the reference one
+    Yield:
+        (str, [ str ], [ str ]): The text, the terms and the reference terms of the texts which are tokenized differently
+    """
+    for text in texts:
+        terms = list(tokenizer.tokenize(text, stopwords))
+        referenceTerms = list(reference.tokenize(text, stopwords))
+        if terms != referenceTerms:
+            yield text, terms, referenceTerms
@@ -0,0 +1,232 @@
+# encoding=utf8
+
+""" The trend store
+    Author: lipixun
+    Created Time : 日  2/13 05:02:17 2017
+
+    File Name: trend.py
+    Description:
+
+        The n-gram counts of the news are aggregated by the publish date and kept in sqlite: the number of news of each
+        day, and the tf and df (the number of news containing it) of each n-gram of the titles and contents of each day.
+        The store is appended by each run and only the days not in it are ingested, so the past news are never read (or
+        tokenized) again. A day is ingested at once, so the news of a day are expected to be in the same input.
+
+        The trends are computed from the aggregates of the periods (days or weeks starting on Monday) only:
+
+        * tf-idf:   The tf in the window (the last periods) times the idf of the window, log(news / df)
+        * velocity: The change of the frequency (count per 1000 news) in the window to the previous window
+        * burst:    The z-score of the frequency in the window against the frequencies of the history periods before
+                    the window (the periods without news are skipped). The std is at least the frequency of a single
+                    occurrence in the window, so the rare terms don't burst by chance
+
+"""
+
+import os
+import math
+import sqlite3
+import logging
+
+from datetime import datetime, timedelta
+
+from .spec import TrendPeriodDay, TrendPeriodWeek, TrendFrequencyBase
+from .index import getStopwordsHash
+
+TrendStoreVersion = 1
+
+FieldTitle      = "title"
+FieldContent    = "content"
+
+def parseDay(day):
+    """Parse the day string (of the store) to date
+    """
+    return datetime.strptime(day, "%Y-%m-%d").date()
+
+def getPeriodStart(day, period):
+    """Get the first day of the period of the day
+    Args:
+        day(date): The day
+        period(str): The period, see spec.TrendPeriod*
+    Returns:
+        date: The first day
+    """
+    if period == TrendPeriodDay:
+        return day
+    elif period == TrendPeriodWeek:
+        return day - timedelta(days = day.weekday())
+    raise ValueError("Unknown trend period [%s]" % period)
+
+def getPeriodDays(period):
+    """Get the number of days of the period
+    """
+    return 7 if period == TrendPeriodWeek else 1
+
+class TrendStore(object):
+    """The trend store
+    """
+    logger = logging.getLogger("newsanalyzer.TrendStore")
+
+    def __init__(self, filename):
+        """Create a new TrendStore
+        Args:
+            filename(str): The sqlite filename
+        """
+        self.filename = filename
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS days (day TEXT PRIMARY KEY, news INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS counts (field TEXT, day TEXT, term TEXT, tf INTEGER, df INTEGER, PRIMARY KEY (field, day, term)) WITHOUT ROWID")
+
+    def getMeta(self, key):
+        """Get the meta value
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key, )).fetchone()
+        if row:
+            return row[0]
+
+    def check(self, nGram, tokenizer, stopwords):
+        """Check if the store is counted by the same nGram, tokenizer and stopwords (set them if the store is new)
+        """
+        meta = { "version": str(TrendStoreVersion), "ngram": str(nGram), "tokenizer": tokenizer.name, "stopwords": getStopwordsHash(stopwords) }
+        if self.getMeta("version") is None:
+            self.conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+            self.conn.commit()
+            return
+        for key, value in sorted(meta.iteritems()):
+            if self.getMeta(key) != value:
+                raise ValueError("The trend store [%s] is counted by %s [%s], not the same as [%s] (remove it to recount)" % (self.filename, key, self.getMeta(key), value))
+
+    def getDays(self):
+        """Get the ingested days
+        Returns:
+            set: The days (date)
+        """
+        return set(parseDay(day) for (day, ) in self.conn.execute("SELECT day FROM days"))
+
+    def getLastDay(self):
+        """Get the last ingested day
+        Returns:
+            date: The last day, None if the store is empty
+        """
+        row = self.conn.execute("SELECT MAX(day) FROM days").fetchone()
+        if row and row[0]:
+            return parseDay(row[0])
+
+    def putDay(self, day, news, counts):
+        """Put the counts of a day (replace the existing ones), not committed until commit is called
+        Args:
+            day(date): The day
+            news(int): The number of news
+            counts(dict): The field to the iterable of (term, tf, df)
+        """
+        day = day.isoformat()
+        self.conn.execute("DELETE FROM counts WHERE day = ?", (day, ))
+        self.conn.execute("INSERT OR REPLACE INTO days (day, news) VALUES (?, ?)", (day, news))
+        for field, rows in counts.iteritems():
+            self.conn.executemany("INSERT INTO counts (field, day, term, tf, df) VALUES (?, ?, ?, ?, ?)", ( (field, day, term, tf, df) for term, tf, df in rows ))
+
+    def commit(self):
+        """Commit the put days
+        """
+        self.conn.commit()
+
+    def getNews(self, start, end):
+        """Get the number of news of the days
+        Args:
+            start(date): The first day
+            end(date): The last day
+        Returns:
+            dict: The day to the number of news
+        """
+        return { parseDay(day): news for day, news in self.conn.execute("SELECT day, news FROM days WHERE day >= ? AND day <= ?", (start.isoformat(), end.isoformat())) }
+
+    def getCounts(self, field, start, end):
+        """Get the counts of the days
+        Returns:
+            dict: The term to (tf, df)
+        """
+        sql = "SELECT term, SUM(tf), SUM(df) FROM counts WHERE field = ? AND day >= ? AND day <= ? GROUP BY term"
+        return { term: (tf, df) for term, tf, df in self.conn.execute(sql, (field, start.isoformat(), end.isoformat())) }
+
+    def iterDayCounts(self, field, start, end):
+        """Iterate the tf of the terms of each day
+        Yield:
+            (date, unicode, int): The day, term and tf
+        """
+        sql = "SELECT day, term, tf FROM counts WHERE field = ? AND day >= ? AND day <= ?"
+        for day, term, tf in self.conn.execute(sql, (field, start.isoformat(), end.isoformat())):
+            yield parseDay(day), term, tf
+
+    def getTrends(self, field, period = TrendPeriodDay, window = 7, history = 28, until = None, minCount = 2):
+        """Get the trends of the terms in the window
+        Args:
+            field(str): The field, title or content
+            period(str): The period, see spec.TrendPeriod*
+            window(int): The number of periods of the window
+            history(int): The number of periods before the window to get the burst scores
+            until(date): The window ends at the period of the day, the last ingested day if not specified
+            minCount(int): The min tf of the terms in the window
+        Returns:
+            (date, date, int, [ tuple ]): The first and last day of the window, the number of news in the window, and
+            the (term, terms count, tf-idf, frequency, document frequency, velocity, burst) of the terms, the velocity
+            (burst) is None if there's no news in the previous window (history periods)
+        """
+        until = until or self.getLastDay()
+        if not until:
+            return None, None, 0, []
+        periodDays = getPeriodDays(period)
+        windowStart = getPeriodStart(until, period) - timedelta(days = (window - 1) * periodDays)
+        windowEnd = getPeriodStart(until, period) + timedelta(days = periodDays - 1)
+        previousStart = windowStart - timedelta(days = window * periodDays)
+        historyStart = windowStart - timedelta(days = history * periodDays)
+        beforeWindow = windowStart - timedelta(days = 1)
+        # The news
+        news = self.getNews(min(previousStart, historyStart), windowEnd)
+        windowNews = sum(v for k, v in news.iteritems() if k >= windowStart)
+        previousNews = sum(v for k, v in news.iteritems() if previousStart <= k < windowStart)
+        periodNews = {}
+        for day, count in news.iteritems():
+            if historyStart <= day < windowStart:
+                periodStart = getPeriodStart(day, period)
+                periodNews[periodStart] = periodNews.get(periodStart, 0) + count
+        self.logger.info("Get trends of [%s] to [%s] of [%d] news (%d news in the previous window)", windowStart, windowEnd, windowNews, previousNews)
+        if not windowNews:
+            return windowStart, windowEnd, 0, []
+        # The counts of the window, previous window and history periods
+        counts = { k: v for k, v in self.getCounts(field, windowStart, windowEnd).iteritems() if v[0] >= minCount }
+        previousTF = {}
+        if previousNews:
+            for term, (tf, _) in self.getCounts(field, previousStart, beforeWindow).iteritems():
+                if term in counts:
+                    previousTF[term] = tf
+        historyTF = {}
+        if periodNews:
+            for day, term, tf in self.iterDayCounts(field, historyStart, beforeWindow):
+                if term in counts:
+                    periods = historyTF.setdefault(term, {})
+                    periodStart = getPeriodStart(day, period)
+                    periods[periodStart] = periods.get(periodStart, 0) + tf
+        # Score
+        minStd = TrendFrequencyBase / windowNews
+        trends = []
+        for term, (tf, df) in counts.iteritems():
+            frequency = tf * TrendFrequencyBase / windowNews
+            tfidf = tf * math.log(float(windowNews) / df)
+            velocity = frequency - previousTF.get(term, 0) * TrendFrequencyBase / previousNews if previousNews else None
+            burst = None
+            if periodNews:
+                periods = historyTF.get(term, {})
+                frequencies = [ periods.get(k, 0) * TrendFrequencyBase / v for k, v in periodNews.iteritems() ]
+                mean = sum(frequencies) / len(frequencies)
+                std = math.sqrt(sum((x - mean) ** 2 for x in frequencies) / len(frequencies))
+                burst = (frequency - mean) / max(std, minStd)
+            trends.append((term, len(term.split(" ")), tfidf, tf, df, velocity, burst))
+        return windowStart, windowEnd, windowNews, trends
+
+    def close(self):
+        """Close the store
+        """
+        self.conn.close()
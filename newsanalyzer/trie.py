@@ -10,11 +10,26 @@
         For easy installation, I wrote a pure python version of trie-tree. This may cause a serious issue of performance but
         installing c version of trie-tree requires too many dependencies (python-dev, gcc, g++ ...).
 
+        The search is done by an aho-corasick automaton which is compiled from the tree (by adding failure links) on demand,
+        so all the matches in a sequence could be found in a single left-to-right pass.
+
+        A built tree could be frozen into a FrozenTrieTree, which stores the terms as vocabulary ids and the transitions,
+        failure links and attributes in flat arrays (CSR style). It's much more compact and faster to search, but it
+        cannot be modified any more.
+
 """
 
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+from .vocab import Vocabulary
+
 class TrieTreeNode(object):
     """The trie tree node
     """
+    __slots__ = ("term", "parent", "nodes", "attrs", "isLeaf", "depth", "fail", "output")
+
     def __init__(self, term, parent, nodes = None, attrs = None):
         """Create a new TrieTreeNode
         """
@@ -23,6 +38,10 @@ class TrieTreeNode(object):
         self.nodes = nodes or {}
         self.attrs = attrs or {}
         self.isLeaf = False
+        self.depth = parent.depth + 1 if parent else 0
+        # The aho-corasick links, built by TrieTree.compile
+        self.fail = None        # The node of the longest proper suffix in the tree
+        self.output = None      # The nearest leaf node along the failure links
 
     def add(self, terms, **attrs):
         """Add
@@ -88,20 +107,63 @@ class TrieTreeNode(object):
 class TrieTree(TrieTreeNode):
     """Tree tree
     """
+    __slots__ = ("compiled", )
+
     def __init__(self):
         """Create a new TrieTree
         """
         super(TrieTree, self).__init__(None, None)
+        self.compiled = False
+
+    def add(self, terms, **attrs):
+        """Add
+        """
+        self.compiled = False
+        super(TrieTree, self).add(terms, **attrs)
+
+    def compile(self):
+        """Compile the aho-corasick automaton by building the failure links (breadth first)
+        """
+        queue = deque()
+        for node in self.nodes.itervalues():
+            node.fail = self
+            node.output = None
+            queue.append(node)
+        while queue:
+            node = queue.popleft()
+            for term, child in node.nodes.iteritems():
+                fail = node.fail
+                while fail is not self and not term in fail.nodes:
+                    fail = fail.fail
+                child.fail = fail.nodes.get(term, self)
+                child.output = child.fail if child.fail.isLeaf else child.fail.output
+                queue.append(child)
+        self.compiled = True
 
     def search(self, terms):
         """Search in the terms (sequence)
         Yield:
             (Node, startIndex)
+        NOTE:
+            For each start index only the longest match is yielded (the same as longestPrefix)
         """
-        for i in xrange(0, len(terms)):
-            node = self.longestPrefix(terms, i)
+        if not self.compiled:
+            self.compile()
+        # The longest matched node of each start index. Since the matches are found in the order of end index, a later
+        # match of the same start index is always a longer one.
+        matches = [ None ] * len(terms)
+        state = self
+        for index, term in enumerate(terms):
+            while state is not self and not term in state.nodes:
+                state = state.fail
+            state = state.nodes.get(term, self)
+            node = state if state.isLeaf else state.output
+            while node:
+                matches[index - node.depth + 1] = node
+                node = node.output
+        for startIndex, node in enumerate(matches):
             if node:
-                yield (node, i)
+                yield (node, startIndex)
 
     def split(self, terms):
         """Split the terms
@@ -118,3 +180,269 @@ class TrieTree(TrieTreeNode):
             else:
                 yield ((terms[index], ), None)
                 index += 1
+
+    def freeze(self):
+        """Freeze the tree
+        Returns:
+            FrozenTrieTree: The frozen tree
+        """
+        if not self.compiled:
+            self.compile()
+        return FrozenTrieTree(self)
+
+class FrozenTrieTreeNode(object):
+    """The node (view) of the frozen trie tree
+    """
+    __slots__ = ("tree", "state")
+
+    def __init__(self, tree, state):
+        """Create a new FrozenTrieTreeNode
+        """
+        self.tree = tree
+        self.state = state
+
+    def __eq__(self, other):
+        """Check equal
+        """
+        return isinstance(other, FrozenTrieTreeNode) and self.tree is other.tree and self.state == other.state
+
+    def __ne__(self, other):
+        """Check not equal
+        """
+        return not self == other
+
+    def __hash__(self):
+        """Get the hash
+        """
+        return hash((id(self.tree), self.state))
+
+    @property
+    def term(self):
+        """Get the term
+        """
+        termID = self.tree.stateTerms[self.state]
+        if termID >= 0:
+            return self.tree.vocabulary.getTerm(termID)
+
+    @property
+    def parent(self):
+        """Get the parent node
+        """
+        parent = self.tree.parents[self.state]
+        if parent >= 0:
+            return FrozenTrieTreeNode(self.tree, parent)
+
+    @property
+    def depth(self):
+        """Get the depth
+        """
+        return self.tree.depths[self.state]
+
+    @property
+    def isLeaf(self):
+        """Check if it's a leaf node
+        """
+        return self.tree.payloads[self.state] >= 0
+
+    @property
+    def attrs(self):
+        """Get the attributes
+        """
+        payload = self.tree.payloads[self.state]
+        return self.tree.attrTable[payload] if payload >= 0 else {}
+
+    def getPath(self):
+        """Get the term path
+        Returns:
+            [ str ]: The terms
+        """
+        return self.tree.getPath(self.state)
+
+class FrozenTrieTree(object):
+    """The frozen trie tree
+
+    The states are numbered in breadth first order (the root is 0). The children of state s are stored in
+    childTerms / childStates [ childOffsets[s]: childOffsets[s + 1] ] sorted by term id.
+    """
+    def __init__(self, tree):
+        """Create a new FrozenTrieTree from a compiled TrieTree
+        """
+        self.vocabulary = Vocabulary()
+        # Number the states
+        nodes, states = [ tree ], { id(tree): 0 }
+        for node in nodes:
+            for term, child in node.nodes.iteritems():
+                self.vocabulary.add(term)
+                states[id(child)] = len(nodes)
+                nodes.append(child)
+        # Build the arrays
+        self.childOffsets = array("l", [ 0 ])
+        self.childTerms, self.childStates = array("l"), array("l")
+        self.stateTerms, self.parents, self.depths = array("l"), array("l"), array("l")
+        self.fails, self.outputs, self.payloads = array("l"), array("l"), array("l")
+        self.attrTable = []
+        for node in nodes:
+            for termID, child in sorted(( self.vocabulary.get(t), c ) for t, c in node.nodes.iteritems()):
+                self.childTerms.append(termID)
+                self.childStates.append(states[id(child)])
+            self.childOffsets.append(len(self.childTerms))
+            self.stateTerms.append(self.vocabulary.get(node.term, -1) if node.parent else -1)
+            self.parents.append(states[id(node.parent)] if node.parent else -1)
+            self.depths.append(node.depth)
+            self.fails.append(states[id(node.fail)] if node.fail else 0)
+            self.outputs.append(states[id(node.output)] if node.output else -1)
+            if node.isLeaf:
+                self.payloads.append(len(self.attrTable))
+                self.attrTable.append(node.attrs)
+            else:
+                self.payloads.append(-1)
+
+    def __len__(self):
+        """Get the number of states
+        """
+        return len(self.depths)
+
+    def add(self, terms, **attrs):
+        """Add
+        """
+        raise ValueError("Cannot add terms to a frozen trie tree")
+
+    def child(self, state, termID):
+        """Get the child state of the term id
+        Returns:
+            int: The child state, -1 if not found
+        """
+        lo, hi = self.childOffsets[state], self.childOffsets[state + 1]
+        index = bisect_left(self.childTerms, termID, lo, hi)
+        if index < hi and self.childTerms[index] == termID:
+            return self.childStates[index]
+        return -1
+
+    def getPath(self, state):
+        """Get the term path of the state
+        Returns:
+            [ str ]: The terms
+        """
+        terms = []
+        while state > 0:
+            terms.append(self.vocabulary.getTerm(self.stateTerms[state]))
+            state = self.parents[state]
+        return reversed(terms)
+
+    def longestPrefix(self, terms, startIndex):
+        """Search for longest prefix
+        Returns:
+            FrozenTrieTreeNode: The matched node
+        """
+        state, matched = 0, -1
+        for index in xrange(startIndex, len(terms)):
+            termID = self.vocabulary.get(terms[index])
+            if termID is None:
+                break
+            state = self.child(state, termID)
+            if state < 0:
+                break
+            if self.payloads[state] >= 0:
+                matched = state
+        if matched >= 0:
+            return FrozenTrieTreeNode(self, matched)
+
+    def search(self, terms):
+        """Search in the terms (sequence)
+        Yield:
+            (Node, startIndex)
+        NOTE:
+            For each start index only the longest match is yielded (the same as longestPrefix)
+        """
+        matches = [ -1 ] * len(terms)
+        state = 0
+        for index, term in enumerate(terms):
+            termID = self.vocabulary.get(term)
+            if termID is None:
+                # Not a term in the tree at all
+                state = 0
+                continue
+            while True:
+                nextState = self.child(state, termID)
+                if nextState >= 0 or state == 0:
+                    break
+                state = self.fails[state]
+            state = nextState if nextState >= 0 else 0
+            matched = state if self.payloads[state] >= 0 else self.outputs[state]
+            while matched >= 0:
+                matches[index - self.depths[matched] + 1] = matched
+                matched = self.outputs[matched]
+        for startIndex, matched in enumerate(matches):
+            if matched >= 0:
+                yield (FrozenTrieTreeNode(self, matched), startIndex)
+
+    def split(self, terms):
+        """Split the terms
+        Yield:
+            (words, attrs)
+        """
+        index = 0
+        while index < len(terms):
+            node = self.longestPrefix(terms, index)
+            if node:
+                yield (tuple(node.getPath()), node.attrs)
+                index += node.depth
+            else:
+                yield ((terms[index], ), None)
+                index += 1
+
+class MergedTrieTreeNode(object):
+    """The merged node of the same path in multiple trees
+    """
+    __slots__ = ("nodes", "attrs")
+
+    def __init__(self, nodes):
+        """Create a new MergedTrieTreeNode
+        """
+        self.nodes = nodes
+        self.attrs = {}
+        for node in nodes:
+            for key, value in node.attrs.iteritems():
+                if key in self.attrs:
+                    raise ValueError("Conflicted key found: %s", key)
+                self.attrs[key] = value
+
+    @property
+    def term(self):
+        """Get the term
+        """
+        return self.nodes[0].term
+
+    @property
+    def depth(self):
+        """Get the depth
+        """
+        return self.nodes[0].depth
+
+    @property
+    def isLeaf(self):
+        """Check if it's a leaf node
+        """
+        return True
+
+    def getPath(self):
+        """Get the term path
+        """
+        return self.nodes[0].getPath()
+
+def searchAll(terms, *trees):
+    """Search in the terms (sequence) by multiple trees, the same as searching by a tree merged from all the trees
+    Yield:
+        (Node, startIndex)
+    """
+    matches = [ None ] * len(terms)
+    for tree in trees:
+        for node, startIndex in tree.search(terms):
+            matched = matches[startIndex]
+            if not matched or matched[0].depth < node.depth:
+                matches[startIndex] = [ node ]
+            elif matched[0].depth == node.depth:
+                matched.append(node)
+    for startIndex, matched in enumerate(matches):
+        if matched:
+            yield (matched[0] if len(matched) == 1 else MergedTrieTreeNode(matched), startIndex)
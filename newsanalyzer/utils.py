@@ -17,6 +17,50 @@ try:
 except ImportError:
     import json
 
-# NLTK
-import nltk
-nltk.data.path = [ DataPath ]
+from imp import find_module
+from importlib import import_module
+
+class LazyModule(object):
+    """The module imported on the first attribute access
+    """
+    def __init__(self, name, setup = None):
+        """Create a new LazyModule
+        Args:
+            name(str): The module name
+            setup(callable): Called with the module after importing
+        """
+        self._name = name
+        self._setup = setup
+        self._module = None
+
+    def load(self):
+        """Load the module
+        """
+        if self._module is None:
+            module = import_module(self._name)
+            if self._setup:
+                self._setup(module)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, name):
+        """Get the attribute of the module
+        """
+        return getattr(self.load(), name)
+
+def isModuleInstalled(name):
+    """Check if the (top level) module is installed without importing it
+    """
+    try:
+        find_module(name)
+    except ImportError:
+        return False
+    return True
+
+def setupNLTK(module):
+    """Setup nltk
+    """
+    module.data.path = [ DataPath ]
+
+# NLTK (imported when used, it takes seconds)
+nltk = LazyModule("nltk", setupNLTK)
@@ -0,0 +1,154 @@
+# encoding=utf8
+
+""" The vocabulary
+    Author: lipixun
+    Created Time : 日  2/12 17:35:12 2017
+
+    File Name: vocab.py
+    Description:
+
+        The vocabulary interns the terms (words) to continuous integer ids, so the data structures could be stored in
+        flat integer arrays instead of python objects.
+
+        The n-gram codec packs the term ids of an n-gram into a single integer key (mixed radix, IDBits bits per term),
+        so the n-grams are counted by integers instead of tuples of strings. Each id is stored as id + 1, so the
+        number of terms could be got from the key itself.
+
+        The keys of the same number of terms could be ordered by their terms without decoding, by the orders which pack
+        the ranks of the terms (in the sorted vocabulary) the same way (see NGramCodec.getOrder).
+
+"""
+
+IDBits      = 24
+IDMask      = (1 << IDBits) - 1
+MaxTerms    = IDMask    # The id + 1 must fit in IDBits bits
+
+class Vocabulary(object):
+    """The vocabulary
+    """
+    def __init__(self, terms = None):
+        """Create a new Vocabulary
+        """
+        self.ids = {}
+        self.terms = []
+        for term in terms or []:
+            self.add(term)
+
+    def __len__(self):
+        """Get the size of the vocabulary
+        """
+        return len(self.terms)
+
+    def __contains__(self, term):
+        """Check if the term is in the vocabulary
+        """
+        return term in self.ids
+
+    def add(self, term):
+        """Add a term
+        Returns:
+            int: The term id
+        """
+        termID = self.ids.get(term)
+        if termID is None:
+            termID = len(self.terms)
+            if termID >= MaxTerms:
+                raise ValueError("Too many terms in vocabulary (max %d)" % MaxTerms)
+            self.ids[term] = termID
+            self.terms.append(term)
+        return termID
+
+    def get(self, term, default = None):
+        """Get the id of the term
+        """
+        return self.ids.get(term, default)
+
+    def getTerm(self, termID):
+        """Get the term of the id
+        """
+        return self.terms[termID]
+
+class NGramCodec(object):
+    """The n-gram codec
+    """
+    def __init__(self, vocabulary):
+        """Create a new NGramCodec
+        """
+        self.vocabulary = vocabulary
+        self.ranks = []
+
+    def encode(self, ids):
+        """Encode the term ids
+        Returns:
+            int: The key
+        """
+        key = 0
+        for termID in ids:
+            key = (key << IDBits) | (termID + 1)
+        return key
+
+    def encodeTerms(self, terms):
+        """Encode the terms (a term or a tuple of terms)
+        Returns:
+            int: The key, None if any term is not in the vocabulary
+        """
+        if not isinstance(terms, tuple):
+            terms = (terms, )
+        ids = []
+        for term in terms:
+            termID = self.vocabulary.get(term)
+            if termID is None:
+                return
+            ids.append(termID)
+        return self.encode(ids)
+
+    def getLength(self, key):
+        """Get the number of terms of the key
+        """
+        return (key.bit_length() + IDBits - 1) // IDBits
+
+    def getIDs(self, key):
+        """Get the term ids of the key
+        Returns:
+            tuple: The ids
+        """
+        ids = []
+        while key:
+            ids.append((key & IDMask) - 1)
+            key >>= IDBits
+        ids.reverse()
+        return tuple(ids)
+
+    def decode(self, key):
+        """Decode the key
+        Returns:
+            str / tuple: The term for unigram, otherwise the tuple of terms
+        """
+        terms = tuple(self.vocabulary.getTerm(x) for x in self.getIDs(key))
+        return terms[0] if len(terms) == 1 else terms
+
+    def getOrder(self, key):
+        """Get the order of the key, which is ordered as the decoded terms among the keys of the same number of terms
+        Returns:
+            int: The order
+        """
+        ranks = self.ranks
+        if len(ranks) != len(self.vocabulary.terms):
+            ranks = self.updateRanks()
+        order, shift = 0, 0
+        while key:
+            order |= ranks[(key & IDMask) - 1] << shift
+            key >>= IDBits
+            shift += IDBits
+        return order
+
+    def updateRanks(self):
+        """Update the ranks (plus 1, as the ids in the keys) of the term ids in the sorted terms
+        Returns:
+            list: The ranks by the term ids
+        """
+        terms = self.vocabulary.terms
+        self.ranks = [ 0 ] * len(terms)
+        for rank, termID in enumerate(sorted(xrange(len(terms)), key = terms.__getitem__)):
+            self.ranks[termID] = rank + 1
+        return self.ranks